@@ -0,0 +1,37 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from apps.analytics.tasks import build_sales_rollups
+from apps.sales.models import ArchivedOrder, Order
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily sales rollups from the live and archived orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=datetime.date.fromisoformat, help="first delivery date (YYYY-MM-DD)")
+        parser.add_argument('--end', type=datetime.date.fromisoformat, help="last delivery date (YYYY-MM-DD)")
+        parser.add_argument('--days', type=int, default=31, help="delivery dates rebuilt per transaction")
+
+    def handle(self, *args, **options):
+        bounds = [
+            qs.aggregate(start=Min('delivery_date'), end=Max('delivery_date'))
+            for qs in [Order.objects.all(), ArchivedOrder.objects.all()]
+        ]
+        start = options['start'] or min(filter(None, [b['start'] for b in bounds]), default=None)
+        end = options['end'] or max(filter(None, [b['end'] for b in bounds]), default=None)
+        if not start or not end:
+            self.stdout.write("No orders to roll up.")
+            return
+        if start > end:
+            raise CommandError("--start must not be after --end.")
+        if options['days'] < 1:
+            raise CommandError("--days must be at least 1.")
+        while start <= end:
+            batch_end = min(start + datetime.timedelta(days=options['days'] - 1), end)
+            build_sales_rollups(start, batch_end)
+            self.stdout.write(f"Rolled up {start} - {batch_end}")
+            start = batch_end + datetime.timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS("Sales rollups rebuilt."))
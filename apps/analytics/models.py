@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.db import models
+
+
+class DailyCompanySales(models.Model):
+    """
+        orders of a company for a delivery date, maintained by the rollup task
+    """
+    date = models.DateField()
+    company = models.ForeignKey(
+        to='users.Company', on_delete=models.CASCADE, related_name='daily_sales'
+    )
+    order_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)  # sum of order final prices
+    paid_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    due_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)  # sum of positive order dues
+    updated_on = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = f"{settings.DB_PREFIX}_daily_company_sales"  # define table name for database
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'company'], name='daily_company_sales_unique'),
+        ]
+
+
+class DailyVendorSales(models.Model):
+    """
+        ordered carts of a vendor for a delivery date, maintained by the rollup task
+    """
+    date = models.DateField()
+    vendor = models.ForeignKey(
+        to='users.Vendor', on_delete=models.CASCADE, related_name='daily_sales'
+    )
+    order_count = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)  # sum of cart prices with tax
+    updated_on = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = f"{settings.DB_PREFIX}_daily_vendor_sales"  # define table name for database
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'vendor'], name='daily_vendor_sales_unique'),
+        ]
+
+
+class DailyProductSales(models.Model):
+    """
+        ordered carts of a product per company for a delivery date, maintained by the rollup task
+    """
+    date = models.DateField()
+    product = models.ForeignKey(
+        to='scm.Product', on_delete=models.CASCADE, related_name='daily_sales'
+    )
+    vendor = models.ForeignKey(
+        to='users.Vendor', on_delete=models.SET_NULL, related_name='daily_product_sales', blank=True, null=True
+    )
+    company = models.ForeignKey(
+        to='users.Company', on_delete=models.CASCADE, related_name='daily_product_sales'
+    )
+    order_count = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)  # sum of cart prices with tax
+    updated_on = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = f"{settings.DB_PREFIX}_daily_product_sales"  # define table name for database
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product', 'company'], name='daily_product_sales_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['vendor', 'date'], name='daily_product_vendor_idx'),
+        ]
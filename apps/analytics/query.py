@@ -1,18 +1,31 @@
 import datetime
 
 import graphene
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.db import models
-from django.db.models import F, Sum
+from django.db.models import Q, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
 from django.utils import timezone
 from graphene.types.generic import GenericScalar
 
-from apps.bases.utils import get_serialized_data, raise_graphql_error
+from apps.analytics.models import (
+    DailyCompanySales,
+    DailyProductSales,
+    DailyVendorSales,
+)
+from apps.analytics.tasks import refresh_vendor_dashboard
+from apps.analytics.utils import get_vendor_dashboard_version
+from apps.bases.utils import (
+    get_or_set_cache,
+    get_serialized_data,
+    raise_graphql_error,
+)
 from apps.sales.models import Order, ProductRating, SellCart
-from apps.scm.models import Product
 from apps.users.choices import RoleTypeChoices
 from apps.users.models import Company
-from backend.permissions import is_admin_user, is_vendor_user
+from backend.permissions import is_admin_user, is_authenticated, is_vendor_user
 
 User = get_user_model()
 
@@ -32,25 +45,112 @@ DATE_RANGE = {
 }
 
 
+class SalesHistoryBucketChoices(models.TextChoices):
+    DAY = 'day'
+    WEEK = 'week'
+    MONTH = 'month'
+
+
+BUCKET_TRUNC = {
+    SalesHistoryBucketChoices.DAY: TruncDay,
+    SalesHistoryBucketChoices.WEEK: TruncWeek,
+    SalesHistoryBucketChoices.MONTH: TruncMonth,
+}
+
+
+def get_bucket_count(start, end, bucket):
+    """
+        number of buckets between start and end, without building them
+    """
+    if bucket == SalesHistoryBucketChoices.MONTH:
+        return (end.year - start.year) * 12 + end.month - start.month + 1
+    if bucket == SalesHistoryBucketChoices.WEEK:
+        return (end - (start - datetime.timedelta(days=start.weekday()))).days // 7 + 1
+    return (end - start).days + 1
+
+
+def get_bucket_starts(start, end, bucket):
+    """
+        first date of every bucket between start and end
+    """
+    if bucket == SalesHistoryBucketChoices.WEEK:
+        start = start - datetime.timedelta(days=start.weekday())
+    elif bucket == SalesHistoryBucketChoices.MONTH:
+        start = start.replace(day=1)
+    dates = []
+    while start <= end:
+        dates.append(start)
+        if bucket == SalesHistoryBucketChoices.MONTH:
+            start = (start + datetime.timedelta(days=32)).replace(day=1)
+        else:
+            start += datetime.timedelta(days=7 if bucket == SalesHistoryBucketChoices.WEEK else 1)
+    return dates
+
+
+def get_sales_history(rows, start, end, bucket):
+    """
+        revenue and order count of the rollup rows per bucket, with one grouped query.
+        buckets without sales are filled with zero.
+    """
+    totals = {
+        row['bucket']: row for row in rows.filter(date__range=[start, end]).annotate(
+            bucket=BUCKET_TRUNC[bucket]('date', output_field=models.DateField())
+        ).values('bucket').annotate(revenue=Sum('revenue'), orders=Sum('order_count')).order_by('bucket')
+    }
+    series = []
+    for date in get_bucket_starts(start, end, bucket):
+        total = totals.get(date, {})
+        series.append({
+            'date': str(date),
+            'revenue': str(total.get('revenue') or '0.00'),
+            'orders': total.get('orders') or 0,
+        })
+    return {'bucket': bucket, 'start': str(start), 'end': str(end), 'series': series}
+
+
+def get_top_products(date_range="", limit=None, vendor=None):
+    """
+        best selling products by ordered amount within the date range, with one grouped query on the rollups
+    """
+    rows = DailyProductSales.objects.filter(product__is_deleted=False)
+    if date_range:
+        rows = rows.filter(date__gte=timezone.now().date() - datetime.timedelta(days=DATE_RANGE[date_range]))
+    if vendor:
+        rows = rows.filter(vendor=vendor)
+    products = rows.values('product_id', 'product__name').annotate(
+        sold_amount=Sum('revenue')
+    ).order_by('-sold_amount', 'product_id')[:limit or settings.DASHBOARD_TOP_PRODUCTS]
+    return [
+        {'id': product['product_id'], 'name': product['product__name'], 'soldAmount': str(product['sold_amount'])}
+        for product in products
+    ]
+
+
 class AdminDashboard:
 
-    def __init__(self, date_range=""):
+    def __init__(self, date_range="", top_products=None):
         if date_range and date_range not in QueryDateRangeChoices:
             raise_graphql_error("Please select a valid choice.", field_name="dateRange")
+        if top_products is not None and top_products < 1:
+            raise_graphql_error("Ensure this value is greater than or equal to 1.", field_name="topProducts")
         self.date_range = date_range
+        self.top_products = top_products or settings.DASHBOARD_TOP_PRODUCTS
 
     def get_data(self):
+        return get_or_set_cache(
+            f"admin-dashboard:{self.date_range or 'all'}:{self.top_products}", self.get_context,
+            settings.DASHBOARD_CACHE_TTL
+        )
+
+    def get_context(self):
+        totals = self.get_totals()
         context = {
             'totalCustomers': Company.objects.count(),
-            'totalOrders': Order.objects.count(),
-            'totalSales': str(Order.objects.aggregate(tot=Sum('final_price'))['tot'] or '0.00'),
-            'totalDue': str(
-                (Order.objects.aggregate(tot=Sum('final_price'))['tot'] or 0) - (Order.objects.aggregate(
-                    paid=Sum('paid_amount'))['paid'] or 0)
-            ),
-            'salesToday': str(Order.objects.filter(
-                created_on__date=timezone.now().date()
-            ).aggregate(tot=Sum('final_price'))['tot'] or '0.00'),
+            'totalOrders': totals['total_orders'] or 0,
+            'totalSales': str(totals['total_sales'] or '0.00'),
+            'totalDue': str((totals['total_sales'] or 0) - (totals['total_paid'] or 0)),
+            'salesToday': str(self.get_sales_today() or '0.00'),
+            'revenueDeliveredToday': str(totals['delivered_today'] or '0.00'),
             'recentCustomers': self.get_recent_customers(),
             'recentOrders': self.get_recent_orders(),
             'users': self.get_users(),
@@ -59,6 +159,23 @@ class AdminDashboard:
         }
         return context
 
+    def get_totals(self):
+        """
+            all order figures of the dashboard with a single conditional aggregation on the rollups
+        """
+        return DailyCompanySales.objects.aggregate(
+            total_orders=Sum('order_count'),
+            total_sales=Sum('revenue'),
+            total_paid=Sum('paid_amount'),
+            delivered_today=Sum('revenue', filter=Q(date=timezone.now().date())),
+        )
+
+    def get_sales_today(self):
+        """
+            amount of the orders placed today, the rollups are keyed by delivery date
+        """
+        return Order.objects.filter(created_on__date=timezone.now().date()).aggregate(tot=Sum('final_price'))['tot']
+
     def get_recent_customers(self):
         return get_serialized_data(
             Company.objects.order_by('-created_on')[:4], fields=['name', 'email', 'contact', 'logo_url']
@@ -88,50 +205,58 @@ class AdminDashboard:
         )
 
     def get_sold_products(self):
-        if self.date_range:
-            date = timezone.now().date() - datetime.timedelta(days=DATE_RANGE[self.date_range])
-            carts = SellCart.objects.filter(date__gte=date, order__isnull=False)
-        else:
-            carts = SellCart.objects.filter(order__isnull=False)
-        products = list(carts.filter(item__is_deleted=False).order_by('item').values_list('item_id', flat=True).distinct())
-        sold_products = []
-        for product_id in products:
-            product = Product.objects.filter(id=product_id).last()
-            if product:
-                sold_products.append({
-                    'id': product_id,
-                    'name': product.name,
-                    'soldAmount': carts.filter(item=product).aggregate(tot=Sum('total_price_with_tax'))['tot']
-                })
-        sold_products = sorted(sold_products, key=lambda d: d['soldAmount'], reverse=True)[:5]
-        return list(map(lambda i: {
-            'id': i['id'],
-            'name': i['name'],
-            'soldAmount': str(i['soldAmount'])
-        }, sold_products))
-
-    def get_sales_history(self):
-        pass
+        return get_top_products(self.date_range, self.top_products)
+
+    def get_sales_history(self, start, end, bucket=SalesHistoryBucketChoices.DAY):
+        return get_sales_history(DailyCompanySales.objects.all(), start, end, bucket)
 
 
 class VendorDashboard:
 
-    def __init__(self, vendor, date_range=""):
+    def __init__(self, vendor, date_range="", top_products=None):
         if date_range and date_range not in QueryDateRangeChoices:
             raise_graphql_error("Please select a valid choice.", field_name="dateRange")
+        if top_products is not None and top_products < 1:
+            raise_graphql_error("Ensure this value is greater than or equal to 1.", field_name="topProducts")
         self.date_range = date_range
         self.vendor = vendor
+        self.top_products = top_products or settings.DASHBOARD_TOP_PRODUCTS
+        # today's figures and the date range windows move with the date, so every day has its own entry
+        self.cache_key = (
+            f"vendor-dashboard:{vendor.id}:{timezone.now().date()}:{date_range or 'all'}:{self.top_products}"
+        )
 
     def get_data(self):
+        """
+            cached dashboard of the vendor. an entry expired by a vendor event is still returned
+            while a single worker recomputes it, a missing entry is computed by a single caller.
+        """
+        entry = cache.get(self.cache_key)
+        if entry is None:
+            return get_or_set_cache(self.cache_key, self.refresh, settings.VENDOR_DASHBOARD_CACHE_TTL)['data']
+        if entry['version'] != get_vendor_dashboard_version(self.vendor.id):
+            if cache.add(f"{self.cache_key}:refresh", 1, settings.CACHE_LOCK_TIMEOUT):
+                refresh_vendor_dashboard.delay(self.vendor.id, self.date_range, self.top_products)
+        return entry['data']
+
+    def refresh(self):
+        # the version is read first so an event during the computation leaves the entry stale
+        entry = {'version': get_vendor_dashboard_version(self.vendor.id)}
+        entry['data'] = self.get_context()
+        cache.set(self.cache_key, entry, settings.VENDOR_DASHBOARD_CACHE_TTL)
+        return entry
+
+    def get_context(self):
+        totals = DailyVendorSales.objects.filter(vendor=self.vendor).aggregate(
+            total_orders=Sum('order_count'),
+            total_sales=Sum('revenue'),
+            delivered_today=Sum('revenue', filter=Q(date=timezone.now().date())),
+        )
         context = {
-            'totalOrders': SellCart.objects.filter(
-                item__vendor=self.vendor
-            ).order_by('order').values_list('order', flat=True).distinct().count(),
-            'totalSales': str(SellCart.objects.filter(
-                item__vendor=self.vendor).aggregate(tot=Sum('total_price_with_tax'))['tot'] or '0.00'),
-            'salesToday': str(SellCart.objects.filter(
-                created_on__date=timezone.now().date(), item__vendor=self.vendor
-            ).aggregate(tot=Sum('total_price_with_tax'))['tot'] or '0.00'),
+            'totalOrders': totals['total_orders'] or 0,
+            'totalSales': str(totals['total_sales'] or '0.00'),
+            'salesToday': str(self.get_sales_today() or '0.00'),
+            'revenueDeliveredToday': str(totals['delivered_today'] or '0.00'),
             'recentSales': self.get_recent_orders(),
             'recentReviews': self.get_recent_ratings(),
             'soldProducts': self.get_sold_products(),
@@ -139,27 +264,15 @@ class VendorDashboard:
         return context
 
     def get_sold_products(self):
-        if self.date_range:
-            date = timezone.now().date() - datetime.timedelta(days=DATE_RANGE[self.date_range])
-            carts = SellCart.objects.filter(date__gte=date, order__isnull=False, item__vendor=self.vendor)
-        else:
-            carts = SellCart.objects.filter(order__isnull=False, item__vendor=self.vendor)
-        products = list(carts.filter(item__is_deleted=False).order_by('item').values_list('item_id', flat=True).distinct())
-        sold_products = []
-        for product_id in products:
-            product = Product.objects.filter(id=product_id).last()
-            if product:
-                sold_products.append({
-                    'id': product_id,
-                    'name': product.name,
-                    'soldAmount': carts.filter(item=product).aggregate(tot=Sum('total_price_with_tax'))['tot']
-                })
-        sold_products = sorted(sold_products, key=lambda d: d['soldAmount'], reverse=True)[:5]
-        return list(map(lambda i: {
-            'id': i['id'],
-            'name': i['name'],
-            'soldAmount': str(i['soldAmount'])
-        }, sold_products))
+        return get_top_products(self.date_range, self.top_products, vendor=self.vendor)
+
+    def get_sales_today(self):
+        """
+            amount of the vendor carts placed today, the rollups are keyed by delivery date
+        """
+        return SellCart.objects.filter(
+            created_on__date=timezone.now().date(), item__vendor=self.vendor
+        ).aggregate(tot=Sum('total_price_with_tax'))['tot']
 
     def get_recent_orders(self):
         return get_serialized_data(
@@ -184,41 +297,85 @@ class Query(graphene.ObjectType):
         define all queries together
     """
     admin_dashboard = graphene.Field(
-        AnalyticsType, date_range=graphene.String()
+        AnalyticsType, date_range=graphene.String(), top_products=graphene.Int()
     )
     vendor_dashboard = graphene.Field(
-        AnalyticsType, date_range=graphene.String()
+        AnalyticsType, date_range=graphene.String(), top_products=graphene.Int()
+    )
+    company_due = GenericScalar(
+        date_range=graphene.String(), order_by=graphene.String(), offset=graphene.Int(), first=graphene.Int()
+    )
+    sales_history = GenericScalar(
+        start=graphene.Date(required=True), end=graphene.Date(required=True), bucket=graphene.String(),
+        company=graphene.ID(), vendor=graphene.ID()
     )
-    company_due = GenericScalar(date_range=graphene.String())
+
+    @is_authenticated
+    def resolve_sales_history(
+        self, info, start, end, bucket=SalesHistoryBucketChoices.DAY, company=None, vendor=None, **kwargs
+    ):
+        user = info.context.user
+        if bucket not in SalesHistoryBucketChoices:
+            raise_graphql_error("Please select a valid choice.", field_name="bucket")
+        if start > end:
+            raise_graphql_error("Start date must not be after the end date.", field_name="start")
+        if get_bucket_count(start, end, bucket) > settings.SALES_HISTORY_MAX_BUCKETS:
+            raise_graphql_error("Date range is too long for the selected bucket.", field_name="end")
+        if user.is_admin:
+            if company and vendor:
+                # the rollups have no sales per company and vendor
+                raise_graphql_error("Please select either a company or a vendor.", field_name="vendor")
+        elif user.is_vendor:
+            vendor, company = user.vendor_id, None
+        elif user.role in [RoleTypeChoices.COMPANY_OWNER, RoleTypeChoices.COMPANY_MANAGER]:
+            vendor, company = None, user.company_id
+        else:
+            raise_graphql_error("User not permitted.")
+        if vendor:
+            scope, rows = f"vendor-{vendor}", DailyVendorSales.objects.filter(vendor=vendor)
+        elif company:
+            scope, rows = f"company-{company}", DailyCompanySales.objects.filter(company=company)
+        else:
+            scope, rows = "all", DailyCompanySales.objects.all()
+        return get_or_set_cache(
+            f"sales-history:{scope}:{start}:{end}:{bucket}",
+            lambda: get_sales_history(rows, start, end, bucket),
+            settings.DASHBOARD_CACHE_TTL
+        )
 
     @is_admin_user
-    def resolve_admin_dashboard(self, info, date_range="", **kwargs):
-        data = AdminDashboard(date_range).get_data()
+    def resolve_admin_dashboard(self, info, date_range="", top_products=None, **kwargs):
+        data = AdminDashboard(date_range, top_products).get_data()
         return AnalyticsType(
             data=data
         )
 
     @is_vendor_user
-    def resolve_vendor_dashboard(self, info, date_range="", **kwargs):
+    def resolve_vendor_dashboard(self, info, date_range="", top_products=None, **kwargs):
         vendor = info.context.user.vendor
-        data = VendorDashboard(vendor, date_range).get_data()
+        data = VendorDashboard(vendor, date_range, top_products).get_data()
         return AnalyticsType(
             data=data
         )
 
     @is_admin_user
-    def resolve_company_due(self, info, date_range="", **kwargs):
+    def resolve_company_due(self, info, date_range="", order_by="-due", offset=0, first=None, **kwargs):
+        if date_range and date_range not in QueryDateRangeChoices:
+            raise_graphql_error("Please select a valid choice.", field_name="dateRange")
+        if order_by not in ['due', '-due']:
+            raise_graphql_error("Please select a valid choice.", field_name="orderBy")
+        if offset < 0 or (first is not None and first < 1):
+            raise_graphql_error("Invalid pagination.", field_name="first")
+        rows = DailyCompanySales.objects.all()
         if date_range:
-            date = timezone.now().date() - datetime.timedelta(days=DATE_RANGE[self.date_range])
-            orders = Order.objects.filter(delivery_date__gte=date)
-        else:
-            orders = Order.objects.all()
-        data = {}
-        for order in orders.annotate(due=F('final_price') - F('paid_amount')).filter(due__gt=0):
-            try:
-                data[order.company.id]['due'] += order.due
-            except Exception:
-                data[order.company.id] = {
-                    'company': {'id': order.company.id, 'workingEmail': order.company.working_email,
-                                'name': order.company.name}, 'due': order.due}
-        return list(map(lambda k: {'company': k['company'], 'due': str(k['due'])}, list(data.values())))
+            rows = rows.filter(date__gte=timezone.now().date() - datetime.timedelta(days=DATE_RANGE[date_range]))
+        dues = rows.values('company_id', 'company__name', 'company__working_email').annotate(
+            due=Sum('due_amount')
+        ).filter(due__gt=0).order_by(order_by, 'company_id')
+        dues = dues[offset:offset + first] if first else dues[offset:]
+        return [{
+            'company': {
+                'id': due['company_id'], 'workingEmail': due['company__working_email'], 'name': due['company__name']
+            },
+            'due': str(due['due'])
+        } for due in dues]
@@ -0,0 +1,129 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Sum, When
+
+from apps.analytics.models import (
+    DailyCompanySales,
+    DailyProductSales,
+    DailyVendorSales,
+)
+from apps.analytics.utils import expire_vendor_dashboards
+from apps.sales.models import ArchivedOrder, ArchivedSellCart, Order, SellCart
+from backend.celery import app
+
+
+def merge_rows(rows, keys):
+    """
+        add up grouped rows of the live and archived tables sharing the same keys
+    """
+    merged = {}
+    for row in rows:
+        key = tuple(row[k] for k in keys)
+        if key in merged:
+            for field, value in row.items():
+                if field not in keys:
+                    merged[key][field] += value
+        else:
+            merged[key] = dict(row)
+    return merged.values()
+
+
+def get_company_rows(start, end):
+    rows = []
+    for qs in [
+        Order.objects.filter(delivery_date__range=[start, end]),
+        ArchivedOrder.objects.filter(delivery_date__range=[start, end], is_deleted=False),
+    ]:
+        rows += qs.order_by().values('delivery_date', 'company_id').annotate(
+            order_count=Count('id'),
+            revenue=Sum('final_price'),
+            paid=Sum('paid_amount'),
+            due=Sum(Case(
+                When(final_price__gt=F('paid_amount'), then=F('final_price') - F('paid_amount')),
+                default=Decimal(0),
+            )),
+        )
+    return merge_rows(rows, ['delivery_date', 'company_id'])
+
+
+def get_cart_rows(start, end, keys):
+    rows = []
+    for qs in [
+        SellCart.objects.filter(date__range=[start, end], order__isnull=False, order__is_deleted=False),
+        ArchivedSellCart.objects.filter(date__range=[start, end], is_deleted=False, order__is_deleted=False),
+    ]:
+        rows += qs.order_by().values(*keys).annotate(
+            order_count=Count('order', distinct=True),
+            qty=Sum('quantity'),
+            revenue=Sum('total_price_with_tax'),
+        )
+    return merge_rows(rows, keys)
+
+
+@transaction.atomic
+def build_sales_rollups(start, end):
+    """
+        recompute the daily rollups of the delivery dates between start and end (inclusive)
+        from the live and archived orders
+    """
+    vendor_ids = set(DailyVendorSales.objects.filter(date__range=[start, end]).values_list('vendor_id', flat=True))
+    DailyCompanySales.objects.filter(date__range=[start, end]).delete()
+    DailyVendorSales.objects.filter(date__range=[start, end]).delete()
+    DailyProductSales.objects.filter(date__range=[start, end]).delete()
+    DailyCompanySales.objects.bulk_create([
+        DailyCompanySales(
+            date=row['delivery_date'], company_id=row['company_id'], order_count=row['order_count'],
+            revenue=row['revenue'] or 0, paid_amount=row['paid'] or 0, due_amount=row['due'] or 0
+        ) for row in get_company_rows(start, end)
+    ])
+    DailyVendorSales.objects.bulk_create([
+        DailyVendorSales(
+            date=row['date'], vendor_id=row['item__vendor_id'], order_count=row['order_count'],
+            quantity=row['qty'] or 0, revenue=row['revenue'] or 0
+        ) for row in get_cart_rows(start, end, ['date', 'item__vendor_id']) if row['item__vendor_id']
+    ])
+    vendor_ids.update(DailyVendorSales.objects.filter(date__range=[start, end]).values_list('vendor_id', flat=True))
+    DailyProductSales.objects.bulk_create([
+        DailyProductSales(
+            date=row['date'], product_id=row['item_id'], vendor_id=row['item__vendor_id'],
+            company_id=row['order__company_id'], order_count=row['order_count'],
+            quantity=row['qty'] or 0, revenue=row['revenue'] or 0
+        ) for row in get_cart_rows(start, end, ['date', 'item_id', 'item__vendor_id', 'order__company_id'])
+    ])
+    expire_vendor_dashboards(vendor_ids)
+
+
+@app.task(autoretry_for=(IntegrityError,), retry_backoff=True, max_retries=5)
+def refresh_sales_rollups(dates):
+    """
+        recompute the rollups of the changed delivery dates.
+        a concurrent refresh of the same date fails on the unique constraints and is retried.
+    """
+    for date in sorted(set(dates)):
+        build_sales_rollups(date, date)
+
+
+@app.task
+def refresh_vendor_dashboard(vendor_id, date_range, top_products):
+    """
+        recompute a stale vendor dashboard in the background
+    """
+    from apps.analytics.query import VendorDashboard
+    from apps.users.models import Vendor
+
+    dashboard = VendorDashboard(Vendor.objects.get(id=vendor_id), date_range, top_products)
+    try:
+        dashboard.refresh()
+    finally:
+        cache.delete(f"{dashboard.cache_key}:refresh")
+
+
+def schedule_sales_rollups(dates):
+    """
+        refresh the rollups of the given delivery dates once the current transaction is committed
+    """
+    dates = sorted({str(date) for date in dates})
+    if dates:
+        transaction.on_commit(lambda: refresh_sales_rollups.delay(dates))
@@ -0,0 +1,134 @@
+import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from graphql import GraphQLError
+
+from apps.sales.models import Order, SellCart
+from apps.scm.models import Product
+from apps.users.models import AccessToken, Company, User, Vendor
+
+from .query import (
+    AdminDashboard,
+    Query,
+    SalesHistoryBucketChoices,
+    VendorDashboard,
+    get_bucket_count,
+    get_bucket_starts,
+)
+from .tasks import build_sales_rollups
+
+
+class SalesTodayTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        today = timezone.now().date()
+        company = Company.objects.create(name="Dashboard", working_email="dashboard@example.com")
+        user = User.objects.create_user(email="dashboard@example.com", password="x", company=company)
+        cls.vendor = Vendor.objects.create(name="Kitchen")
+        product = Product.objects.create(name="Lunch", description="Lunch", price_with_tax=125, vendor=cls.vendor)
+        # placed today for tomorrow
+        order = Order.objects.create(
+            company=company, created_by=user, delivery_date=today + datetime.timedelta(days=1), final_price=250
+        )
+        SellCart.objects.create(
+            item=product, added_by=user, date=order.delivery_date, quantity=2, price=100, price_with_tax=125,
+            order=order
+        )
+        # placed earlier and delivered today
+        delivered = Order.objects.create(company=company, created_by=user, delivery_date=today, final_price=80)
+        Order.objects.filter(id=delivered.id).update(created_on=timezone.now() - datetime.timedelta(days=3))
+        build_sales_rollups(today, today + datetime.timedelta(days=1))
+
+    def test_admin_sales_today(self):
+        context = AdminDashboard().get_context()
+        self.assertEqual(Decimal(context['salesToday']), 250)
+        self.assertEqual(Decimal(context['revenueDeliveredToday']), 80)
+
+    def test_vendor_dashboard_entry_is_per_day(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.assertEqual(Decimal(VendorDashboard(self.vendor).get_data()['salesToday']), 250)
+        tomorrow = timezone.now() + datetime.timedelta(days=1)
+        with mock.patch("django.utils.timezone.now", return_value=tomorrow):
+            data = VendorDashboard(self.vendor).get_data()
+        self.assertEqual(Decimal(data['salesToday']), 0)
+        self.assertEqual(Decimal(data['revenueDeliveredToday']), 250)
+
+    def test_vendor_sales_today(self):
+        context = VendorDashboard(self.vendor).get_context()
+        self.assertEqual(Decimal(context['salesToday']), 250)
+        self.assertEqual(Decimal(context['revenueDeliveredToday']), 0)
+
+
+class SalesHistoryTest(SimpleTestCase):
+
+    def test_bucket_count(self):
+        start = datetime.date(2025, 1, 30)
+        for bucket in SalesHistoryBucketChoices:
+            for days in [0, 1, 6, 7, 31, 59, 366]:
+                end = start + datetime.timedelta(days=days)
+                with self.subTest(bucket=bucket, days=days):
+                    self.assertEqual(get_bucket_count(start, end, bucket), len(get_bucket_starts(start, end, bucket)))
+
+    def resolve(self, **kwargs):
+        info = SimpleNamespace(context=SimpleNamespace(user=SimpleNamespace(is_admin=True)))
+        return Query.resolve_sales_history(None, info, **kwargs)
+
+    @override_settings(SALES_HISTORY_MAX_BUCKETS=10)
+    def test_too_many_buckets(self):
+        with self.assertRaisesMessage(GraphQLError, "Date range is too long"):
+            self.resolve(start=datetime.date(1, 1, 1), end=datetime.date(9999, 12, 31))
+
+    def test_company_and_vendor(self):
+        with self.assertRaisesMessage(GraphQLError, "either a company or a vendor"):
+            self.resolve(start=datetime.date(2025, 1, 1), end=datetime.date(2025, 1, 2), company="1", vendor="1")
+
+
+class CompanyDueTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        today = timezone.now().date()
+        admin = User.objects.create_user(email="due-admin@example.com", password="x")
+        admin.is_staff = True
+        admin.save()
+        AccessToken.objects.create(user=admin, token="due-token")
+        cls.companies = []
+        for name, orders in [
+            ("First", [(0, 50, 0), (0, 80, 30), (60, 500, 0)]),
+            ("Second", [(1, 300, 0)]),
+            ("Paid", [(0, 200, 200)]),
+        ]:
+            company = Company.objects.create(name=name, working_email=f"{name.lower()}@example.com")
+            cls.companies.append(company)
+            for days, final_price, paid_amount in orders:
+                Order.objects.create(
+                    company=company, created_by=admin, delivery_date=today - datetime.timedelta(days=days),
+                    final_price=final_price, paid_amount=paid_amount
+                )
+        build_sales_rollups(today - datetime.timedelta(days=60), today)
+
+    def query(self, arguments):
+        response = self.client.post(
+            "/graphql/", {"query": f"{{ companyDue({arguments}) }}"}, content_type="application/json",
+            HTTP_AUTHORIZATION="JWT due-token"
+        )
+        content = response.json()
+        self.assertNotIn("errors", content)
+        return [(due["company"]["name"], Decimal(due["due"])) for due in content["data"]["companyDue"]]
+
+    def test_all_dues(self):
+        self.assertEqual(self.query("first: 10"), [("First", 600), ("Second", 300)])
+
+    def test_date_range(self):
+        self.assertEqual(self.query('dateRange: "last-7-days"'), [("Second", 300), ("First", 100)])
+
+    def test_order_and_pagination(self):
+        self.assertEqual(self.query('dateRange: "last-7-days", orderBy: "due"'), [("First", 100), ("Second", 300)])
+        self.assertEqual(self.query('dateRange: "last-7-days", offset: 1, first: 1'), [("First", 100)])
@@ -0,0 +1,23 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def get_vendor_dashboard_version(vendor_id):
+    """
+        current version of the cached dashboards of a vendor, 0 when it was never expired
+    """
+    return cache.get(f"vendor-dashboard-version:{vendor_id}") or 0
+
+
+def expire_vendor_dashboards(vendor_ids):
+    """
+        mark the cached dashboards of the vendors as stale once the current transaction is committed.
+        stale dashboards are still served while a worker recomputes them.
+    """
+    vendor_ids = {vendor_id for vendor_id in vendor_ids if vendor_id}
+    if vendor_ids:
+        transaction.on_commit(lambda: cache.set_many({
+            f"vendor-dashboard-version:{vendor_id}": time.time_ns() for vendor_id in vendor_ids
+        }, None))
@@ -3,11 +3,13 @@ import json
 import random
 import re
 import string
+import time
 import uuid
 from math import atan2, cos, radians, sin, sqrt
 from typing import Type
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.serializers import json as s_json
 from django.forms import model_to_dict
@@ -440,3 +442,31 @@ def get_object_or_none(
         return obj
 
     return default_value
+
+
+def get_or_set_cache(key, compute, timeout):
+    """
+        return the cached value of a key or compute and cache it.
+        only one caller refreshes a missing key at a time, the others wait for its result
+        and compute by themselves only when the lock expires without a value.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+    lock_key = f"{key}:lock"
+    if cache.add(lock_key, 1, settings.CACHE_LOCK_TIMEOUT):
+        try:
+            value = compute()
+            cache.set(key, value, timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
+    deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        value = cache.get(key)
+        if value is not None:
+            return value
+        if not cache.get(lock_key):
+            break
+    return compute()
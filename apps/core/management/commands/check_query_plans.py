@@ -0,0 +1,51 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from apps.notifications.models import Notification
+from apps.sales.models import Order, SellCart, UserCart
+from apps.scm.models import Category, Product
+from apps.users.choices import RoleTypeChoices
+
+User = get_user_model()
+
+
+def get_hot_queries():
+    """
+        querysets of the hot resolvers which must be served by an index
+    """
+    today = timezone.now().date()
+    return {
+        'added carts': SellCart.objects.filter(added_by_id=0, is_requested=False),
+        'product carts of a date': SellCart.objects.filter(item_id=0, date=today),
+        'company orders': Order.objects.filter(company_id=0, delivery_date__gte=today),
+        'employee carts': UserCart.objects.filter(added_for_id=0, cart_id=0),
+        'sent notifications': Notification.objects.filter(users=0, sent_on__lte=timezone.now()),
+        'categories': Category.objects.order_by('order', '-created_on')[:20],
+        'products': Product.objects.order_by('order', '-created_on')[:20],
+        'vendor products': Product.objects.filter(vendor_id=0).order_by('order'),
+        'company staffs': User.objects.filter(company_id=0, role=RoleTypeChoices.COMPANY_EMPLOYEE),
+    }
+
+
+class Command(BaseCommand):
+    help = "Fail when a hot query can only be planned with a sequential scan (postgres only)."
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Query plans can only be checked on postgres.")
+        failed = []
+        with transaction.atomic():
+            # with sequential scans disabled the planner still falls back to one when no index matches
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            for name, qs in get_hot_queries().items():
+                plan = qs.explain()
+                if 'Seq Scan' in plan:
+                    failed.append(name)
+                    self.stdout.write(self.style.ERROR(f"{name}:\n{plan}"))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f"{name}: ok"))
+        if failed:
+            raise CommandError(f"Sequential scan in: {', '.join(failed)}")
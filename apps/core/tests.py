@@ -1,3 +1,70 @@
-# from django.test import TestCase
+import datetime
+from unittest import skipUnless
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from apps.notifications.models import Notification
+from apps.sales.models import Order, SellCart, UserCart
+from apps.scm.models import Category, Product
+from apps.users.choices import RoleTypeChoices
+from apps.users.models import Company, User, Vendor
+
+from .management.commands.check_query_plans import get_hot_queries
+
+
+@skipUnless(connection.vendor == 'postgresql', "query plans are checked on postgres")
+class QueryPlanTest(TestCase):
+    """
+        the hot queries are planned on analyzed tables of some volume without forcing the planner,
+        a sequential scan means the matching index is missing or not usable for the query
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        companies = Company.objects.bulk_create(
+            Company(name=f"Company {i}", working_email=f"company{i}@example.com") for i in range(50)
+        )
+        vendors = Vendor.objects.bulk_create(Vendor(name=f"Vendor {i}") for i in range(50))
+        users = User.objects.bulk_create(
+            User(
+                email=f"user{i}@example.com", company=companies[i % 50],
+                role=RoleTypeChoices.COMPANY_EMPLOYEE if i % 10 else RoleTypeChoices.COMPANY_OWNER
+            ) for i in range(2000)
+        )
+        Category.objects.bulk_create(Category(name=f"Category {i}", order=i % 100) for i in range(2000))
+        products = Product.objects.bulk_create(
+            Product(name=f"Product {i}", description="", vendor=vendors[i % 50], order=i % 100)
+            for i in range(2000)
+        )
+        today = timezone.now().date()
+        carts = SellCart.objects.bulk_create(
+            SellCart(
+                added_by=users[i % 2000], item=products[i % 2000], date=today - datetime.timedelta(days=i % 365)
+            ) for i in range(20000)
+        )
+        UserCart.objects.bulk_create(
+            UserCart(cart=carts[i], added_for=users[(i * 7) % 2000]) for i in range(20000)
+        )
+        Order.objects.bulk_create(
+            Order(
+                company=companies[i % 50], created_by=users[i % 2000],
+                delivery_date=today - datetime.timedelta(days=i % 365)
+            ) for i in range(20000)
+        )
+        notifications = Notification.objects.bulk_create(
+            Notification(notification_type="test", title="Test", message="Test", sent_on=timezone.now())
+            for i in range(5000)
+        )
+        Notification.users.through.objects.bulk_create(
+            Notification.users.through(notification=notifications[i // 4], user=users[i % 2000])
+            for i in range(20000)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def test_hot_queries_use_indexes(self):
+        for name, qs in get_hot_queries().items():
+            with self.subTest(name):
+                self.assertNotIn('Seq Scan', qs.explain())
@@ -23,3 +23,9 @@ class NotificationTypeChoice(models.TextChoices):
     ORDER_CART_UPDATE_CONFIRMED = 'order-cart-update-confirmed'
     ORDER_CART_ADDED = 'order-cart-added'
     ORDER_CART_CONFIRMED = 'order-cart-confirmed'
+
+
+class MailStatusChoices(models.TextChoices):
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
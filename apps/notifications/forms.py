@@ -12,7 +12,7 @@ class NotificationForm(forms.ModelForm):
 
     class Meta:
         model = Notification
-        exclude = ('sent_on', 'object_id', 'user', 'notification_type')
+        exclude = ('sent_on', 'object_id', 'user', 'notification_type', 'is_broadcast')
 
 
 class NotificationTemplateForm(forms.ModelForm):
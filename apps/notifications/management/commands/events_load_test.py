@@ -0,0 +1,67 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Hold many idle connections to the events stream and report how many stay open."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default="http://127.0.0.1:8000/events/")
+        parser.add_argument('--token', required=True, help="access token of the connecting user")
+        parser.add_argument('--connections', type=int, default=1000)
+        parser.add_argument('--duration', type=int, default=60, help="seconds to hold the connections")
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http':
+            raise CommandError("Only http urls are supported.")
+        self.stats = {'open': 0, 'failed': 0, 'closed': 0, 'events': 0}
+        asyncio.run(self.run(url, options))
+
+    async def connect(self, url, token, duration):
+        try:
+            reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+            writer.write((
+                f"GET {url.path} HTTP/1.1\r\nHost: {url.netloc}\r\n"
+                f"Authorization: JWT {token}\r\nAccept: text/event-stream\r\n\r\n"
+            ).encode())
+            await writer.drain()
+            status = await reader.readline()
+            if b" 200 " not in status:
+                raise ConnectionError(status)
+        except (OSError, ConnectionError):
+            self.stats['failed'] += 1
+            return
+        self.stats['open'] += 1
+        end = time.monotonic() + duration
+        try:
+            while (remaining := end - time.monotonic()) > 0:
+                line = await asyncio.wait_for(reader.readline(), remaining)
+                if not line:
+                    self.stats['closed'] += 1
+                    break
+                if line.startswith(b"data:"):
+                    self.stats['events'] += 1
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            writer.close()
+
+    async def run(self, url, options):
+        tasks = []
+        for _ in range(options['connections']):
+            tasks.append(asyncio.create_task(self.connect(url, options['token'], options['duration'])))
+            await asyncio.sleep(0.001)
+        while not all(task.done() for task in tasks):
+            self.stdout.write(
+                f"open: {self.stats['open'] - self.stats['closed']}, failed: {self.stats['failed']}, "
+                f"closed: {self.stats['closed']}, events: {self.stats['events']}"
+            )
+            await asyncio.sleep(5)
+        self.stdout.write(self.style.SUCCESS(
+            f"Held {self.stats['open'] - self.stats['closed']} of {options['connections']} connections "
+            f"for {options['duration']}s, {self.stats['events']} events received."
+        ))
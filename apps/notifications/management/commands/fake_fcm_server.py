@@ -0,0 +1,58 @@
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+class FakeFCMHandler(BaseHTTPRequestHandler):
+    """
+        answers multicast requests like the fcm send endpoint.
+        tokens starting with 'unregistered' are reported as not registered.
+    """
+    protocol_version = "HTTP/1.1"
+    latency = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b"{}")
+        time.sleep(self.latency)
+        results = [
+            {"error": "NotRegistered"} if token.startswith("unregistered") else {"message_id": f"fake:{i}"}
+            for i, token in enumerate(body.get("registration_ids", []))
+        ]
+        failure = sum("error" in result for result in results)
+        self.server.requests += 1
+        self.server.messages += len(results)
+        content = json.dumps({
+            "multicast_id": self.server.requests, "success": len(results) - failure, "failure": failure,
+            "canonical_ids": 0, "results": results,
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = "Run a local fake FCM endpoint for push throughput benchmarks (set FCM_URL to its address)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=int, default=50, help="response latency in milliseconds")
+
+    def handle(self, *args, **options):
+        FakeFCMHandler.latency = options['latency'] / 1000
+        server = ThreadingHTTPServer(('127.0.0.1', options['port']), FakeFCMHandler)
+        server.requests = server.messages = 0
+        self.stdout.write(f"Fake FCM listening on http://127.0.0.1:{options['port']}/fcm/send")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Served {server.requests} requests with {server.messages} messages.")
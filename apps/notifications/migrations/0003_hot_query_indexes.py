@@ -0,0 +1,19 @@
+# Generated by Django 5.0.3 on 2026-10-19 13:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_notificationviewer_created_on_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['sent_on'], name='notification_sent_on_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.3 on 2026-10-19 13:22
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_viewers(apps, schema_editor):
+    """
+        keep the first viewer of a notification and user with the views of its duplicates
+    """
+    NotificationViewer = apps.get_model('notifications', 'NotificationViewer')
+    duplicates = NotificationViewer.objects.order_by().values('notification', 'user').annotate(
+        first=Min('id'), views=Sum('view_count'), total=Count('id')
+    ).filter(total__gt=1)
+    for duplicate in duplicates.iterator():
+        viewers = NotificationViewer.objects.filter(notification=duplicate['notification'], user=duplicate['user'])
+        viewers.exclude(id=duplicate['first']).delete()
+        viewers.update(view_count=duplicate['views'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0003_hot_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_viewers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notificationviewer',
+            constraint=models.UniqueConstraint(fields=('notification', 'user'), name='notification_viewer_unique'),
+        ),
+    ]
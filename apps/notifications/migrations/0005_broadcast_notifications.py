@@ -0,0 +1,24 @@
+# Generated by Django 5.0.3 on 2026-10-19 13:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0004_notification_viewer_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='is_broadcast',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_broadcast', True)), fields=['audience_type', 'sent_on'], name='notification_broadcast_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.3 on 2026-10-19 13:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0005_broadcast_notifications'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('sent_on__isnull', True)), fields=['scheduled_on'], name='notification_due_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.3 on 2026-10-19 13:31
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0006_notification_due_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('updated_on', models.DateTimeField(auto_now=True)),
+                ('subject', models.CharField(max_length=255)),
+                ('body', models.TextField()),
+                ('domain', models.CharField(max_length=255)),
+                ('recipients', models.JSONField(default=list)),
+                ('bcc', models.BooleanField(default=False)),
+                ('default_bcc', models.BooleanField(default=False)),
+                ('attachments', models.JSONField(default=list)),
+                ('attachment_files', models.JSONField(default=dict)),
+                ('dedupe_key', models.CharField(max_length=64)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_on', models.DateTimeField(default=django.utils.timezone.now)),
+                ('sent_on', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+                'db_table': 'lunsjavtale_mail_outbox',
+                'ordering': ['-id'],
+                'indexes': [models.Index(condition=models.Q(('status', 'pending')), fields=['next_attempt_on'], name='mail_outbox_due_idx'), models.Index(fields=['sent_on'], name='mail_outbox_sent_on_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='mailoutbox',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('dedupe_key',), name='mail_outbox_pending_unique'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.3 on 2026-10-19 13:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0007_mail_outbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('updated_on', models.DateTimeField(auto_now=True)),
+                ('notification_type', models.CharField(max_length=32)),
+                ('title', models.CharField(max_length=128)),
+                ('message', models.TextField()),
+                ('object_id', models.CharField(blank=True, max_length=64, null=True)),
+                ('send_mail', models.BooleanField(default=False)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'lunsjavtale_notification_events',
+                'ordering': ['created_on'],
+                'indexes': [models.Index(fields=['created_on'], name='notification_event_created_idx')],
+            },
+        ),
+    ]
@@ -6,10 +6,16 @@ from django.utils import timezone
 from ..bases.models import BaseWithoutID
 
 # local imports
-from .choices import AudienceTypeChoice
+from .choices import AudienceTypeChoice, MailStatusChoices
 
 User = get_user_model()
 
+# user fields of the broadcast audiences, resolved when a broadcast is read or delivered
+BROADCAST_AUDIENCES = {
+    AudienceTypeChoice.USERS: {'is_staff': False, 'is_superuser': False, 'is_active': True},
+    AudienceTypeChoice.INACTIVE_USERS: {'is_staff': False, 'is_superuser': False, 'is_active': False},
+}
+
 
 class Notification(BaseWithoutID):
     user = models.ForeignKey(
@@ -27,10 +33,29 @@ class Notification(BaseWithoutID):
     scheduled_on = models.DateTimeField(default=timezone.now)  # set time of send notification
     sent_on = models.DateTimeField(blank=True, null=True)  # notification sending time
     object_id = models.CharField(max_length=64, blank=True, null=True)  # store id of respective section
+    is_broadcast = models.BooleanField(default=False)  # users are resolved from the audience instead of users
 
     class Meta:
         db_table = f"{settings.DB_PREFIX}_notifications"  # define table name for database
         ordering = ['-created_on']  # define default order as created in descending
+        indexes = [
+            models.Index(fields=['sent_on'], name='notification_sent_on_idx'),
+            models.Index(
+                fields=['audience_type', 'sent_on'], condition=models.Q(is_broadcast=True),
+                name='notification_broadcast_idx'
+            ),
+            models.Index(
+                fields=['scheduled_on'], condition=models.Q(sent_on__isnull=True), name='notification_due_idx'
+            ),
+        ]
+
+    def get_recipients(self):
+        """
+            users of a broadcast audience who joined before it was created, else the selected users
+        """
+        if self.is_broadcast:
+            return User.objects.filter(date_joined__lte=self.created_on, **BROADCAST_AUDIENCES[self.audience_type])
+        return self.users.all()
 
     @property
     def notification_status(self):
@@ -45,7 +70,7 @@ class Notification(BaseWithoutID):
         qs = NotificationViewer.objects.filter(
             notification=self
         )
-        if self.audience_type != AudienceTypeChoice.ADMINS:
+        if self.audience_type != AudienceTypeChoice.ADMINS and not self.is_broadcast:
             qs = qs.filter(user__in=self.users.all())
         if qs.exists():
             return True
@@ -77,3 +102,62 @@ class NotificationViewer(BaseWithoutID):
     class Meta:
         db_table = f"{settings.DB_PREFIX}_notification_viewers"  # define table name for database
         ordering = ['-id']  # define default order as id in descending
+        constraints = [
+            models.UniqueConstraint(fields=['notification', 'user'], name='notification_viewer_unique'),
+        ]
+
+
+class NotificationEvent(BaseWithoutID):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notification_events')  # recipient
+    notification_type = models.CharField(max_length=32)  # what type of notification was sent
+    title = models.CharField(max_length=128)  # subject of the notification
+    message = models.TextField()  # body of the notification
+    object_id = models.CharField(max_length=64, blank=True, null=True)  # store id of respective section
+    send_mail = models.BooleanField(default=False)  # also mail the recipient with the digest
+
+    class Meta:
+        db_table = f"{settings.DB_PREFIX}_notification_events"  # define table name for database
+        ordering = ['created_on']  # define default order as created in ascending
+        indexes = [
+            models.Index(fields=['created_on'], name='notification_event_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.pk}. {self.user_id}/{self.notification_type}: {self.title}"
+
+
+class MailOutbox(BaseWithoutID):
+    subject = models.CharField(max_length=255)  # subject of the mail
+    body = models.TextField()  # rendered html body
+    domain = models.CharField(max_length=255)  # recipient domain, mails are throttled per domain
+    recipients = models.JSONField(default=list)  # up to 50 addresses of the domain
+    bcc = models.BooleanField(default=False)  # send recipients as bcc
+    default_bcc = models.BooleanField(default=False)  # add the DEFAULT_BCC_EMAIL as bcc
+    attachments = models.JSONField(default=list)  # file paths
+    attachment_files = models.JSONField(default=dict)  # base64 content of in-memory files by name
+    dedupe_key = models.CharField(max_length=64)  # hash of the content, one pending mail per key
+    status = models.CharField(max_length=16, choices=MailStatusChoices.choices, default=MailStatusChoices.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)  # failed sending attempts
+    next_attempt_on = models.DateTimeField(default=timezone.now)  # not sent before, postponed on retry/throttle
+    sent_on = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        db_table = f"{settings.DB_PREFIX}_mail_outbox"  # define table name for database
+        ordering = ['-id']  # define default order as id in descending
+        indexes = [
+            models.Index(
+                fields=['next_attempt_on'], condition=models.Q(status=MailStatusChoices.PENDING),
+                name='mail_outbox_due_idx'
+            ),
+            models.Index(fields=['sent_on'], name='mail_outbox_sent_on_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'], condition=models.Q(status=MailStatusChoices.PENDING),
+                name='mail_outbox_pending_unique'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.pk}. {self.status}: {self.subject} -> {self.domain}"
@@ -1,6 +1,5 @@
 # third party imports
 import datetime
-from logging import getLogger
 
 import graphene
 from django.utils import timezone
@@ -9,14 +8,20 @@ from graphql import GraphQLError
 
 # local imports
 from apps.bases.utils import camel_case_format, get_object_by_id, raise_graphql_error
-from apps.users.models import User, UserDeviceToken
-from backend.permissions import is_admin_user
+from apps.users.models import User
+from backend.events import create_stream_ticket
+from backend.permissions import is_admin_user, is_authenticated
 
 from .choices import AudienceTypeChoice, NotificationTypeChoice
 from .forms import NotificationForm, NotificationTemplateForm
-from .models import Notification, NotificationTemplate
+from .models import BROADCAST_AUDIENCES, Notification, NotificationTemplate
 from .object_types import NotificationTemplateType, NotificationType
-from .tasks import send_user_bulk_notification
+from .tasks import deliver_notification
+from .utils import (
+    expire_unread_admin_notifications,
+    expire_unread_notifications,
+    get_event_channels,
+)
 
 
 class NotificationMutation(DjangoModelFormMutation):
@@ -45,13 +50,12 @@ class NotificationMutation(DjangoModelFormMutation):
             form = NotificationForm(data=input, instance=instance)
             object_id = instance.id
         users = None
-        if form.data['audience_type'] == AudienceTypeChoice.USERS:
-            users = User.objects.filter(is_staff=False, is_superuser=False, is_active=True)
-        elif form.data['audience_type'] == AudienceTypeChoice.INACTIVE_USERS:
-            users = User.objects.filter(is_staff=False, is_superuser=False, is_active=False)
+        if form.data['audience_type'] in BROADCAST_AUDIENCES:
+            # broadcast users are resolved from the audience when the notification is read or delivered
+            pass
         # elif form.data['audience_type'] == AudienceTypeChoice.SELLER:
         #     users = list(set(list(BaseAdvertise.objects.values_list('user__email').distinct())))
-            users = User.objects.filter(is_active=True, email__in=[user[0] for user in users])
+        #     users = User.objects.filter(is_active=True, email__in=[user[0] for user in users])
         elif form.data['audience_type'] == AudienceTypeChoice.CUSTOM:
             if not form.data.get('users'):
                 raise GraphQLError(
@@ -66,39 +70,37 @@ class NotificationMutation(DjangoModelFormMutation):
             raise_graphql_error("Please select valid audience-type.")
         if form.is_valid():
             form.cleaned_data['notification_type'] = NotificationTypeChoice.ALERT
+            form.cleaned_data['is_broadcast'] = users is None
             if not form.cleaned_data.get('id'):
                 form.cleaned_data['user'] = info.context.user
             del form.cleaned_data['users']
             if not form.data.get('scheduled_on'):
                 del form.cleaned_data['scheduled_on']
             obj, created = Notification.objects.update_or_create(id=object_id, defaults=form.cleaned_data)
+            user_ids = set(obj.users.values_list('id', flat=True))
             obj.users.clear()
-            obj.users.add(*users)
+            if users is not None:
+                obj.users.add(*users)
+                user_ids.update(user.id for user in users)
+            deliver = False
             # if obj.scheduled_on.replace(second=0, microsecond=0) == timezone.now().replace(second=0, microsecond=0):
             if (timezone.now() - datetime.timedelta(seconds=60)) <= obj.scheduled_on <= timezone.now():
                 obj.sent_on = obj.scheduled_on
                 obj.save()
-                tokens = UserDeviceToken.objects.filter(user__in=obj.users.all())
-                tokens = list(set(tokens.values_list('device_token', flat=True).distinct()))
-                if tokens:
-                    send_user_bulk_notification.delay(obj.title, obj.message, tokens, obj.notification_type)
-                else:
-                    getLogger().error("No user device tokens found.")
+                deliver = True
             elif obj.scheduled_on.replace(second=0, microsecond=0) > timezone.now().replace(second=0, microsecond=0):
                 obj.sent_on = None
                 obj.save()
             else:
                 if created:
                     obj.sent_on = timezone.now()
-                    tokens = UserDeviceToken.objects.filter(user__in=obj.users.all())
-                    tokens = list(set(tokens.values_list('device_token', flat=True).distinct()))
-                    if tokens:
-                        send_user_bulk_notification.delay(obj.title, obj.message, tokens, obj.notification_type)
-                    else:
-                        getLogger().error("No user device tokens found.")
+                    deliver = True
                 else:
                     obj.sent_on = obj.scheduled_on
                 obj.save()
+            expire_unread_notifications(user_ids)
+            if deliver or obj.is_broadcast:
+                deliver_notification.delay(obj.id, push=deliver)
         else:
             error_data = {}
             for error in form.errors:
@@ -194,13 +196,32 @@ class NotificationDeleteMutation(graphene.Mutation):
             notifications = Notification.objects.filter(users=user)
         if ids:
             notifications = notifications.filter(id__in=ids)
+        user_ids = set(Notification.users.through.objects.filter(
+            notification__in=notifications).values_list('user_id', flat=True))
         notifications.delete()
+        expire_unread_notifications(user_ids)
+        expire_unread_admin_notifications()
         return NotificationDeleteMutation(
             success=True,
             message="Notification was deleted successfully."
         )
 
 
+class EventStreamTicketMutation(graphene.Mutation):
+    """
+        single use ticket to open the events stream, valid for EVENTS_TICKET_TTL seconds.
+    """
+    success = graphene.Boolean()
+    ticket = graphene.String()
+
+    @is_authenticated
+    def mutate(self, info, **kwargs):
+        return EventStreamTicketMutation(
+            success=True,
+            ticket=create_stream_ticket(get_event_channels(info.context.user))
+        )
+
+
 class Mutation(graphene.ObjectType):
     """
         define all mutations through names to call
@@ -209,3 +230,4 @@ class Mutation(graphene.ObjectType):
     notification_template_mutation = NotificationTemplateMutation.Field()
     notification_template_delete = NotificationTemplateDeleteMutation.Field()
     notification_delete = NotificationDeleteMutation.Field()
+    event_stream_ticket = EventStreamTicketMutation.Field()
@@ -1,17 +1,27 @@
 # third party imports
 
 import graphene
+from django.db.models import F
 from django.utils import timezone
+from graphene.types.generic import GenericScalar
 from graphene_django.filter.fields import DjangoFilterConnectionField
 
 # local imports
-from apps.bases.utils import get_object_by_attrs, get_object_by_id
+from apps.bases.utils import get_object_by_id, raise_graphql_error
 from backend.permissions import is_admin_user, is_authenticated
 
 from .choices import AudienceTypeChoice
 from .models import Notification, NotificationTemplate, NotificationViewer
 from .object_types import NotificationTemplateType, NotificationType
-from .tasks import make_seen_all_notifications
+from .tasks import mark_all_notifications_seen
+from .utils import (
+    add_unread_admin_notifications,
+    add_unread_notifications,
+    get_mail_outbox_stats,
+    get_unread_admin_notification_count,
+    get_unread_notification_count,
+    get_user_notifications,
+)
 
 
 class NotificationQuery(graphene.ObjectType):
@@ -24,6 +34,7 @@ class NotificationQuery(graphene.ObjectType):
     admin_notifications = DjangoFilterConnectionField(NotificationType)
     unread_admin_notification_count = graphene.Int()
     notifications = DjangoFilterConnectionField(NotificationType)
+    mail_outbox_stats = GenericScalar()
 
     @is_admin_user
     def resolve_notification(self, info, id, **kwargs):
@@ -33,28 +44,33 @@ class NotificationQuery(graphene.ObjectType):
                 notification=notification,
                 user=info.context.user
             )
-            obj.view_count += 1
-            obj.save()
+            NotificationViewer.objects.filter(id=obj.id).update(view_count=F('view_count') + 1)
+            if created and notification.sent_on and notification.sent_on <= timezone.now():
+                add_unread_notifications([info.context.user.id], -1)
+            if created and notification.audience_type == AudienceTypeChoice.ADMINS and not \
+                    NotificationViewer.objects.filter(notification=notification).exclude(id=obj.id).exists():
+                add_unread_admin_notifications(-1)
         return notification
 
     @is_admin_user
     def resolve_admin_notifications(self, info, **kwargs):
         notifications = Notification.objects.filter(audience_type=AudienceTypeChoice.ADMINS)
-        make_seen_all_notifications.delay(info.context.user.id)
+        mark_all_notifications_seen(info.context.user.id)
         return notifications
 
     @is_admin_user
     def resolve_unread_admin_notification_count(self, info, **kwargs):
-        notifications = Notification.objects.filter(audience_type=AudienceTypeChoice.ADMINS)
-        qs = notifications
-        read = NotificationViewer.objects.filter(notification__in=qs).values_list('notification', flat=True)
-        return notifications.exclude(id__in=read).count()
+        return get_unread_admin_notification_count()
 
     @is_admin_user
     def resolve_notifications(self, info, **kwargs):
         notifications = Notification.objects.all()
         return notifications
 
+    @is_admin_user
+    def resolve_mail_outbox_stats(self, info, **kwargs):
+        return get_mail_outbox_stats()
+
 
 class NotificationTemplateQuery(graphene.ObjectType):
     """
@@ -83,30 +99,25 @@ class Query(NotificationQuery, NotificationTemplateQuery):
     @is_authenticated
     def resolve_user_notifications(self, info, **kwargs):
         user = info.context.user
-        notifications = Notification.objects.filter(users=user, sent_on__lte=timezone.now())
-        make_seen_all_notifications.delay(user.id)
+        notifications = get_user_notifications(user).filter(sent_on__lte=timezone.now())
+        mark_all_notifications_seen(user.id)
         return notifications
 
     @is_authenticated
     def resolve_user_notification(self, info, id, **kwargs):
         user = info.context.user
-        notification = get_object_by_attrs(
-            Notification, {'id': id, 'users': user},
-            {'name': 'id', 'value': id}
+        notification = get_user_notifications(user).filter(id=id).last()
+        if not notification:
+            raise_graphql_error("Notification matching query does not exist.", field_name="id")
+        obj, created = NotificationViewer.objects.get_or_create(
+            notification=notification,
+            user=user
         )
-        if notification and user in notification.users.all():
-            obj, created = NotificationViewer.objects.get_or_create(
-                notification=notification,
-                user=user
-            )
-            obj.view_count = obj.view_count + 1
-            obj.save()
+        NotificationViewer.objects.filter(id=obj.id).update(view_count=F('view_count') + 1)
+        if created and notification.sent_on and notification.sent_on <= timezone.now():
+            add_unread_notifications([user.id], -1)
         return notification
 
     @is_authenticated
     def resolve_unread_notification_count(self, info, **kwargs):
-        user = info.context.user
-        notifications = Notification.objects.filter(users=user, sent_on__lte=timezone.now())
-        read = NotificationViewer.objects.filter(
-            notification__in=notifications, user=user).values_list('notification', flat=True)
-        return notifications.exclude(id__in=read).count()
+        return get_unread_notification_count(info.context.user)
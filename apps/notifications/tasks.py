@@ -1,7 +1,13 @@
 
+import datetime
+from itertools import islice
 from logging import getLogger
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
 
 from apps.sales.models import AlterCart, Order, SellCart, UserCart
@@ -10,11 +16,21 @@ from apps.users.models import Company, UserDeviceToken
 
 # local imports
 from backend.celery import app
+from backend.events import get_user_channel, publish_event
 from backend.fcm import ExFCMNotification
-from backend.mail import send_mail_from_template
-
-from .choices import AudienceTypeChoice, NotificationTypeChoice
-from .models import Notification, NotificationViewer
+from backend.mail import deliver_outbox_mails, send_mail_from_template
+
+from .choices import AudienceTypeChoice, MailStatusChoices, NotificationTypeChoice
+from .models import MailOutbox, Notification, NotificationEvent, NotificationViewer
+from .utils import (
+    add_unread_admin_notifications,
+    add_unread_notifications,
+    expire_unread_notifications,
+    get_user_notifications,
+    queue_notification_events,
+    rebuild_unread_counters,
+    reset_unread_notifications,
+)
 
 User = get_user_model()
 
@@ -36,6 +52,35 @@ def notify_company_order_update(id):
     send_order_update_mail(order.company.working_email, title, message, str(order.status).replace('-', ' '))
 
 
+@app.task
+def notify_company_orders_update(ids, status):
+    """
+        one notification and one mail per company for orders whose status was changed together
+    """
+    status = str(status).replace('-', ' ')
+    company_orders = {}
+    for order_id, company_id in Order.objects.filter(id__in=ids).order_by('id').values_list('id', 'company_id'):
+        company_orders.setdefault(company_id, []).append(order_id)
+    managers = {}
+    for user_id, company_id in User.objects.filter(
+        company_id__in=company_orders, role__in=[RoleTypeChoices.COMPANY_MANAGER, RoleTypeChoices.COMPANY_OWNER]
+    ).values_list('id', 'company_id'):
+        managers.setdefault(company_id, []).append(user_id)
+    title = "Order status update."
+    for company in Company.objects.filter(id__in=company_orders):
+        order_ids = company_orders[company.id]
+        orders = ", ".join(f"#{order_id}" for order_id in order_ids)
+        message = f"Your orders (ID: {orders}) status has been updated to '{status}'."
+        send_bulk_notification_and_save(
+            user_ids=managers.get(company.id, []),
+            title=title,
+            message=message,
+            n_type=NotificationTypeChoice.ORDER_STATUS_CHANGED,
+            object_id=order_ids[0] if len(order_ids) == 1 else None
+        )
+        send_order_update_mail(company.working_email, title, message, status)
+
+
 @app.task
 def send_order_update_mail(email, title, message, status):
     """
@@ -218,15 +263,12 @@ def user_cart_request_confirmed_mail(email, title, message):
 
 @app.task
 def notify_vendor_product(id):
-    cart = SellCart.objects.get(id=id)
-    vendor = cart.item.vendor
-    if vendor.users.last():
-        send_notification_and_save(
-            user_id=vendor.users.last().id,
-            title="Product added",
-            message=f"Company '{cart.order.company.name}' ordered your product -> '{cart.item.name}'",
-            n_type=NotificationTypeChoice.VENDOR_PRODUCT_ORDERED,
-            object_id=cart.id
+    cart = SellCart.objects.select_related('item__vendor', 'order__company').get(id=id)
+    user = cart.item.vendor.users.last()
+    if user:
+        queue_notification_events(
+            [user.id], "Product added", f"Company '{cart.order.company.name}' ordered your product -> '{cart.item.name}'",
+            NotificationTypeChoice.VENDOR_PRODUCT_ORDERED, object_id=cart.id
         )
 
 
@@ -256,6 +298,7 @@ def send_notification_and_save(user_id, title, message, n_type, object_id=None):
     notification.sent_on = timezone.now()
     notification.save()
     notification.users.add(user)
+    add_unread_notifications([user.id])
     token = token.filter(is_current=True).last()
     if token:
         send_user_notification.delay(
@@ -280,6 +323,7 @@ def send_bulk_notification_and_save(user_ids, title, message, n_type=Notificatio
     notification.sent_on = timezone.now()
     notification.save()
     notification.users.add(*users)
+    add_unread_notifications([user.id for user in users])
     if tokens:
         send_bulk_notification(title, message, tokens, n_type)
     else:
@@ -305,6 +349,8 @@ def send_admin_notification_and_save(
     notification.sent_on = timezone.now()
     notification.save()
     notification.users.add(*users)
+    add_unread_notifications([user.id for user in users])
+    add_unread_admin_notifications()
     if tokens:
         send_bulk_notification(title, message, tokens, n_type)
     else:
@@ -333,13 +379,7 @@ def notify_order_placed(id, orders=[]):
     message = "Your orders have been placed successfully."
     users = list(company.users.filter(
         role__in=[RoleTypeChoices.COMPANY_MANAGER, RoleTypeChoices.COMPANY_OWNER]).values_list('id', flat=True))
-    send_bulk_notification_and_save(
-        user_ids=users,
-        title=title,
-        message=message,
-        n_type=NotificationTypeChoice.ORDER_PLACED,
-        object_id=None
-    )
+    queue_notification_events(users, title, message, NotificationTypeChoice.ORDER_PLACED)
     orders = Order.objects.filter(id__in=orders)
     send_mail_from_template(
         'sell_order_mail.html', {'message': message, 'orders': orders, 'year': timezone.now().year},
@@ -349,34 +389,21 @@ def notify_order_placed(id, orders=[]):
 
 @app.task
 def notify_employee_cart(id):
-    user_cart = UserCart.objects.get(id=id)
-    users = list(User.objects.filter(id=user_cart.added_for.id).values_list('id', flat=True))
+    user_cart = UserCart.objects.select_related('cart__item').get(id=id)
     title = "Food order added."
-    message = f"Food has been ordered for you. Order: #{user_cart.cart.order.id}; Product: {user_cart.cart.item.name}"
-    send_bulk_notification_and_save(
-        user_ids=users,
-        title=title,
-        message=message,
-        n_type=NotificationTypeChoice.ORDER_STATUS_CHANGED,
-        object_id=user_cart.cart.order.id
+    message = f"Food has been ordered for you. Order: #{user_cart.cart.order_id}; Product: {user_cart.cart.item.name}"
+    queue_notification_events(
+        [user_cart.added_for_id], title, message, NotificationTypeChoice.ORDER_STATUS_CHANGED,
+        object_id=user_cart.cart.order_id, send_mail=True
     )
-    notify_employee_cart_mail(user_cart.cart.order.company.working_email, title, message)
 
 
-@app.task
-def notify_employee_cart_mail(email, title, message):
+def remove_device_tokens(tokens):
     """
-        send mail to user for sell-order cart added
+        delete device tokens reported as unregistered by fcm
     """
-    send_mail_from_template(
-        'order_employee_cart.html',
-        {
-            'year': timezone.now().year,
-            'message': message,
-        },
-        title,
-        email
-    )
+    if tokens:
+        UserDeviceToken.objects.filter(device_token__in=tokens).delete()
 
 
 @app.task
@@ -390,10 +417,7 @@ def send_user_notification(token, title, message, notification_type):
         token=token,
         notification_type=notification_type
     )
-    try:
-        fcm.send_notification()
-    except Exception as e:
-        getLogger().error(e)
+    remove_device_tokens(fcm.send_notification())
 
 
 def divide_chunks(ls, n):
@@ -407,9 +431,9 @@ def divide_chunks(ls, n):
 @app.task
 def send_bulk_notification(title, msg, tokens, notification_type):
     """
-        divide recipients into chunks for limit 500
+        divide recipients into chunks which one worker sends with all of its concurrent fcm requests
     """
-    for chunk in divide_chunks(tokens, 500):
+    for chunk in divide_chunks(tokens, settings.FCM_BATCH_SIZE * settings.FCM_CONCURRENCY):
         send_chunk_notifications.delay(title, msg, chunk, notification_type)
 
 
@@ -418,13 +442,7 @@ def send_chunk_notifications(title, msg, tokens, notification_type):
     """
         send notification to multiple users by their tokens
     """
-    print("Start", timezone.now(), flush=True)
-    try:
-        ExFCMNotification(title, msg, None, notification_type).send_bulk_notification(tokens)
-    except Exception as e:
-        print(e)
-        getLogger().error(f"{e}")
-    print("End", timezone.now(), flush=True)
+    remove_device_tokens(ExFCMNotification(title, msg, None, notification_type).send_bulk_notification(tokens))
 
 
 @app.task
@@ -432,28 +450,54 @@ def send_user_bulk_notification(title, message, tokens, notification_type):
     """
         take required arguments and proceed for sending notification
     """
-    print(tokens)
     send_bulk_notification(title, message, tokens, notification_type)
 
 
 @app.task
 def send_scheduled_notifications():
     """
-        check for notifications if scheduled and not sent
+        send every due and unsent notification, also the ones missed while beat or the workers were down.
+        due notifications are claimed in batches with skip locked, so parallel runs never send one twice.
+        notifications later than NOTIFICATION_MAX_LATENESS are marked sent without a push.
     """
-    now = timezone.now()
-    start = now.replace(second=0, microsecond=0)
-    end = now.replace(second=59)
-    notifications = Notification.objects.filter(
-        scheduled_on__gte=start, scheduled_on__lte=end, sent_on__isnull=True)
-    print(notifications)
-    for item in notifications:
-        users = item.users.all()
-        user_tokens = UserDeviceToken.objects.filter(user__in=users)
-        tokens = list(set(list(user_tokens.values_list('device_token', flat=True).distinct())))
-        send_user_bulk_notification.delay(item.title, item.message, tokens, item.notification_type)
-        item.sent_on = now
-        item.save()
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            due = list(Notification.objects.select_for_update(skip_locked=True).filter(
+                sent_on__isnull=True, scheduled_on__lte=now
+            ).order_by('scheduled_on').values_list(
+                'id', 'scheduled_on'
+            )[:settings.NOTIFICATION_SCHEDULE_BATCH_SIZE])
+            if not due:
+                break
+            Notification.objects.filter(id__in=[id for id, _ in due]).update(sent_on=now)
+        cutoff = now - datetime.timedelta(seconds=settings.NOTIFICATION_MAX_LATENESS)
+        for id, scheduled_on in due:
+            deliver_notification.delay(id, push=scheduled_on >= cutoff)
+
+
+@app.task
+def deliver_notification(id, push=True):
+    """
+        stream the recipients of a notification in chunks, dropping their unread counters
+        and pushing the notification to their devices
+    """
+    notification = Notification.objects.get(id=id)
+    user_ids = notification.get_recipients().order_by('id').values_list('id', flat=True).iterator(
+        chunk_size=settings.NOTIFICATION_DELIVERY_CHUNK_SIZE
+    )
+    pushed = False
+    while chunk := list(islice(user_ids, settings.NOTIFICATION_DELIVERY_CHUNK_SIZE)):
+        expire_unread_notifications(chunk)
+        if push:
+            publish_event([get_user_channel(user_id) for user_id in chunk], 'notification')
+            tokens = list(UserDeviceToken.objects.filter(user_id__in=chunk).order_by(
+                'device_token').values_list('device_token', flat=True).distinct())
+            if tokens:
+                send_bulk_notification(notification.title, notification.message, tokens, notification.notification_type)
+                pushed = True
+    if push and not pushed:
+        getLogger().error("No user device tokens found.")
 
 
 @app.task
@@ -475,6 +519,14 @@ def send_admin_notification(instance, created):
         getLogger().error("No admin found for receiving notification.")
 
 
+def mark_all_notifications_seen(user_id):
+    """
+        queue make_seen_all_notifications at most once per user per NOTIFICATION_SEEN_DEBOUNCE seconds
+    """
+    if cache.add(f"notifications-seen:{user_id}", 1, settings.NOTIFICATION_SEEN_DEBOUNCE):
+        make_seen_all_notifications.delay(user_id)
+
+
 @app.task
 def make_seen_all_notifications(user_id):
     user = User.objects.get(id=user_id)
@@ -482,10 +534,150 @@ def make_seen_all_notifications(user_id):
         notifications = Notification.objects.filter(audience_type=AudienceTypeChoice.ADMINS)
         read = NotificationViewer.objects.filter(notification__in=notifications).values_list('notification', flat=True)
     else:
-        notifications = Notification.objects.filter(users=user, sent_on__lte=timezone.now())
+        notifications = get_user_notifications(user).filter(sent_on__lte=timezone.now())
         read = NotificationViewer.objects.filter(
             notification__in=notifications, user=user).values_list('notification', flat=True)
-    for ins in notifications.exclude(id__in=read):
-        obj = NotificationViewer.objects.get_or_create(notification=ins, user=user)[0]
-        obj.view_count += 1
-        obj.save()
+    # viewers created meanwhile by another request are skipped by the unique constraint
+    NotificationViewer.objects.bulk_create([
+        NotificationViewer(notification_id=notification_id, user=user, view_count=1)
+        for notification_id in notifications.exclude(id__in=read).values_list('id', flat=True)
+    ], batch_size=1000, ignore_conflicts=True)
+    reset_unread_notifications(user)
+
+
+@app.task
+def reconcile_unread_notification_counts():
+    """
+        rebuild the unread counters, fixing any drift of the incremental updates
+    """
+    rebuild_unread_counters()
+
+
+@app.task
+def send_outbox_mails():
+    """
+        send the due outbox mails in batches claimed with skip locked, so several workers can drain the outbox.
+        a batch is leased for MAIL_OUTBOX_LEASE by postponing it in a short transaction and sent outside of it,
+        mails of a worker which died while sending are picked up again once the lease ends.
+    """
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            mails = list(MailOutbox.objects.select_for_update(skip_locked=True).filter(
+                status=MailStatusChoices.PENDING, next_attempt_on__lte=now
+            ).order_by('next_attempt_on')[:settings.MAIL_OUTBOX_BATCH_SIZE])
+            if not mails:
+                break
+            MailOutbox.objects.filter(id__in=[mail.id for mail in mails]).update(
+                next_attempt_on=now + datetime.timedelta(seconds=settings.MAIL_OUTBOX_LEASE)
+            )
+        for mail in mails:
+            mail.next_attempt_on = now + datetime.timedelta(seconds=settings.MAIL_OUTBOX_LEASE)
+        deliver_outbox_mails(mails)
+        MailOutbox.objects.bulk_update(
+            mails, ['status', 'attempts', 'next_attempt_on', 'sent_on', 'last_error']
+        )
+
+
+@app.task
+def delete_old_outbox_mails():
+    """
+        remove sent and failed outbox mails older than MAIL_OUTBOX_RETENTION, in batches
+    """
+    before = timezone.now() - datetime.timedelta(days=settings.MAIL_OUTBOX_RETENTION)
+    mails = MailOutbox.objects.filter(
+        Q(status=MailStatusChoices.SENT, sent_on__lt=before) | Q(status=MailStatusChoices.FAILED, updated_on__lt=before)
+    )
+    deleted = 0
+    while ids := list(mails.values_list('id', flat=True)[:settings.MAIL_OUTBOX_BATCH_SIZE * 20]):
+        deleted += MailOutbox.objects.filter(id__in=ids).delete()[0]
+    return deleted
+
+
+def get_digest_content(items):
+    """
+        title and message of the events, a single event is kept as it is
+    """
+    if len(items) == 1:
+        return items[0].title, items[0].message
+    return f"{len(items)} new updates", "\n".join(item.message for item in items)
+
+
+def send_digests(events):
+    """
+        one notification, push and mail per recipient for the buffered events.
+        a single event is sent as it is, several are merged into a digest.
+    """
+    digests = {}
+    for event in events:
+        digests.setdefault(event.user_id, []).append(event)
+    now = timezone.now()
+    notifications = {}
+    for user_id, items in digests.items():
+        first = items[0]
+        title, message = get_digest_content(items)
+        same = all((item.notification_type, item.object_id) == (first.notification_type, first.object_id)
+                   for item in items)
+        notifications[user_id] = Notification(
+            title=title,
+            message=message,
+            notification_type=first.notification_type if same else NotificationTypeChoice.ALERT,
+            object_id=first.object_id if same else None,
+            audience_type=AudienceTypeChoice.USERS,
+            sent_on=now
+        )
+    Notification.objects.bulk_create(notifications.values())
+    Notification.users.through.objects.bulk_create([
+        Notification.users.through(notification_id=notification.id, user_id=user_id)
+        for user_id, notification in notifications.items()
+    ])
+    add_unread_notifications(list(notifications))
+
+    tokens = {}
+    for user_id, token in UserDeviceToken.objects.filter(user_id__in=digests).order_by(
+            'device_token').values_list('user_id', 'device_token').distinct():
+        tokens.setdefault(user_id, []).append(token)
+    pushes = {}
+    for user_id, notification in notifications.items():
+        key = (notification.title, notification.message, notification.notification_type)
+        pushes.setdefault(key, []).extend(tokens.get(user_id, []))
+    for (title, message, n_type), push_tokens in pushes.items():
+        if push_tokens:
+            transaction.on_commit(lambda args=(title, message, push_tokens, n_type): send_bulk_notification.delay(*args))
+
+    emails = dict(User.objects.filter(
+        id__in=[user_id for user_id, items in digests.items() if any(item.send_mail for item in items)]
+    ).values_list('id', 'email'))
+    for user_id, email in emails.items():
+        # the mail only carries the events sent by mail
+        items = [item for item in digests[user_id] if item.send_mail]
+        title = get_digest_content(items)[0]
+        send_mail_from_template(
+            'notification_digest.html',
+            {
+                'year': now.year,
+                'title': title,
+                'messages': [item.message for item in items],
+            },
+            title,
+            email
+        )
+
+
+@app.task
+def send_notification_digests():
+    """
+        flush the events of every recipient whose oldest event is older than the digest window.
+        events are claimed with skip locked, so several workers can flush in parallel.
+    """
+    while True:
+        with transaction.atomic():
+            window = timezone.now() - datetime.timedelta(seconds=settings.NOTIFICATION_DIGEST_WINDOW)
+            user_ids = list(NotificationEvent.objects.filter(created_on__lte=window).order_by(
+                'user_id').values_list('user_id', flat=True).distinct()[:settings.NOTIFICATION_DIGEST_BATCH_SIZE])
+            events = list(NotificationEvent.objects.select_for_update(skip_locked=True).filter(
+                user_id__in=user_ids).order_by('created_on'))
+            if not events:
+                break
+            NotificationEvent.objects.filter(id__in=[event.id for event in events]).delete()
+            send_digests(events)
@@ -1,3 +1,363 @@
-# from django.test import TestCase
+import asyncio
+import datetime
+import json
+from collections import deque
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.users.models import AccessToken, User
+from backend.events import RESYNC_EVENT, get_user_channel, hub, publish_event
+from backend.mail import deliver_outbox_mails, queue_mail
+
+from .choices import AudienceTypeChoice, MailStatusChoices
+from .models import MailOutbox, Notification, NotificationEvent, NotificationViewer
+from .tasks import (
+    delete_old_outbox_mails,
+    deliver_notification,
+    send_digests,
+    send_outbox_mails,
+    send_scheduled_notifications,
+)
+from .utils import (
+    count_unread_notifications,
+    get_unread_key,
+    get_user_notifications,
+    rebuild_unread_counters,
+)
+from .views import stream_events
+
+
+class DigestTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="digest@example.com", password="x")
+
+    def send(self, *events):
+        send_digests([
+            NotificationEvent.objects.create(
+                user=self.user, notification_type="alert", title=title, message=title, send_mail=send_mail
+            ) for title, send_mail in events
+        ])
+
+    def test_mail_counts_mail_items(self):
+        self.send(("Order placed", True), ("Product added", False), ("Cart added", False))
+        self.assertEqual(Notification.objects.get().title, "3 new updates")
+        self.assertEqual(MailOutbox.objects.get().subject, "Order placed")
+
+    def test_mail_digest(self):
+        self.send(("Order placed", True), ("Product added", False), ("Cart added", True))
+        mail = MailOutbox.objects.get()
+        self.assertEqual(mail.subject, "2 new updates")
+        self.assertIn("Cart added", mail.body)
+        self.assertNotIn("Product added", mail.body)
+
+
+class FakeRedis:
+    """
+        in memory pub/sub standing in for the sync and the async redis client
+    """
+
+    def __init__(self, failures=0):
+        self.messages = deque()
+        self.failures = failures
+
+    def pipeline(self, **kwargs):
+        return self
+
+    def publish(self, channel, payload):
+        self.messages.append({"type": "pmessage", "channel": channel.encode(), "data": payload.encode()})
+
+    def execute(self):
+        pass
+
+    def pubsub(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def psubscribe(self, pattern):
+        pass
+
+    async def get_message(self, timeout=0.0):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("Connection lost.")
+        if self.messages:
+            return self.messages.popleft()
+        await asyncio.sleep(0.01)
+        return None
+
+    async def ping(self):
+        pass
+
+    async def aclose(self):
+        pass
+
+
+@override_settings(EVENTS_RECONNECT_MAX_DELAY=0)
+class EventStreamTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="events@example.com", password="x")
+        AccessToken.objects.create(user=cls.user, token="events-token")
+
+    def publish(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            publish_event([get_user_channel(self.user.id)], "notification", {"id": 1})
+
+    async def read_published_event(self, redis):
+        with mock.patch("backend.events.get_redis", return_value=redis), \
+                mock.patch("backend.events.aioredis.Redis.from_url", return_value=redis):
+            stream = stream_events([get_user_channel(self.user.id)])
+            self.assertTrue((await anext(stream)).startswith("retry:"))
+            await sync_to_async(self.publish)()
+            events = [await asyncio.wait_for(anext(stream), 1)]
+            while events[-1] == f"data: {RESYNC_EVENT}\n\n":
+                events.append(await asyncio.wait_for(anext(stream), 1))
+            await stream.aclose()
+        self.assertIsNone(hub.task)
+        return events
+
+    async def test_published_event_reaches_stream(self):
+        events = await self.read_published_event(FakeRedis())
+        self.assertEqual(events, [f"data: {json.dumps({'event': 'notification', 'data': {'id': 1}})}\n\n"])
+
+    async def test_stream_is_resynced_after_reconnect(self):
+        with self.assertLogs(level="ERROR"):
+            events = await self.read_published_event(FakeRedis(failures=1))
+        self.assertEqual(events[0], f"data: {RESYNC_EVENT}\n\n")
+        self.assertIn('"notification"', events[1])
+
+    def test_ticket_is_single_use(self):
+        response = self.client.post(
+            "/graphql/", {"query": "mutation { eventStreamTicket { ticket } }"}, content_type="application/json",
+            HTTP_AUTHORIZATION="JWT events-token"
+        )
+        ticket = response.json()["data"]["eventStreamTicket"]["ticket"]
+        self.assertEqual(self.client.get(f"/events/?ticket={ticket}").status_code, 200)
+        self.assertEqual(self.client.get(f"/events/?ticket={ticket}").status_code, 403)
+        self.assertEqual(self.client.get("/events/?token=events-token").status_code, 403)
+
+
+@override_settings(NOTIFICATION_SCHEDULE_BATCH_SIZE=1, NOTIFICATION_MAX_LATENESS=60 * 60)
+class ScheduledNotificationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+
+        def create(scheduled_on, sent_on=None):
+            return Notification.objects.create(
+                notification_type="alert", title="Alert", message="Alert", scheduled_on=scheduled_on, sent_on=sent_on
+            )
+
+        cls.due = create(now - datetime.timedelta(minutes=5))
+        cls.missed = create(now - datetime.timedelta(days=90))
+        cls.future = create(now + datetime.timedelta(minutes=5))
+        cls.sent = create(now - datetime.timedelta(minutes=5), sent_on=now - datetime.timedelta(minutes=5))
+
+    def send(self):
+        with mock.patch("apps.notifications.tasks.deliver_notification.delay") as delay:
+            send_scheduled_notifications()
+        return sorted(call.args + (call.kwargs['push'],) for call in delay.call_args_list)
+
+    def test_catch_up(self):
+        self.assertEqual(self.send(), sorted([(self.due.id, True), (self.missed.id, False)]))
+        self.assertEqual(
+            set(Notification.objects.filter(sent_on__isnull=True).values_list('id', flat=True)), {self.future.id}
+        )
+
+    def test_claimed_once(self):
+        self.send()
+        self.assertEqual(self.send(), [])
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', MAIL_OUTBOX_MAX_ATTEMPTS=2,
+    MAIL_OUTBOX_RETRY_BACKOFF=60, MAIL_DOMAIN_RATE_LIMIT=100
+)
+class MailOutboxTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def queue(self, subject="Hello", recipient="user@example.com"):
+        with mock.patch("backend.mail.kick_outbox"):
+            queue_mail(subject, "<p>Hello</p>", recipient)
+
+    def test_identical_pending_mails_are_deduped(self):
+        self.queue()
+        self.queue()
+        self.assertEqual(MailOutbox.objects.count(), 1)
+        MailOutbox.objects.update(status=MailStatusChoices.SENT)
+        self.queue()
+        self.assertEqual(MailOutbox.objects.count(), 2)
+
+    def test_sent(self):
+        self.queue()
+        send_outbox_mails()
+        outbox = MailOutbox.objects.get()
+        self.assertEqual(outbox.status, MailStatusChoices.SENT)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_batch_is_leased_before_sending(self):
+        self.queue()
+
+        def deliver(mails):
+            # the claim is written before any mail is sent
+            self.assertGreater(MailOutbox.objects.get().next_attempt_on, timezone.now())
+            deliver_outbox_mails(mails)
+
+        with mock.patch("apps.notifications.tasks.deliver_outbox_mails", side_effect=deliver):
+            send_outbox_mails()
+        self.assertEqual(MailOutbox.objects.get().status, MailStatusChoices.SENT)
+
+    def test_retry_backoff_and_failure(self):
+        self.queue()
+        outbox = MailOutbox.objects.get()
+        with mock.patch("django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=OSError("down")), \
+                self.assertLogs(level="ERROR"):
+            before = timezone.now()
+            deliver_outbox_mails([outbox])
+            self.assertEqual(outbox.status, MailStatusChoices.PENDING)
+            self.assertEqual(outbox.attempts, 1)
+            self.assertEqual(outbox.last_error, "down")
+            self.assertGreaterEqual(outbox.next_attempt_on, before + datetime.timedelta(seconds=60))
+            deliver_outbox_mails([outbox])
+        self.assertEqual(outbox.status, MailStatusChoices.FAILED)
+        self.assertEqual(outbox.attempts, 2)
+
+    @override_settings(MAIL_DOMAIN_RATE_LIMIT=1)
+    def test_domain_throttle(self):
+        self.queue(recipient="first@example.com")
+        self.queue(recipient="second@example.com")
+        self.queue(recipient="other@example.org")
+        mails = list(MailOutbox.objects.order_by('id'))
+        deliver_outbox_mails(mails)
+        self.assertEqual([outbox.status for outbox in mails], [
+            MailStatusChoices.SENT, MailStatusChoices.PENDING, MailStatusChoices.SENT
+        ])
+        self.assertGreater(mails[1].next_attempt_on, timezone.now())
+        self.assertEqual(mails[1].attempts, 0)
+
+    @override_settings(MAIL_OUTBOX_RETENTION=14)
+    def test_old_mails_are_deleted(self):
+        for subject in ["Old", "Recent", "Pending"]:
+            self.queue(subject)
+        MailOutbox.objects.filter(subject__in=["Old", "Recent"]).update(status=MailStatusChoices.SENT)
+        MailOutbox.objects.filter(subject="Old").update(sent_on=timezone.now() - datetime.timedelta(days=15))
+        MailOutbox.objects.filter(subject="Recent").update(sent_on=timezone.now())
+        self.assertEqual(delete_old_outbox_mails(), 1)
+        self.assertEqual(set(MailOutbox.objects.values_list('subject', flat=True)), {"Recent", "Pending"})
+
+
+class BroadcastTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        def create(audience_type, users=()):
+            notification = Notification.objects.create(
+                audience_type=audience_type, notification_type="alert", title=audience_type, message="Alert",
+                sent_on=timezone.now(), is_broadcast=not users
+            )
+            notification.users.add(*users)
+            return notification
+
+        cls.active = create(AudienceTypeChoice.USERS)
+        cls.inactive = create(AudienceTypeChoice.INACTIVE_USERS)
+
+        def user(email, days=-1, **fields):
+            user = User.objects.create_user(email=email, password="x")
+            User.objects.filter(id=user.id).update(
+                date_joined=cls.active.created_on + datetime.timedelta(days=days), **fields
+            )
+            user.refresh_from_db()
+            return user
+
+        cls.member = user("member@example.com")
+        cls.late = user("late@example.com", days=1)
+        cls.sleeper = user("sleeper@example.com", is_active=False)
+        cls.admin = user("admin@example.com", is_staff=True)
+        AccessToken.objects.create(user=cls.admin, token="broadcast-token")
+        cls.custom = create(AudienceTypeChoice.CUSTOM, users=[cls.late])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_broadcast_reaches_audience_joined_before_it(self):
+        expected = {
+            self.member: {self.active.id},
+            self.late: {self.custom.id},
+            self.sleeper: {self.inactive.id},
+            self.admin: set(),
+        }
+        for user, ids in expected.items():
+            with self.subTest(user.email):
+                self.assertEqual(set(get_user_notifications(user).values_list('id', flat=True)), ids)
+        for notification in [self.active, self.inactive]:
+            self.assertEqual(
+                set(notification.get_recipients()),
+                {user for user, ids in expected.items() if notification.id in ids}
+            )
+
+    def test_rebuild_counts_unread_broadcasts(self):
+        later = Notification.objects.create(
+            audience_type=AudienceTypeChoice.USERS, notification_type="alert", title="Later", message="Alert",
+            sent_on=timezone.now(), is_broadcast=True
+        )
+        # created after the late user joined, so both active users are its audience
+        Notification.objects.filter(id=later.id).update(created_on=self.late.date_joined + datetime.timedelta(days=1))
+        NotificationViewer.objects.create(notification=self.active, user=self.member)
+        # a broadcast that is not sent yet is not counted
+        Notification.objects.create(
+            audience_type=AudienceTypeChoice.USERS, notification_type="alert", title="Scheduled", message="Alert",
+            scheduled_on=timezone.now() + datetime.timedelta(hours=1), is_broadcast=True
+        )
+        rebuild_unread_counters()
+        expected = {self.member: 1, self.late: 2, self.sleeper: 1, self.admin: 0}
+        for user, count in expected.items():
+            with self.subTest(user.email):
+                self.assertEqual(cache.get(get_unread_key(user.id)), count)
+                self.assertEqual(count_unread_notifications(user), count)
+
+    def create_broadcast(self):
+        query = """
+            mutation {
+                notificationMutation(input: {title: "Hello", message: "Hello", audienceType: "users"}) {
+                    success
+                }
+            }
+        """
+        with mock.patch("apps.notifications.mutation.deliver_notification.delay") as delay:
+            response = self.client.post(
+                "/graphql/", {"query": query}, content_type="application/json", HTTP_AUTHORIZATION="JWT broadcast-token"
+            )
+        self.assertTrue(response.json()["data"]["notificationMutation"]["success"])
+        delay.assert_called_once()
+        return Notification.objects.get(id=delay.call_args.args[0])
+
+    def test_broadcast_queries_do_not_grow_with_audience(self):
+        with CaptureQueriesContext(connection) as create_queries:
+            notification = self.create_broadcast()
+        with CaptureQueriesContext(connection) as deliver_queries, self.assertLogs(level="ERROR"):
+            deliver_notification(notification.id)
+        User.objects.bulk_create(User(email=f"audience{i}@example.com") for i in range(50))
+        with self.assertNumQueries(len(create_queries)):
+            notification = self.create_broadcast()
+        self.assertFalse(notification.users.exists())
+        with self.assertNumQueries(len(deliver_queries)), self.assertLogs(level="ERROR"):
+            deliver_notification(notification.id)
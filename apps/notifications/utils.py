@@ -0,0 +1,189 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Avg, Count, Exists, F, Min, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from apps.users.choices import RoleTypeChoices
+from backend.events import (
+    ADMINS_CHANNEL,
+    get_company_channel,
+    get_user_channel,
+    publish_event,
+)
+
+from .choices import AudienceTypeChoice, MailStatusChoices
+from .models import (
+    BROADCAST_AUDIENCES,
+    MailOutbox,
+    Notification,
+    NotificationEvent,
+    NotificationViewer,
+)
+
+User = get_user_model()
+
+ADMIN_UNREAD_KEY = "unread-notifications:admins"
+
+
+def get_event_channels(user):
+    """
+        channels a user's stream listens to
+    """
+    channels = [get_user_channel(user.id)]
+    if user.is_admin:
+        channels.append(ADMINS_CHANNEL)
+    elif user.company_id and user.role in [RoleTypeChoices.COMPANY_OWNER, RoleTypeChoices.COMPANY_MANAGER]:
+        channels.append(get_company_channel(user.company_id))
+    return channels
+
+
+def get_unread_key(user_id):
+    return f"unread-notifications:{user_id}"
+
+
+def get_user_notifications(user):
+    """
+        notifications selected for the user or broadcast to an audience the user belongs to
+    """
+    audiences = [
+        audience for audience, fields in BROADCAST_AUDIENCES.items()
+        if all(getattr(user, field) == value for field, value in fields.items())
+    ]
+    return Notification.objects.filter(
+        Q(users=user) | Q(is_broadcast=True, audience_type__in=audiences, created_on__gte=user.date_joined)
+    )
+
+
+def count_unread_notifications(user):
+    notifications = get_user_notifications(user).filter(sent_on__lte=timezone.now())
+    read = NotificationViewer.objects.filter(
+        notification__in=notifications, user=user).values_list('notification', flat=True)
+    return notifications.exclude(id__in=read).count()
+
+
+def count_unread_admin_notifications():
+    notifications = Notification.objects.filter(audience_type=AudienceTypeChoice.ADMINS)
+    read = NotificationViewer.objects.filter(notification__in=notifications).values_list('notification', flat=True)
+    return notifications.exclude(id__in=read).count()
+
+
+def get_counter(key, count):
+    """
+        read a counter, a missing counter is counted from the database once and stored
+    """
+    value = cache.get(key)
+    if value is None:
+        value = count()
+        cache.add(key, value, None)
+    return max(value, 0)
+
+
+def add_to_counters(keys, amount):
+    """
+        add to existing counters, missing counters are counted again on the next read
+    """
+    for key in keys:
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            pass
+
+
+def get_unread_notification_count(user):
+    return get_counter(get_unread_key(user.id), lambda: count_unread_notifications(user))
+
+
+def get_unread_admin_notification_count():
+    return get_counter(ADMIN_UNREAD_KEY, count_unread_admin_notifications)
+
+
+def add_unread_notifications(user_ids, amount=1):
+    add_to_counters([get_unread_key(user_id) for user_id in user_ids], amount)
+    if amount > 0:
+        publish_event([get_user_channel(user_id) for user_id in user_ids], 'notification')
+
+
+def add_unread_admin_notifications(amount=1):
+    add_to_counters([ADMIN_UNREAD_KEY], amount)
+    if amount > 0:
+        publish_event([ADMINS_CHANNEL], 'admin-notification')
+
+
+def expire_unread_notifications(user_ids):
+    """
+        drop the counters of users whose notifications changed in a way that can not be counted
+    """
+    cache.delete_many([get_unread_key(user_id) for user_id in user_ids])
+
+
+def expire_unread_admin_notifications():
+    cache.delete(ADMIN_UNREAD_KEY)
+
+
+def reset_unread_notifications(user):
+    if user.is_admin:
+        cache.set(ADMIN_UNREAD_KEY, 0, None)
+    else:
+        cache.set(get_unread_key(user.id), 0, None)
+
+
+def rebuild_unread_counters(batch_size=1000):
+    """
+        recount the unread notifications of every user with one grouped query
+        and one query per broadcast audience
+    """
+    through = Notification.users.through
+    unread = dict(through.objects.filter(notification__sent_on__lte=timezone.now()).exclude(
+        Exists(NotificationViewer.objects.filter(notification=OuterRef('notification'), user=OuterRef('user')))
+    ).order_by().values_list('user').annotate(total=Count('notification')))
+    for audience, fields in BROADCAST_AUDIENCES.items():
+        broadcasts = Notification.objects.filter(
+            is_broadcast=True, audience_type=audience, sent_on__lte=timezone.now(), created_on__gte=OuterRef('date_joined')
+        ).exclude(
+            Exists(NotificationViewer.objects.filter(notification=OuterRef('pk'), user=OuterRef(OuterRef('pk'))))
+        ).order_by().values('audience_type').annotate(total=Count('id')).values('total')
+        for user_id, total in User.objects.filter(**fields).annotate(
+            broadcasts=Subquery(broadcasts)
+        ).filter(broadcasts__gt=0).values_list('id', 'broadcasts'):
+            unread[user_id] = unread.get(user_id, 0) + total
+    user_ids = list(User.objects.values_list('id', flat=True))
+    for i in range(0, len(user_ids), batch_size):
+        cache.set_many({
+            get_unread_key(user_id): unread.get(user_id, 0) for user_id in user_ids[i:i + batch_size]
+        }, None)
+    cache.set(ADMIN_UNREAD_KEY, count_unread_admin_notifications(), None)
+
+
+def queue_notification_events(user_ids, title, message, n_type, object_id=None, send_mail=False):
+    """
+        buffer a notification for the recipients, events of the digest window are sent together
+    """
+    NotificationEvent.objects.bulk_create([
+        NotificationEvent(
+            user_id=user_id, title=title, message=message, notification_type=n_type, object_id=object_id,
+            send_mail=send_mail
+        ) for user_id in set(user_ids)
+    ])
+
+
+def get_mail_outbox_stats():
+    """
+        queue depth of the mail outbox and the delivery latency of the last hour
+    """
+    now = timezone.now()
+    pending = MailOutbox.objects.filter(status=MailStatusChoices.PENDING).aggregate(
+        count=Count('id'), due=Count('id', filter=Q(next_attempt_on__lte=now)), oldest=Min('created_on')
+    )
+    sent = MailOutbox.objects.filter(sent_on__gte=now - datetime.timedelta(hours=1)).aggregate(
+        count=Count('id'), latency=Avg(F('sent_on') - F('created_on'))
+    )
+    return {
+        'pending': pending['count'],
+        'due': pending['due'],
+        'oldestPendingSeconds': (now - pending['oldest']).total_seconds() if pending['oldest'] else 0,
+        'failed': MailOutbox.objects.filter(status=MailStatusChoices.FAILED).count(),
+        'sentLastHour': sent['count'],
+        'averageLatencySeconds': sent['latency'].total_seconds() if sent['latency'] else 0,
+    }
@@ -1,3 +1,47 @@
-# from django.shortcuts import render
+import asyncio
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponseForbidden, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from backend.authentication import Authentication
+from backend.events import hub, redeem_stream_ticket
+
+from .utils import get_event_channels
+
+
+async def stream_events(channels):
+    queue = hub.subscribe(channels)
+    try:
+        yield f"retry: {settings.EVENTS_RETRY * 1000}\n\n"
+        while True:
+            try:
+                data = await asyncio.wait_for(queue.get(), settings.EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            yield f"data: {data}\n\n"
+    finally:
+        hub.unsubscribe(channels, queue)
+
+
+@require_GET
+async def events(request):
+    """
+        server sent events of the user's notifications and order statuses, served by the asgi app.
+        browsers can not set headers on an EventSource, so it connects with ?ticket= of a single use
+        ticket from the eventStreamTicket mutation, and takes a new one when it reconnects.
+    """
+    ticket = request.GET.get('ticket')
+    if ticket:
+        channels = await sync_to_async(redeem_stream_ticket)(ticket)
+    else:
+        user = await sync_to_async(Authentication(request).authenticate)()
+        channels = get_event_channels(user) if user else None
+    if not channels:
+        return HttpResponseForbidden("You are not authorized user.")
+    response = StreamingHttpResponse(stream_events(channels), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
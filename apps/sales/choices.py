@@ -46,6 +46,24 @@ class PaymentStatusChoices(models.TextChoices):
     COMPLETED = 'completed'
 
 
+class PaymentSessionStateChoices(models.TextChoices):
+    """
+        define session states reported by vipps checkout
+    """
+    SESSION_CREATED = 'SessionCreated'
+    PAYMENT_INITIATED = 'PaymentInitiated'
+    SESSION_EXPIRED = 'SessionExpired'
+    PAYMENT_SUCCESSFUL = 'PaymentSuccessful'
+    PAYMENT_TERMINATED = 'PaymentTerminated'
+
+
+# states for which the checkout session can still move forward, empty until first response
+PENDING_SESSION_STATES = [
+    '',
+    PaymentSessionStateChoices.SESSION_CREATED,
+    PaymentSessionStateChoices.PAYMENT_INITIATED,
+]
+
 STATUS_MAPPING = {
     '0': InvoiceStatusChoices.PLACED,
     '1': InvoiceStatusChoices.UPDATED,
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.3 on 2026-10-19 13:02
+
+from django.db import migrations, models
+
+
+def copy_session_state(apps, schema_editor):
+    OnlinePayment = apps.get_model('sales', 'OnlinePayment')
+    payments = OnlinePayment.objects.exclude(session_data__isnull=True).only('id', 'session_data')
+    for payment in payments.iterator(chunk_size=1000):
+        state = (payment.session_data or {}).get('sessionState', "")
+        if state:
+            OnlinePayment.objects.filter(id=payment.id).update(session_state=state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0013_orderpayment_deduction_alter_altercart_base_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='onlinepayment',
+            name='checked_on',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='onlinepayment',
+            name='session_state',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AddIndex(
+            model_name='onlinepayment',
+            index=models.Index(fields=['session_state', 'created_on'], name='online_payment_state_idx'),
+        ),
+        migrations.RunPython(copy_session_state, migrations.RunPython.noop),
+    ]
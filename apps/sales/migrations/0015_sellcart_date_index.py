@@ -0,0 +1,18 @@
+# Generated by Django 5.0.3 on 2026-10-19 13:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0014_onlinepayment_session_state'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sellcart',
+            name='date',
+            field=models.DateField(db_index=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.3 on 2026-10-19 13:20
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class AddPostgresIndex(migrations.AddIndex):
+    """
+        brin indexes only exist on postgres, other databases only keep them in the model state
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0015_sellcart_date_index'),
+    ]
+
+    operations = [
+        AddPostgresIndex(
+            model_name='order',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['delivery_date'], name='order_delivery_date_brin'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.0.3 on 2026-10-19 13:08
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0016_delivery_date_brin_indexes'),
+        ('scm', '0017_weeklyvariant_product_weekly_variants'),
+        ('users', '0016_clientdetails_email'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('created_on', models.DateTimeField()),
+                ('updated_on', models.DateTimeField()),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('deleted_on', models.DateTimeField(blank=True, null=True)),
+                ('note', models.TextField(blank=True, null=True)),
+                ('payment_type', models.CharField(choices=[('online', 'Online'), ('pay-by-invoice', 'Pay By Invoice'), ('cash-on-delivery', 'Cash On Delivery')], default='pay-by-invoice', max_length=16)),
+                ('delivery_date', models.DateField()),
+                ('company_allowance', models.PositiveIntegerField(default=0)),
+                ('shipping_charge', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('actual_price', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('discount_amount', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('final_price', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('paid_amount', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('status', models.CharField(choices=[('Placed', 'Placed'), ('Updated', 'Updated'), ('Partially-paid', 'Partially Paid'), ('Payment-pending', 'Payment Pending'), ('Payment-completed', 'Payment Completed'), ('Cancelled', 'Cancelled'), ('Confirmed', 'Confirmed'), ('Processing', 'Processing'), ('Ready-to-deliver', 'Ready To Deliver'), ('Delivered', 'Delivered')], default='Placed', max_length=32)),
+                ('is_full_paid', models.BooleanField(default=False)),
+                ('is_checked', models.BooleanField(default=False)),
+                ('graph', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('archived_on', models.DateTimeField(auto_now_add=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='users.company')),
+                ('coupon', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='users.coupon')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('shipping_address', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='users.address')),
+            ],
+            options={
+                'db_table': 'lunsjavtale_archived_orders',
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedSellCart',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('created_on', models.DateTimeField()),
+                ('updated_on', models.DateTimeField()),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('deleted_on', models.DateTimeField(blank=True, null=True)),
+                ('date', models.DateField(db_index=True)),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('cancelled', models.PositiveIntegerField(default=0)),
+                ('price', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('price_with_tax', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('total_price', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('total_price_with_tax', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('is_requested', models.BooleanField(default=False)),
+                ('request_status', models.CharField(choices=[('pending', 'Pending'), ('accepted', 'Accepted'), ('rejected', 'Rejected')], default='pending', max_length=32)),
+                ('added_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='scm.product')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='carts', to='sales.archivedorder')),
+            ],
+            options={
+                'db_table': 'lunsjavtale_archived_sell_carts',
+            },
+        ),
+    ]
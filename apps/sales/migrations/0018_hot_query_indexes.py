@@ -0,0 +1,33 @@
+# Generated by Django 5.0.3 on 2026-10-19 13:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0017_archived_orders'),
+        ('scm', '0017_weeklyvariant_product_weekly_variants'),
+        ('users', '0016_clientdetails_email'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['company', 'delivery_date'], name='order_company_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sellcart',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['added_by', 'is_requested'], name='sell_cart_added_by_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sellcart',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['item', 'date'], name='sell_cart_item_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usercart',
+            index=models.Index(fields=['added_for', 'cart'], name='user_cart_added_for_idx'),
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.conf import settings
+from django.contrib.postgres.indexes import BrinIndex
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 
@@ -10,6 +12,7 @@ from apps.sales.choices import (
     PaymentStatusChoices,
     PaymentTypeChoices,
 )
+from backend.events import ADMINS_CHANNEL, get_company_channel, publish_event
 
 
 class PaymentMethod(BaseWithoutID, SoftDeletion):
@@ -50,7 +53,7 @@ class SellCart(BaseWithoutID, SoftDeletion):
     item = models.ForeignKey(
         to='scm.Product', on_delete=models.DO_NOTHING, related_name='product_carts'
     )
-    date = models.DateField()
+    date = models.DateField(db_index=True)
     added_for = models.ManyToManyField(
         to='users.User', blank=True
     )
@@ -93,6 +96,15 @@ class SellCart(BaseWithoutID, SoftDeletion):
 
     class Meta:
         db_table = f"{settings.DB_PREFIX}_sell_carts"  # define table name for database
+        indexes = [
+            models.Index(
+                fields=['added_by', 'is_requested'], condition=models.Q(is_deleted=False),
+                name='sell_cart_added_by_idx'
+            ),
+            models.Index(
+                fields=['item', 'date'], condition=models.Q(is_deleted=False), name='sell_cart_item_date_idx'
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         self.total_price = self.price * self.ordered_quantity
@@ -130,6 +142,9 @@ class UserCart(BaseWithoutID):
 
     class Meta:
         db_table = f"{settings.DB_PREFIX}_user_carts"  # define table name for database
+        indexes = [
+            models.Index(fields=['added_for', 'cart'], name='user_cart_added_for_idx'),
+        ]
 
     @property
     def is_full_paid(self):
@@ -217,6 +232,14 @@ class Order(BaseWithoutID, SoftDeletion):
     class Meta:
         db_table = f"{settings.DB_PREFIX}_orders"  # define table name for database
         ordering = ['-id']  # define default order as id in descending
+        indexes = [
+            models.Index(
+                fields=['company', 'delivery_date'], condition=models.Q(is_deleted=False),
+                name='order_company_date_idx'
+            ),
+            # orders are inserted roughly in delivery date order, a small brin serves the date range scans
+            BrinIndex(fields=['delivery_date'], name='order_delivery_date_brin'),
+        ]
 
     def save(self, *args, **kwargs):
         if self.pk and self.order_carts.exists():
@@ -289,6 +312,10 @@ class OrderStatus(models.Model):
         self.order.status = self.order.statuses.latest('created_on').status
         self.order.note = self.order.statuses.latest('created_on').note
         self.order.save()
+        publish_event(
+            [get_company_channel(self.order.company_id), ADMINS_CHANNEL], 'order-status',
+            {'ids': [self.order.id], 'status': self.order.status}
+        )
 
 
 # class UserCartStatus(models.Model):
@@ -351,14 +378,25 @@ class OnlinePayment(BaseModel):
     request_data = models.JSONField(blank=True, null=True)
     response_data = models.JSONField(blank=True, null=True)
     session_data = models.JSONField(blank=True, null=True, default=dict)
+    session_state = models.CharField(
+        max_length=32, blank=True, default=""
+    )  # copy of session_data['sessionState'] so pending sessions can be found through an index
+    checked_on = models.DateTimeField(blank=True, null=True)  # last time the session was polled from vipps
 
     class Meta:
         db_table = f"{settings.DB_PREFIX}_online_payments"  # define table name for database
         ordering = ['-created_on']  # define default order as id in descending
+        indexes = [
+            models.Index(fields=['session_state', 'created_on'], name='online_payment_state_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.session_state = (self.session_data or {}).get('sessionState', "")
+        super(OnlinePayment, self).save(*args, **kwargs)
 
     @property
     def status(self):
-        return self.session_data.get('sessionState', "")
+        return self.session_state
 
 
 class ProductRating(BaseWithoutID):
@@ -375,3 +413,89 @@ class ProductRating(BaseWithoutID):
     class Meta:
         db_table = f"{settings.DB_PREFIX}_product_ratings"  # define table name for database
         ordering = ['-id']  # define default order as id in descending
+
+
+class ArchivedOrder(models.Model):
+    """
+        closed orders moved out of the orders table by the archival task.
+        columns mirror Order in the same order so both tables can be combined with union,
+        statuses, billing address, user carts and m2m rows are kept in graph.
+    """
+    id = models.BigIntegerField(primary_key=True)  # id of the archived order
+    created_on = models.DateTimeField()
+    updated_on = models.DateTimeField()
+    is_deleted = models.BooleanField(default=False)
+    deleted_on = models.DateTimeField(null=True, blank=True)
+    company = models.ForeignKey(
+        to='users.Company', on_delete=models.DO_NOTHING, related_name='+'
+    )
+    shipping_address = models.ForeignKey(
+        to='users.Address', on_delete=models.SET_NULL, related_name='+', blank=True, null=True
+    )
+    created_by = models.ForeignKey(to='users.User', on_delete=models.DO_NOTHING, related_name='+')
+    note = models.TextField(blank=True, null=True)
+    coupon = models.ForeignKey('users.Coupon', on_delete=models.DO_NOTHING, related_name='+', blank=True, null=True)
+    payment_type = models.CharField(
+        max_length=16, choices=OrderPaymentTypeChoices.choices, default=OrderPaymentTypeChoices.PAY_BY_INVOICE
+    )
+    delivery_date = models.DateField()
+    company_allowance = models.PositiveIntegerField(default=0)
+    shipping_charge = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    actual_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    final_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    paid_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    status = models.CharField(
+        max_length=32, choices=InvoiceStatusChoices.choices, default=InvoiceStatusChoices.PLACED
+    )
+    is_full_paid = models.BooleanField(default=False)
+    is_checked = models.BooleanField(default=False)
+    # archive only columns, must stay after the mirrored ones
+    graph = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    archived_on = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = f"{settings.DB_PREFIX}_archived_orders"  # define table name for database
+        ordering = ['-id']  # define default order as id in descending
+
+    def as_order(self):
+        """
+            unsaved order of the archived row, so archived orders are served through the order type
+        """
+        order = Order(**{field.attname: getattr(self, field.attname) for field in Order._meta.concrete_fields})
+        order.is_archived = True
+        return order
+
+
+class ArchivedSellCart(models.Model):
+    """
+        carts of archived orders, columns mirror SellCart in the same order
+    """
+    id = models.BigIntegerField(primary_key=True)  # id of the archived cart
+    created_on = models.DateTimeField()
+    updated_on = models.DateTimeField()
+    is_deleted = models.BooleanField(default=False)
+    deleted_on = models.DateTimeField(null=True, blank=True)
+    order = models.ForeignKey(
+        to=ArchivedOrder, on_delete=models.CASCADE, related_name='carts'
+    )
+    added_by = models.ForeignKey(
+        to='users.User', on_delete=models.SET_NULL, related_name='+', blank=True, null=True
+    )
+    item = models.ForeignKey(
+        to='scm.Product', on_delete=models.DO_NOTHING, related_name='+'
+    )
+    date = models.DateField(db_index=True)
+    quantity = models.PositiveIntegerField(default=1)
+    cancelled = models.PositiveIntegerField(default=0)
+    price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    price_with_tax = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    total_price_with_tax = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    is_requested = models.BooleanField(default=False)
+    request_status = models.CharField(
+        max_length=32, choices=DecisionChoices.choices, default=DecisionChoices.PENDING
+    )
+
+    class Meta:
+        db_table = f"{settings.DB_PREFIX}_archived_sell_carts"  # define table name for database
@@ -3,11 +3,14 @@ from django.contrib.auth import get_user_model
 from django.db import transaction
 from django.db.models import Q
 from django.utils import timezone
+from graphene.types.generic import GenericScalar
 from graphene_django.forms.mutation import DjangoFormMutation, DjangoModelFormMutation
 from graphene_django.forms.types import DjangoFormInputObjectType
 from graphql import GraphQLError
 
 # local imports
+from apps.analytics.tasks import schedule_sales_rollups
+from apps.analytics.utils import expire_vendor_dashboards
 from apps.bases.utils import (
     camel_case_format,
     raise_graphql_error,
@@ -15,6 +18,7 @@ from apps.bases.utils import (
 )
 from apps.notifications.tasks import (
     notify_company_order_update,
+    notify_company_orders_update,
     notify_order_placed,
     send_admin_notification_and_save,
     send_admin_sell_order_mail,
@@ -25,6 +29,7 @@ from apps.notifications.tasks import (
 )
 from apps.scm.models import Ingredient, Product
 from apps.users.choices import RoleTypeChoices
+from backend.events import ADMINS_CHANNEL, get_company_channel, publish_event
 from backend.permissions import is_admin_user, is_authenticated, is_company_user
 
 from ..notifications.choices import NotificationTypeChoice
@@ -61,11 +66,14 @@ from .object_types import (
 )
 from .tasks import (
     add_user_carts,
+    export_csv_to_file,
     make_online_payment,
     make_previous_payment,
     notify_user_carts,
     vendor_sold_amount_calculation,
+    vendors_sold_amount_calculation,
 )
+from .utils import EXPORTS
 
 User = get_user_model()
 
@@ -224,6 +232,8 @@ class EditCartMutation(graphene.Mutation):
         company.invoice_amount += obj.order.company_due_amount - company_due_amount
         company.save()
         add_user_carts.delay(obj.id)
+        if obj.order:
+            schedule_sales_rollups([obj.date])
         return EditCartMutation(
             success=True,
             message="Successfully updated",
@@ -392,6 +402,7 @@ class OrderCreation(graphene.Mutation):
         for obj in orders:
             obj.save()
             notify_user_carts.delay(list(obj.order_carts.all().values_list('id', flat=True)))
+        schedule_sales_rollups(dates)
         send_admin_sell_order_mail.delay(
             company.id, list(map(lambda i: {
                 'id': i.id, 'delivery_date': i.delivery_date, 'final_price': i.final_price
@@ -431,6 +442,7 @@ class OrderStatusUpdate(graphene.Mutation):
         if obj.status in [InvoiceStatusChoices.CANCELLED, InvoiceStatusChoices.DELIVERED]:
             raise_graphql_error(f"Order status already in '{obj.status}'")
         OrderStatus.objects.create(order=obj, status=status, note=note)
+        schedule_sales_rollups([obj.delivery_date])
         notify_company_order_update.delay(obj.id)
         if obj.status == InvoiceStatusChoices.DELIVERED:
             vendor_sold_amount_calculation.delay(obj.id)
@@ -440,6 +452,52 @@ class OrderStatusUpdate(graphene.Mutation):
         )
 
 
+class BulkOrderStatusUpdate(graphene.Mutation):
+    """
+        change the status of all open orders of a delivery date, optionally only orders in a given status
+    """
+
+    success = graphene.Boolean()
+    message = graphene.String()
+    count = graphene.Int()
+
+    class Arguments:
+        delivery_date = graphene.Date(required=True)
+        current_status = graphene.String()
+        status = graphene.String(required=True)
+        note = graphene.String()
+
+    @is_admin_user
+    def mutate(self, info, delivery_date, status, current_status=None, note=""):
+        if status not in InvoiceStatusChoices.values:
+            raise_graphql_error("Status not valid.", field_name="status")
+        orders = Order.objects.filter(delivery_date=delivery_date).exclude(
+            status__in=[InvoiceStatusChoices.CANCELLED, InvoiceStatusChoices.DELIVERED]
+        )
+        if current_status:
+            orders = orders.filter(status=current_status)
+        with transaction.atomic():
+            company_orders = {}
+            for id, company_id in orders.select_for_update().values_list('id', 'company_id'):
+                company_orders.setdefault(company_id, []).append(id)
+            ids = [id for order_ids in company_orders.values() for id in order_ids]
+            OrderStatus.objects.bulk_create([OrderStatus(order_id=id, status=status, note=note) for id in ids])
+            Order.objects.filter(id__in=ids).update(status=status, note=note, updated_on=timezone.now())
+            for company_id, order_ids in company_orders.items():
+                publish_event([get_company_channel(company_id)], 'order-status', {'ids': order_ids, 'status': status})
+            if ids:
+                publish_event([ADMINS_CHANNEL], 'order-status', {'ids': ids, 'status': status})
+        if ids:
+            notify_company_orders_update.delay(ids, status)
+            if status == InvoiceStatusChoices.DELIVERED:
+                vendors_sold_amount_calculation.delay(ids)
+        return BulkOrderStatusUpdate(
+            success=True,
+            message="Successfully updated",
+            count=len(ids)
+        )
+
+
 class OrderHistoryDelete(graphene.Mutation):
     """
     """
@@ -459,6 +517,7 @@ class OrderHistoryDelete(graphene.Mutation):
         obj.is_deleted = True
         obj.deleted_on = timezone.now()
         obj.save()
+        schedule_sales_rollups([obj.delivery_date])
         return OrderHistoryDelete(
             success=True,
             message="Successfully deleted",
@@ -504,6 +563,7 @@ class SalesHistoryDelete(graphene.Mutation):
         qs = SellCart.objects.filter(
             id__in=ids
         )
+        schedule_sales_rollups(qs.filter(order__isnull=False).values_list('date', flat=True).distinct())
         qs.update(is_deleted=True, deleted_on=timezone.now())
         return SalesHistoryDelete(
             success=True,
@@ -620,6 +680,7 @@ class ConfirmUserCartUpdate(graphene.Mutation):
 
             company.invoice_amount += cart.order.company_due_amount - company_due_amount
             company.save()
+            schedule_sales_rollups([cart.date])
 
             user_cart_update_confirmed_notification.delay(obj.id)
         else:
@@ -651,6 +712,7 @@ class AddProductRating(DjangoFormMutation):
                 raise_graphql_error("User not permitted to rate this product.")
             form.cleaned_data['added_by'] = user
             obj = form.save()
+            expire_vendor_dashboards([obj.product.vendor_id])
             # notify_admin()
         else:
             error_data = {}
@@ -797,11 +859,33 @@ class ApplyCoupon(graphene.Mutation):
         order.discount_amount = amount_discounted
         order.coupon = coupon
         order.save()
+        schedule_sales_rollups([order.delivery_date])
         return ApplyCoupon(
             success=True, message="Successfully applied"
         )
 
 
+class ExportToFile(graphene.Mutation):
+    """
+        export a listing as csv in background, the download link is sent by mail
+    """
+    success = graphene.Boolean()
+    message = graphene.String()
+
+    class Arguments:
+        name = graphene.String(required=True)
+        filters = GenericScalar()
+
+    @is_authenticated
+    def mutate(self, info, name, filters=None, **kwargs):
+        if name not in EXPORTS:
+            raise_graphql_error("Please select a valid option.", field_name="name")
+        export_csv_to_file.delay(name, info.context.user.id, filters or {}, info.context.build_absolute_uri('/'))
+        return ExportToFile(
+            success=True, message="Export started, the download link will be sent by mail."
+        )
+
+
 class Mutation(graphene.ObjectType):
     """
         define all the mutations by identifier name for query
@@ -823,6 +907,7 @@ class Mutation(graphene.ObjectType):
 
     place_order = OrderCreation.Field()
     order_status_update = OrderStatusUpdate.Field()
+    bulk_order_status_update = BulkOrderStatusUpdate.Field()
     order_history_delete = OrderHistoryDelete.Field()
     apply_coupon = ApplyCoupon.Field()
 
@@ -830,3 +915,4 @@ class Mutation(graphene.ObjectType):
     payment_history_delete = PaymentHistoryDelete.Field()
     make_online_payment = MakeOnlinePaymentMutation.Field()
     initiate_pending_payment = InitiatePendingPayment.Field()
+    export_to_file = ExportToFile.Field()
@@ -1,6 +1,8 @@
 
 # third party imports
 import graphene
+from django.db.models import BooleanField, Value
+from graphene.types.generic import GenericScalar
 from graphene_django import DjangoObjectType
 from graphene_django.filter import DjangoFilterConnectionField
 
@@ -16,11 +18,13 @@ from apps.sales.filters import (
     SellCartFilters,
     UserCartFilters,
 )
+from apps.sales.utils import get_archived_order_graph
 from backend.count_connection import CountConnection
 
 from ..users.object_types import VendorType
 from .models import (
     AlterCart,
+    ArchivedOrder,
     BillingAddress,
     Order,
     OrderPayment,
@@ -32,6 +36,58 @@ from .models import (
 )
 
 
+class PrefetchedFilterConnectionField(DjangoFilterConnectionField):
+    """
+        filter connection field whose resolver may return an already fetched list of objects.
+        the list is paginated in memory, when filter arguments are given it falls back to a queryset.
+    """
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, filtering_args, filterset_class):
+        if isinstance(iterable, list):
+            if all(args.get(arg) is None for arg in filtering_args):
+                return iterable
+            model = connection._meta.node._meta.model
+            iterable = model.objects.filter(id__in=[obj.id for obj in iterable])
+        return super().resolve_queryset(connection, iterable, info, args, filtering_args, filterset_class)
+
+
+class ArchiveFilterConnectionField(DjangoFilterConnectionField):
+    """
+        filter connection field with an opt-in `includeArchived` argument.
+        the resolver then returns the live and the archived queryset as a tuple,
+        both are filtered with the same filter-set and combined with union,
+        archived rows are marked with `is_archived`.
+    """
+
+    def __init__(self, type_, *args, **kwargs):
+        kwargs.setdefault('include_archived', graphene.Boolean())
+        super().__init__(type_, *args, **kwargs)
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, filtering_args, filterset_class):
+        if not isinstance(iterable, tuple):
+            return super().resolve_queryset(connection, iterable, info, args, filtering_args, filterset_class)
+        qs, archived_qs = [
+            super(ArchiveFilterConnectionField, cls).resolve_queryset(
+                connection, queryset, info, args, filtering_args, filterset_class
+            ) for queryset in iterable
+        ]
+        # a union can only be ordered by its own columns
+        field_names = [field.name for field in qs.model._meta.concrete_fields]
+        ordering = [
+            name for name in qs.query.order_by or qs.model._meta.ordering
+            if isinstance(name, str) and name.lstrip('-') in field_names
+        ] or ['-id']
+        archive_only = [
+            field.name for field in archived_qs.model._meta.concrete_fields if field.name not in field_names
+        ]
+        return qs.order_by().annotate(is_archived=Value(False, output_field=BooleanField())).union(
+            archived_qs.order_by().defer(*archive_only).annotate(is_archived=Value(True, output_field=BooleanField())),
+            all=True
+        ).order_by(*ordering)
+
+
 class PaymentMethodType(DjangoObjectType):
     """
         define django object type for PaymentMethod model with PaymentMethod filter-set
@@ -54,6 +110,7 @@ class SellCartType(DjangoObjectType):
     ordered_quantity = graphene.Int()
     due_amount = graphene.Decimal()
     vendor = graphene.Field(VendorType)
+    is_archived = graphene.Boolean()
 
     class Meta:
         model = SellCart
@@ -65,6 +122,15 @@ class SellCartType(DjangoObjectType):
     def resolve_ordered_quantity(self, info, **kwargs):
         return self.ordered_quantity
 
+    def resolve_order(self, info, **kwargs):
+        if getattr(self, 'is_archived', False):
+            archived = ArchivedOrder.objects.filter(id=self.order_id).first()
+            return archived.as_order() if archived else None
+        return self.order
+
+    def resolve_is_archived(self, info, **kwargs):
+        return getattr(self, 'is_archived', False)
+
     def resolve_vendor(self, info, **kwargs):
         return self.item.vendor
 
@@ -110,6 +176,8 @@ class OrderType(DjangoObjectType):
     due_amount = graphene.Decimal()
     company_due_amount = graphene.Decimal()
     employee_due_amount = graphene.Decimal()
+    is_archived = graphene.Boolean()
+    archived_graph = GenericScalar()
 
     class Meta:
         model = Order
@@ -118,6 +186,17 @@ class OrderType(DjangoObjectType):
         convert_choices_to_enum = False
         connection_class = CountConnection
 
+    def resolve_is_archived(self, info, **kwargs):
+        return getattr(self, 'is_archived', False)
+
+    def resolve_archived_graph(self, info, **kwargs):
+        """
+            statuses, billing address, payments and carts of an archived order, its live relations are empty
+        """
+        if getattr(self, 'is_archived', False):
+            return get_archived_order_graph(self.id)
+        return None
+
 
 class OrderStatusType(DjangoObjectType):
     """
@@ -187,4 +266,4 @@ class ProductRatingType(DjangoObjectType):
 class AddedCartsListType(graphene.ObjectType):
     date = graphene.Date()
     total_price = graphene.Decimal()
-    carts = DjangoFilterConnectionField(SellCartType)
+    carts = PrefetchedFilterConnectionField(SellCartType)
@@ -1,26 +1,42 @@
 # third party imports
+from decimal import Decimal
 
 import graphene
 from django.contrib.auth import get_user_model
-from django.db.models import Q, Sum
+from django.db.models import Count, DecimalField, F, Q, Sum
 from graphene.types.generic import GenericScalar
 from graphene_django.filter.fields import DjangoFilterConnectionField
 
+from apps.bases.utils import raise_graphql_error
 from apps.scm.models import Product
 from apps.scm.object_types import ProductType
 from apps.users.choices import RoleTypeChoices
 from backend.permissions import is_authenticated, is_company_user
 
-from .models import Order, OrderPayment, PaymentMethod, ProductRating, SellCart
+from .models import (
+    ArchivedOrder,
+    Order,
+    OrderPayment,
+    PaymentMethod,
+    ProductRating,
+    SellCart,
+)
 from .object_types import (
     AddedCartsListType,
+    ArchiveFilterConnectionField,
     OrderPaymentType,
     OrderType,
     PaymentMethodType,
     ProductRatingType,
     SellCartType,
 )
-from .tasks import get_payment_info
+from .tasks import get_cached_payment_info
+from .utils import (
+    get_production_manifest,
+    get_user_order_payments,
+    get_user_orders,
+    get_user_sales_histories,
+)
 
 # local imports
 
@@ -34,11 +50,11 @@ class Query(graphene.ObjectType):
     payment_methods = DjangoFilterConnectionField(PaymentMethodType)
     payment_method = graphene.Field(PaymentMethodType, id=graphene.ID())
     added_carts = DjangoFilterConnectionField(SellCartType)
-    sales_histories = DjangoFilterConnectionField(SellCartType)
+    sales_histories = ArchiveFilterConnectionField(SellCartType)
     added_products = DjangoFilterConnectionField(ProductType)
     added_employee_carts = DjangoFilterConnectionField(SellCartType)
     cart = graphene.Field(SellCartType, id=graphene.ID())
-    orders = DjangoFilterConnectionField(OrderType)
+    orders = ArchiveFilterConnectionField(OrderType)
     order = graphene.Field(OrderType, id=graphene.ID())
     order_payments = DjangoFilterConnectionField(OrderPaymentType)
     order_payment = graphene.Field(OrderPaymentType, id=graphene.ID())
@@ -47,17 +63,36 @@ class Query(graphene.ObjectType):
     added_carts_list = graphene.List(AddedCartsListType)
     get_online_payment_info = GenericScalar(id=graphene.ID())
     order_summary = GenericScalar(company_allowance=graphene.Int())
+    production_manifest = GenericScalar(date=graphene.Date(required=True), vendor=graphene.ID())
+
+    @is_authenticated
+    def resolve_production_manifest(self, info, date, vendor=None, **kwargs):
+        user = info.context.user
+        if user.is_admin:
+            if vendor and not str(vendor).isdigit():
+                raise_graphql_error("Invalid vendor.", field_name="vendor")
+        elif user.is_vendor:
+            vendor = user.vendor_id
+        else:
+            raise_graphql_error("User not permitted.")
+        return get_production_manifest(date, vendor)
 
     @is_company_user
     def resolve_order_summary(self, info, company_allowance, **kwargs):
         user = info.context.user
-        added_carts = SellCart.objects.filter(added_by=user, is_requested=False)
-        qty = added_carts.aggregate(t=Sum('quantity'))['t'] or 0
-        total_price = 0
-        sub_total_price = added_carts.aggregate(t=Sum('total_price'))['t'] or 0
-        total_price_with_tax = added_carts.aggregate(t=Sum('total_price_with_tax'))['t'] or 0
-        for cart in added_carts:
-            total_price += cart.total_price_with_tax - (cart.price_with_tax * (100 - company_allowance) / 100 * cart.added_for.count())
+        summary = SellCart.objects.filter(added_by=user, is_requested=False).annotate(
+            staff_count=Count('added_for')
+        ).aggregate(
+            qty=Sum('quantity'),
+            sub_total=Sum('total_price'),
+            total=Sum('total_price_with_tax'),
+            staff_price=Sum(F('price_with_tax') * F('staff_count'), output_field=DecimalField()),
+        )
+        qty = summary['qty'] or 0
+        sub_total_price = summary['sub_total'] or 0
+        total_price_with_tax = summary['total'] or 0
+        staff_price = summary['staff_price'] or Decimal(0)
+        total_price = total_price_with_tax - (staff_price * (100 - company_allowance) / 100)
         return {
             'quantity': qty,
             'subTotal': str(sub_total_price),
@@ -68,7 +103,7 @@ class Query(graphene.ObjectType):
         }
 
     def resolve_get_online_payment_info(self, info, id, **kwargs):
-        online_payment = get_payment_info(id)
+        online_payment = get_cached_payment_info(id)
         return online_payment.session_data if online_payment else False
 
     @is_authenticated
@@ -90,41 +125,32 @@ class Query(graphene.ObjectType):
         return qs.last()
 
     @is_authenticated
-    def resolve_orders(self, info, **kwargs):
-        user = info.context.user
-        qs = Order.objects.filter(is_deleted=False)
-        if user.is_admin:
-            qs = qs
-        else:
-            qs = qs.filter(company=user.company)
-            if user.role == RoleTypeChoices.COMPANY_EMPLOYEE:
-                qs = qs.filter(
-                    id__in=user.cart_items.filter(cart__order__isnull=False).values_list('cart__order_id', flat=True)
-                )
+    def resolve_orders(self, info, include_archived=False, **kwargs):
+        qs, archived_qs = get_user_orders(info.context.user)
+        if include_archived:
+            return qs, archived_qs
         return qs
 
     @is_authenticated
     def resolve_order(self, info, id, **kwargs):
         user = info.context.user
         qs = Order.objects.filter(is_deleted=False)
+        archived_qs = ArchivedOrder.objects.filter(is_deleted=False, id=id)
         if user.is_admin:
             qs = qs.filter(id=id)
             qs.update(is_checked=True)
         else:
             qs = qs.filter(company=user.company, id=id)
-        return qs.last()
+            archived_qs = archived_qs.filter(company=user.company)
+        order = qs.last()
+        if not order:
+            archived = archived_qs.first()
+            order = archived.as_order() if archived else None
+        return order
 
     @is_authenticated
     def resolve_order_payments(self, info, **kwargs):
-        user = info.context.user
-        qs = OrderPayment.objects.order_by('-created_on')
-        if user.is_admin:
-            qs = qs
-        elif user.role in [RoleTypeChoices.COMPANY_OWNER, RoleTypeChoices.COMPANY_MANAGER]:
-            qs = qs.filter(Q(company=user.company) | Q(payment_for=user))
-        else:
-            qs = qs.filter(payment_for=user)
-        return qs
+        return get_user_order_payments(info.context.user)
 
     @is_authenticated
     def resolve_order_payment(self, info, id, **kwargs):
@@ -165,32 +191,24 @@ class Query(graphene.ObjectType):
         return qs
 
     @is_authenticated
-    def resolve_sales_histories(self, info, **kwargs):
-        user = info.context.user
-        qs = SellCart.objects.filter(item__vendor__isnull=False, order__isnull=False, order__is_deleted=False)
-        if user.is_admin:
-            pass
-        elif user.is_vendor:
-            qs = qs.filter(item__vendor=user.vendor)
-        else:
-            qs = qs.filter(id=None)
+    def resolve_sales_histories(self, info, include_archived=False, **kwargs):
+        qs, archived_qs = get_user_sales_histories(info.context.user)
+        if include_archived:
+            return qs, archived_qs
         return qs
 
     @is_authenticated
     def resolve_added_carts_list(self, info, **kwargs):
         user = info.context.user
         qs = SellCart.objects.filter(added_by=user, is_requested=False)
-        dates = qs.order_by('date').values_list('date', flat=True).distinct()
-        new_qs = []
-        for date in dates:
-            new_qs.append(
-                AddedCartsListType(
-                    date=date,
-                    total_price=qs.filter(date=date).aggregate(t=Sum('total_price_with_tax'))['t'],
-                    carts=qs.filter(date=date)
-                )
-            )
-        return new_qs
+        totals = qs.order_by('date').values_list('date').annotate(t=Sum('total_price_with_tax'))
+        date_carts = {}
+        for cart in qs.select_related('item__vendor').order_by('date', 'id'):
+            date_carts.setdefault(cart.date, []).append(cart)
+        return [
+            AddedCartsListType(date=date, total_price=total_price, carts=date_carts.get(date, []))
+            for date, total_price in totals
+        ]
 
     @is_authenticated
     def resolve_added_products(self, info, **kwargs):
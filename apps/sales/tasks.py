@@ -1,31 +1,57 @@
+import csv
+import datetime
+import secrets
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+
 import requests
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import F
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q, Sum
+from django.urls import reverse
+from django.utils import timezone
 
+from apps.analytics.tasks import schedule_sales_rollups
+from apps.analytics.utils import expire_vendor_dashboards
 from apps.notifications.tasks import notify_employee_cart, notify_vendor_product
-from apps.sales.choices import InvoiceStatusChoices, PaymentStatusChoices
-from apps.sales.models import OnlinePayment, Order, OrderPayment, SellCart, UserCart
+from apps.sales.choices import (
+    PENDING_SESSION_STATES,
+    InvoiceStatusChoices,
+    PaymentSessionStateChoices,
+    PaymentStatusChoices,
+)
+from apps.sales.models import (
+    AlterCart,
+    ArchivedOrder,
+    ArchivedSellCart,
+    BillingAddress,
+    OnlinePayment,
+    Order,
+    OrderPayment,
+    OrderStatus,
+    SellCart,
+    UserCart,
+)
 
 # local imports
+from apps.sales.utils import (
+    get_export_queryset,
+    get_export_rows,
+    get_export_storage,
+    get_export_token,
+)
+from apps.users.models import Vendor
 from backend.celery import app
+from backend.mail import send_mail
 
 User = get_user_model()
 
 
-def get_payment_info(payment_id):
-    try:
-        online_payment = OnlinePayment.objects.get(id=payment_id)
-        session_state = online_payment.session_data.get('sessionState')
-    except Exception:
-        return None
-    if session_state == "PaymentSuccessful":
-        return online_payment
-    elif session_state == "PaymentTerminated":
-        return None
-    url = f"{settings.PAYMENT_SITE_URL}/checkout/v3/session/{payment_id}/"
-
-    headers = {
+def get_vipps_headers():
+    return {
         "Content-Type": "application/json; charset=utf-8",
         "Vipps-System-Name": settings.VIPPS_SYSTEM_NAME,
         "Vipps-System-Version": settings.VIPPS_SYSTEM_VERSION,
@@ -37,24 +63,83 @@ def get_payment_info(payment_id):
         "Merchant-Serial-Number": settings.VIPPS_MERCHANT_SERIAL_NUMBER,
     }
 
-    response = requests.get(url, headers=headers)
 
+def fetch_payment_session(payment_id, session=None):
+    """
+        fetch the checkout session of an online payment from vipps, None if it could not be read
+    """
+    url = f"{settings.PAYMENT_SITE_URL}/checkout/v3/session/{payment_id}/"
+    try:
+        response = (session or requests).get(
+            url, headers=get_vipps_headers(), timeout=settings.VIPPS_REQUEST_TIMEOUT
+        )
+    except requests.RequestException as e:
+        getLogger().error(f"Session fetch of payment {payment_id} failed: {e}")
+        return None
     if response.status_code == 200:
-        print("Status Code", response.status_code)
-        online_payment.session_data = {**response.json(), **{'payment_id': online_payment.order_payment.id}}
-        online_payment.save()
-        if online_payment.session_data.get('sessionState') == "PaymentTerminated":
-            online_payment.order_payment.status = PaymentStatusChoices.CANCELLED
-            online_payment.order_payment.save()
-        if online_payment.session_data.get('sessionState') == "PaymentSuccessful":
-            order_payment = online_payment.order_payment
-            order_payment.status = PaymentStatusChoices.COMPLETED
-            order_payment.save()
-            if not order_payment.deduction:
-                make_previous_payment.delay(order_payment.id)
-    else:
-        print("Status Code", response.status_code)
-        print("JSON Response ", response.json())
+        return response.json()
+    getLogger().error(f"Session fetch of payment {payment_id} failed with status {response.status_code}")
+    return None
+
+
+def apply_payment_session(online_payment, session_data):
+    """
+        store a fetched checkout session and move the order payment forward.
+        transitions only happen from a pending order payment, so applying the same session twice is a no-op.
+    """
+    now = timezone.now()
+    order_payment_id = online_payment.order_payment_id
+    online_payment.session_data = {**session_data, **{'payment_id': order_payment_id}}
+    online_payment.session_state = online_payment.session_data.get('sessionState', "")
+    online_payment.checked_on = now
+    OnlinePayment.objects.filter(id=online_payment.id).update(
+        session_data=online_payment.session_data, session_state=online_payment.session_state,
+        checked_on=now, updated_on=now
+    )
+    pending_payment = OrderPayment.objects.filter(id=order_payment_id, status=PaymentStatusChoices.PENDING)
+    if online_payment.session_state == PaymentSessionStateChoices.PAYMENT_TERMINATED:
+        pending_payment.update(status=PaymentStatusChoices.CANCELLED, updated_on=now)
+    elif online_payment.session_state == PaymentSessionStateChoices.PAYMENT_SUCCESSFUL:
+        if pending_payment.update(status=PaymentStatusChoices.COMPLETED, updated_on=now):
+            make_previous_payment.delay(order_payment_id)
+    return online_payment
+
+
+def get_payment_info(payment_id):
+    try:
+        online_payment = OnlinePayment.objects.get(id=payment_id)
+    except Exception:
+        return None
+    if online_payment.session_state == PaymentSessionStateChoices.PAYMENT_SUCCESSFUL:
+        return online_payment
+    elif online_payment.session_state == PaymentSessionStateChoices.PAYMENT_TERMINATED:
+        return None
+    session_data = fetch_payment_session(payment_id)
+    if session_data:
+        apply_payment_session(online_payment, session_data)
+    return online_payment
+
+
+def get_cached_payment_info(payment_id):
+    """
+        read the stored checkout session without calling vipps.
+        a pending session not checked within PAYMENT_STATUS_REFRESH_SECONDS is handed to a worker for refresh,
+        the conditional update makes sure polling clients enqueue at most one refresh per window.
+    """
+    try:
+        online_payment = OnlinePayment.objects.get(id=payment_id)
+    except Exception:
+        return None
+    if online_payment.session_state == PaymentSessionStateChoices.PAYMENT_TERMINATED:
+        return None
+    if online_payment.session_state in PENDING_SESSION_STATES:
+        now = timezone.now()
+        stale_before = now - datetime.timedelta(seconds=settings.PAYMENT_STATUS_REFRESH_SECONDS)
+        claimed = OnlinePayment.objects.filter(
+            Q(checked_on__isnull=True) | Q(checked_on__lt=stale_before), id=online_payment.id
+        ).update(checked_on=now)
+        if claimed:
+            trigger_payment.delay(online_payment.id)
     return online_payment
 
 
@@ -63,17 +148,7 @@ def make_online_payment(payment_id):
     online_payment = OnlinePayment.objects.create(order_payment=payment)
 
     url = f"{settings.PAYMENT_SITE_URL}/checkout/v3/session/"
-    headers = {
-        "Content-Type": "application/json; charset=utf-8",
-        "Vipps-System-Name": settings.VIPPS_SYSTEM_NAME,
-        "Vipps-System-Version": settings.VIPPS_SYSTEM_VERSION,
-        "Vipps-System-Plugin-Name": settings.VIPPS_SYSTEM_PLUGIN_NAME,
-        "Vipps-System-Plugin-Version": settings.VIPPS_SYSTEM_PLUGIN_VERSION,
-        "client_id": settings.VIPPS_CLIENT_ID,
-        "client_secret": settings.VIPPS_CLIENT_SECRET,
-        "Ocp-Apim-Subscription-Key": settings.VIPPS_SUBSCRIPTION_KEY,
-        "Merchant-Serial-Number": settings.VIPPS_MERCHANT_SERIAL_NUMBER,
-    }
+    headers = get_vipps_headers()
     data = {
         "merchantInfo": {
             "callbackUrl": f"{settings.SITE_URL}/{settings.PAYMENT_CALLBACK_EXTENSION}/?ref={online_payment.id}",
@@ -117,6 +192,32 @@ def trigger_payment(id):
     get_payment_info(id)
 
 
+@app.task
+def reconcile_online_payments():
+    """
+        periodic sweep over online payments whose checkout session is still pending.
+        rows are picked through the (session_state, created_on) index and stamped as checked before polling,
+        vipps is polled with bounded concurrency and every transition is applied idempotently.
+    """
+    now = timezone.now()
+    stale_before = now - datetime.timedelta(seconds=settings.PAYMENT_STATUS_REFRESH_SECONDS)
+    payments = list(OnlinePayment.objects.filter(
+        Q(checked_on__isnull=True) | Q(checked_on__lt=stale_before),
+        session_state__in=PENDING_SESSION_STATES,
+        created_on__gte=now - datetime.timedelta(hours=settings.PAYMENT_RECONCILE_HORIZON_HOURS),
+    ).order_by('created_on')[:settings.PAYMENT_RECONCILE_BATCH_SIZE])
+    if not payments:
+        return
+    OnlinePayment.objects.filter(id__in=[payment.id for payment in payments]).update(checked_on=now)
+    with requests.Session() as session, ThreadPoolExecutor(
+        max_workers=settings.PAYMENT_RECONCILE_CONCURRENCY
+    ) as executor:
+        sessions = executor.map(lambda payment: fetch_payment_session(payment.id, session), payments)
+        for online_payment, session_data in zip(payments, sessions):
+            if session_data:
+                apply_payment_session(online_payment, session_data)
+
+
 @app.task
 def notify_user_carts(ids):
     # obj = Order.objects.get(id=id)
@@ -140,6 +241,20 @@ def vendor_sold_amount_calculation(id):
             vendor = cart.item.vendor
             vendor.sold_amount += cart.total_price_with_tax
             vendor.save()
+    expire_vendor_dashboards(carts.values_list('item__vendor_id', flat=True))
+
+
+@app.task
+def vendors_sold_amount_calculation(ids):
+    """
+        add the sold amount of many delivered orders to their vendors, one update per vendor
+    """
+    sold = SellCart.objects.filter(order_id__in=ids, item__vendor__isnull=False).order_by(
+        'item__vendor_id'
+    ).values_list('item__vendor_id').annotate(total=Sum('total_price_with_tax'))
+    for vendor_id, total in sold:
+        Vendor.objects.filter(id=vendor_id).update(sold_amount=F('sold_amount') + total)
+    expire_vendor_dashboards([vendor_id for vendor_id, _ in sold])
 
 
 @app.task
@@ -265,3 +380,158 @@ def make_previous_payment(id):
 
         company.paid_amount += total_due
         company.save()
+
+    # paid amounts of the settled orders are part of the daily sales rollups
+    dates = set(UserCart.objects.filter(
+        id__in=[deduction['cart'] for deduction in obj.deduction if 'cart' in deduction]
+    ).values_list('cart__date', flat=True))
+    dates.update(Order.objects.filter(
+        id__in=[deduction['order'] for deduction in obj.deduction if 'order' in deduction]
+    ).values_list('delivery_date', flat=True))
+    schedule_sales_rollups(dates)
+
+
+def get_archivable_orders():
+    """
+        delivered and fully paid orders older than the archive horizon.
+        orders whose carts were replaced by an alter cart of another order are kept.
+    """
+    horizon = timezone.now().date() - datetime.timedelta(days=settings.ORDER_ARCHIVE_AFTER_DAYS)
+    foreign_alter_carts = AlterCart.objects.filter(
+        previous_cart__order=OuterRef('pk')
+    ).exclude(base__cart__order=OuterRef('pk'))
+    return Order.objects.filter(
+        status=InvoiceStatusChoices.DELIVERED, is_full_paid=True, delivery_date__lt=horizon
+    ).exclude(Exists(foreign_alter_carts))
+
+
+def archive_order_batch(order_ids):
+    """
+        copy the orders and their carts into the archive tables, keep the rest of the graph
+        as json on the archived order and remove everything from the live tables.
+    """
+    with transaction.atomic():
+        # the criteria are checked again under the lock, an order may have changed since it was listed
+        orders = list(get_archivable_orders().select_for_update().filter(id__in=order_ids))
+        order_ids = [order.id for order in orders]
+        carts = list(SellCart._base_manager.filter(order_id__in=order_ids))
+        cart_ids = [cart.id for cart in carts]
+        graphs = {
+            order_id: {'statuses': [], 'billing_address': None, 'payments': [], 'carts': []}
+            for order_id in order_ids
+        }
+
+        for status in OrderStatus.objects.filter(order_id__in=order_ids).values():
+            graphs[status['order_id']]['statuses'].append(status)
+        for address in BillingAddress.objects.filter(order_id__in=order_ids).values():
+            graphs[address['order_id']]['billing_address'] = address
+        payment_orders = OrderPayment.orders.through.objects.filter(order_id__in=order_ids)
+        for order_id, payment_id in payment_orders.values_list('order_id', 'orderpayment_id'):
+            graphs[order_id]['payments'].append(payment_id)
+
+        cart_graphs = {}
+        for cart in carts:
+            cart_graphs[cart.id] = {'id': cart.id, 'users': []}
+            graphs[cart.order_id]['carts'].append(cart_graphs[cart.id])
+        for name in ['added_for', 'cancelled_by', 'ingredients']:
+            field = SellCart._meta.get_field(name)
+            for cart_graph in cart_graphs.values():
+                cart_graph[name] = []
+            rows = field.remote_field.through.objects.filter(**{f'{field.m2m_column_name()}__in': cart_ids})
+            for cart_id, related_id in rows.values_list(field.m2m_column_name(), field.m2m_reverse_name()):
+                cart_graphs[cart_id][name].append(related_id)
+
+        user_carts = {}
+        for user_cart in UserCart.objects.filter(cart_id__in=cart_ids).values():
+            user_cart.update(ingredients=[], payments=[], alter_cart=None)
+            user_carts[user_cart['id']] = user_cart
+            cart_graphs[user_cart['cart_id']]['users'].append(user_cart)
+        ingredients = UserCart.ingredients.through.objects.filter(usercart_id__in=user_carts)
+        for user_cart_id, ingredient_id in ingredients.values_list('usercart_id', 'ingredient_id'):
+            user_carts[user_cart_id]['ingredients'].append(ingredient_id)
+        payment_carts = OrderPayment.user_carts.through.objects.filter(usercart_id__in=user_carts)
+        for user_cart_id, payment_id in payment_carts.values_list('usercart_id', 'orderpayment_id'):
+            user_carts[user_cart_id]['payments'].append(payment_id)
+        for alter_cart in AlterCart.objects.filter(base_id__in=user_carts).values():
+            user_carts[alter_cart['base_id']]['alter_cart'] = alter_cart
+
+        order_fields = [field.attname for field in Order._meta.concrete_fields]
+        ArchivedOrder.objects.bulk_create([
+            ArchivedOrder(graph=graphs[order.id], **{name: getattr(order, name) for name in order_fields})
+            for order in orders
+        ])
+        cart_fields = [field.attname for field in SellCart._meta.concrete_fields]
+        ArchivedSellCart.objects.bulk_create([
+            ArchivedSellCart(**{name: getattr(cart, name) for name in cart_fields}) for cart in carts
+        ])
+
+        # alter carts, m2m rows and payment links are removed through cascades
+        AlterCart.objects.filter(previous_cart_id__in=cart_ids).delete()
+        UserCart.objects.filter(id__in=user_carts).delete()
+        SellCart._base_manager.filter(id__in=cart_ids).delete()
+        OrderStatus.objects.filter(order_id__in=order_ids).delete()
+        Order._base_manager.filter(id__in=order_ids).delete()
+    return len(order_ids)
+
+
+@app.task
+def archive_orders():
+    """
+        move closed orders with their cart graph into the archive tables in batches
+    """
+    archived = 0
+    orders = get_archivable_orders().order_by('id')
+    while True:
+        order_ids = list(orders.values_list('id', flat=True)[:settings.ORDER_ARCHIVE_BATCH_SIZE])
+        if not order_ids:
+            break
+        archived += archive_order_batch(order_ids)
+    return archived
+
+
+@app.task
+def export_csv_to_file(name, user_id, data, base_url):
+    """
+        write a large export into the private export storage under a random name
+        and mail a signed, expiring download link to the user
+    """
+    user = User.objects.get(id=user_id)
+    qs, errors = get_export_queryset(name, user, data)
+    if errors:
+        return errors
+    with tempfile.TemporaryFile(mode='w+', newline='') as export_file:
+        writer = csv.writer(export_file)
+        for row in get_export_rows(name, qs):
+            writer.writerow(row)
+        export_file.seek(0)
+        path = get_export_storage().save(f"{name}-{secrets.token_urlsafe(16)}.csv", File(export_file))
+    url = base_url.rstrip('/') + reverse('export-download', args=[get_export_token(name, path)])
+    body = """
+    <html>
+    <head></head>
+    <body>
+      <p>Your {0} export is ready.</p>
+      <p><a href='{1}'>Download</a></p>
+      <p>The link is valid for {2} hours.</p>
+    </body>
+    </html>
+    """.format(name, url, settings.EXPORT_MAX_AGE // 3600)
+    send_mail("Export is ready", body, user.email)
+    return path
+
+
+@app.task
+def delete_expired_exports():
+    """
+        remove the exports whose download links are expired
+    """
+    export_storage = get_export_storage()
+    if not export_storage.exists(''):
+        return 0
+    expired_on = timezone.now() - datetime.timedelta(seconds=settings.EXPORT_MAX_AGE)
+    deleted = 0
+    for path in export_storage.listdir('')[1]:
+        if export_storage.get_modified_time(path) < expired_on:
+            export_storage.delete(path)
+            deleted += 1
+    return deleted
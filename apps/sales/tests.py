@@ -0,0 +1,378 @@
+import datetime
+import re
+import shutil
+import tempfile
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from apps.notifications.models import MailOutbox
+from apps.scm.models import Ingredient, Product
+from apps.users.choices import RoleTypeChoices
+from apps.users.models import AccessToken, Company, User, Vendor
+from backend.schema import schema
+
+from .choices import (
+    InvoiceStatusChoices,
+    PaymentSessionStateChoices,
+    PaymentStatusChoices,
+    PaymentTypeChoices,
+)
+from .models import (
+    ArchivedOrder,
+    ArchivedSellCart,
+    OnlinePayment,
+    Order,
+    OrderPayment,
+    OrderStatus,
+    SellCart,
+    UserCart,
+)
+from .query import Query
+from .tasks import (
+    archive_order_batch,
+    delete_expired_exports,
+    export_csv_to_file,
+    reconcile_online_payments,
+)
+from .utils import get_export_storage, get_production_manifest
+
+
+class OrderSummaryTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        company = Company.objects.create(name="Summary", working_email="summary@example.com")
+        cls.user = User.objects.create_user(
+            email="owner@example.com", password="x", company=company, role=RoleTypeChoices.COMPANY_OWNER
+        )
+        staffs = [User.objects.create_user(email=f"staff{i}@example.com", password="x", company=company)
+                  for i in range(3)]
+        product = Product.objects.create(name="Lunch", description="Lunch", price_with_tax=125)
+        for i, staff_count in enumerate([0, 1, 3]):
+            cart = SellCart.objects.create(
+                item=product, added_by=cls.user, date=datetime.date(2026, 1, i + 1), quantity=4,
+                price=100, price_with_tax=Decimal("12.5") * (i + 1)
+            )
+            cart.added_for.add(*staffs[:staff_count])
+        # requested carts are not part of the summary
+        SellCart.objects.create(
+            item=product, added_by=cls.user, date=datetime.date(2026, 1, 5), quantity=9, price=100,
+            price_with_tax=100, is_requested=True
+        )
+
+    def test_summary_is_one_query(self):
+        info = SimpleNamespace(context=SimpleNamespace(user=self.user))
+        with self.assertNumQueries(1):
+            summary = Query.resolve_order_summary(None, info, company_allowance=15)
+        self.assertEqual(summary['quantity'], 12)
+        self.assertEqual(Decimal(summary['total']), Decimal(300))
+        # staff price is 12.5 * 0 + 25 * 1 + 37.5 * 3 = 137.5, of which the company pays 15%
+        self.assertEqual(Decimal(summary['companyDue']), Decimal(300) - Decimal("137.5") * 85 / 100)
+        self.assertEqual(Decimal(summary['employeeDue']), Decimal("137.5") * 85 / 100)
+
+
+class AddedCartsListTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="carts@example.com", password="x")
+        vendor = Vendor.objects.create(name="Carts")
+        product = Product.objects.create(name="Lunch", description="Lunch", price_with_tax=10, vendor=vendor)
+        cls.carts = [
+            SellCart.objects.create(item=product, added_by=cls.user, date=datetime.date(2026, 3, day), quantity=2,
+                                    price_with_tax=10)
+            for day in [2, 1, 2, 1, 2]
+        ]
+
+    def test_list_is_two_queries(self):
+        query = """{ addedCartsList { date totalPrice carts { edges { node { id item { name vendor { name } } } } } } }"""
+        with self.assertNumQueries(2):
+            result = schema.execute(query, context_value=SimpleNamespace(user=self.user))
+        self.assertIsNone(result.errors)
+        dates = result.data['addedCartsList']
+        self.assertEqual([(date['date'], Decimal(date['totalPrice'])) for date in dates], [
+            ("2026-03-01", 40), ("2026-03-02", 60)
+        ])
+        # carts of a date come in id order, as the unordered per date querysets did before
+        self.assertEqual(
+            [int(edge['node']['id']) for edge in dates[1]['carts']['edges']],
+            [self.carts[0].id, self.carts[2].id, self.carts[4].id]
+        )
+
+
+class ProductionManifestExportTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="admin@example.com", password="x")
+        cls.user.is_staff = True
+        cls.user.save()
+        AccessToken.objects.create(user=cls.user, token="admin-token")
+
+    def get(self, vendor):
+        return self.client.get(
+            f"/manifest/2026-01-01/csv/?vendor={vendor}", HTTP_AUTHORIZATION="JWT admin-token"
+        )
+
+    def test_invalid_vendor_is_rejected(self):
+        self.assertEqual(self.get("abc").status_code, 400)
+
+    def test_valid_vendor(self):
+        self.assertEqual(self.get("1").status_code, 200)
+
+
+class ProductionManifestTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        date = cls.date = datetime.date(2026, 2, 2)
+        company = Company.objects.create(name="Manifest", working_email="manifest@example.com")
+        user = User.objects.create_user(email="manifest@example.com", password="x", company=company)
+        cls.employee = User.objects.create_user(
+            email="employee@example.com", password="x", company=company, first_name="Ola", last_name="Nordmann"
+        )
+        nuts = Ingredient.objects.create(name="Nuts")
+        cls.employee.allergies.add(nuts)
+        cls.vendor, other_vendor = Vendor.objects.create(name="Kitchen"), Vendor.objects.create(name="Bakery")
+        cls.soup = Product.objects.create(name="Soup", description="Soup", price_with_tax=10, vendor=cls.vendor)
+        salad = Product.objects.create(name="Salad", description="Salad", price_with_tax=10, vendor=cls.vendor)
+        cls.bread = Product.objects.create(name="Bread", description="Bread", price_with_tax=10, vendor=other_vendor)
+        orders = [Order.objects.create(company=company, created_by=user, delivery_date=date) for _ in range(2)]
+        cancelled = Order.objects.create(
+            company=company, created_by=user, delivery_date=date, status=InvoiceStatusChoices.CANCELLED
+        )
+
+        def cart(item, quantity, order, cancelled=0, date=date):
+            return SellCart.objects.create(
+                item=item, added_by=user, date=date, quantity=quantity, cancelled=cancelled, order=order
+            )
+
+        soup = cart(cls.soup, 3, orders[0], cancelled=1)
+        soup.ingredients.add(nuts)
+        UserCart.objects.create(cart=soup, added_for=cls.employee)
+        cart(cls.soup, 2, orders[1])
+        cart(cls.soup, 7, None)  # not ordered
+        cart(cls.soup, 9, orders[0], date=date + datetime.timedelta(days=1))
+        cart(salad, 5, cancelled)
+        cart(cls.bread, 4, orders[0])
+
+    def test_vendor_manifest(self):
+        manifest = get_production_manifest(self.date, self.vendor.id)
+        self.assertEqual(manifest['totalQuantity'], 4)
+        self.assertEqual(manifest['items'], [{
+            'vendorId': self.vendor.id, 'vendor': "Kitchen", 'productId': self.soup.id, 'product': "Soup",
+            'quantity': 4, 'orders': 2, 'exclusions': [{
+                'employeeId': self.employee.id, 'employee': "Ola Nordmann", 'company': "Manifest",
+                'ingredients': ["Nuts"],
+            }],
+        }])
+
+    def test_all_vendors(self):
+        manifest = get_production_manifest(self.date)
+        self.assertEqual(manifest['totalQuantity'], 8)
+        self.assertEqual(
+            [(item['product'], item['quantity']) for item in manifest['items']], [("Bread", 4), ("Soup", 4)]
+        )
+
+
+class ArchivedColumnsTest(SimpleTestCase):
+
+    def test_archive_mirrors_live_columns(self):
+        # the archived rows are combined with the live ones by union, which matches columns by position
+        for model, archived_model in [(Order, ArchivedOrder), (SellCart, ArchivedSellCart)]:
+            with self.subTest(model.__name__):
+                columns = [field.attname for field in model._meta.concrete_fields]
+                archived_columns = [field.attname for field in archived_model._meta.concrete_fields]
+                self.assertEqual(archived_columns[:len(columns)], columns)
+
+
+class ArchivedOrderTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        company = Company.objects.create(name="Archive", working_email="archive@example.com")
+        cls.user = User.objects.create_user(
+            email="archive@example.com", password="x", company=company, role=RoleTypeChoices.COMPANY_OWNER
+        )
+        AccessToken.objects.create(user=cls.user, token="owner-token")
+        admin = User.objects.create_user(email="archive-admin@example.com", password="x")
+        admin.is_staff = True
+        admin.save()
+        AccessToken.objects.create(user=admin, token="admin-token")
+        vendor = Vendor.objects.create(name="Kitchen")
+        product = Product.objects.create(name="Lunch", description="Lunch", price_with_tax=125, vendor=vendor)
+        cls.order = Order.objects.create(
+            company=company, created_by=cls.user, delivery_date=datetime.date(2020, 1, 1),
+            status=InvoiceStatusChoices.DELIVERED, is_full_paid=True
+        )
+        OrderStatus.objects.create(order=cls.order, status=InvoiceStatusChoices.DELIVERED)
+        cls.cart = SellCart.objects.create(
+            item=product, added_by=cls.user, date=datetime.date(2020, 1, 1), quantity=2, price=100,
+            price_with_tax=125, order=cls.order
+        )
+        # not archivable, still due
+        cls.open_order = Order.objects.create(
+            company=company, created_by=cls.user, delivery_date=datetime.date(2020, 1, 1),
+            status=InvoiceStatusChoices.DELIVERED
+        )
+
+    def query(self, query, token="owner-token"):
+        response = self.client.post(
+            "/graphql/", {"query": query}, content_type="application/json", HTTP_AUTHORIZATION=f"JWT {token}"
+        )
+        content = response.json()
+        self.assertNotIn("errors", content)
+        return content["data"]
+
+    def test_criteria_are_checked_under_lock(self):
+        archive_order_batch([self.open_order.id])
+        self.assertTrue(Order.objects.filter(id=self.open_order.id).exists())
+
+    def test_archived_order_is_readable(self):
+        archive_order_batch([self.order.id])
+        self.assertFalse(Order.objects.filter(id=self.order.id).exists())
+        orders = self.query(
+            "{ orders(includeArchived: true) { edges { node { id isArchived archivedGraph } } } }"
+        )["orders"]["edges"]
+        archived = [edge["node"] for edge in orders if edge["node"]["isArchived"]]
+        self.assertEqual(len(orders), 2)
+        self.assertEqual(len(archived), 1)
+        graph = archived[0]["archivedGraph"]
+        self.assertEqual([status["status"] for status in graph["statuses"]], [InvoiceStatusChoices.DELIVERED])
+        self.assertEqual(graph["carts"][0]["id"], self.cart.id)
+        self.assertEqual(graph["carts"][0]["quantity"], 2)
+
+        order = self.query(f'{{ order(id: {self.order.id}) {{ isArchived archivedGraph }} }}')["order"]
+        self.assertTrue(order["isArchived"])
+        self.assertEqual(order["archivedGraph"]["carts"][0]["id"], self.cart.id)
+
+        carts = self.query(
+            "{ salesHistories(includeArchived: true) { edges { node { isArchived order { id isArchived } } } } }", "admin-token"
+        )["salesHistories"]["edges"]
+        self.assertEqual(len(carts), 1)
+        self.assertTrue(carts[0]["node"]["isArchived"])
+        self.assertTrue(carts[0]["node"]["order"]["isArchived"])
+
+
+@override_settings(EXPORT_ROOT=tempfile.mkdtemp())
+class ExportTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.addClassCleanup(shutil.rmtree, settings.EXPORT_ROOT, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        company = Company.objects.create(name="Export", working_email="export@example.com")
+        cls.user = User.objects.create_user(
+            email="export@example.com", password="x", company=company, role=RoleTypeChoices.COMPANY_OWNER
+        )
+        AccessToken.objects.create(user=cls.user, token="export-token")
+        Order.objects.bulk_create(
+            Order(company=company, created_by=cls.user, delivery_date=datetime.date(2026, 1, 1)) for _ in range(5)
+        )
+
+    async def test_export_is_streamed(self):
+        response = await self.async_client.get("/export/orders/csv/", headers={"Authorization": "JWT export-token"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        content = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual(len(content.splitlines()), 6)
+
+    def test_export_is_streamed_under_wsgi(self):
+        response = self.client.get("/export/orders/csv/", HTTP_AUTHORIZATION="JWT export-token")
+        self.assertFalse(response.is_async)
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()), 6)
+
+    def test_export_file_is_served_through_signed_link(self):
+        path = export_csv_to_file('orders', self.user.id, {}, "http://testserver/")
+        link = re.search(r"href='http://testserver(\S+)'", MailOutbox.objects.get().body).group(1)
+        self.assertNotIn(path, link)
+
+        response = self.client.get(link)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()), 6)
+        self.assertEqual(self.client.get(link[:-2] + "x/").status_code, 404)
+        with override_settings(EXPORT_MAX_AGE=-1):
+            self.assertEqual(self.client.get(link).status_code, 404)
+            self.assertEqual(delete_expired_exports(), 1)
+        self.assertFalse(get_export_storage().exists(path))
+
+
+@override_settings(PAYMENT_STATUS_REFRESH_SECONDS=0)
+class ReconcileOnlinePaymentsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(email="payer@example.com", password="x")
+        cls.payments = {}
+        for name in ["captured", "aborted", "pending"]:
+            order_payment = OrderPayment.objects.create(created_by=user, payment_type=PaymentTypeChoices.ONLINE)
+            cls.payments[name] = OnlinePayment.objects.create(
+                order_payment=order_payment, session_data={'sessionState': PaymentSessionStateChoices.SESSION_CREATED}
+            )
+
+    def sweep(self, states):
+        ids = {payment.id: name for name, payment in self.payments.items()}
+        with mock.patch("apps.sales.tasks.fetch_payment_session",
+                        side_effect=lambda payment_id, session=None: {'sessionState': states[ids[payment_id]]}) as fetch, \
+                mock.patch("apps.sales.tasks.make_previous_payment.delay") as delay:
+            reconcile_online_payments()
+        return sorted(ids[call.args[0]] for call in fetch.call_args_list), delay
+
+    def get_statuses(self):
+        return {
+            name: (OrderPayment.objects.get(id=payment.order_payment_id).status,
+                   OnlinePayment.objects.get(id=payment.id).session_state)
+            for name, payment in self.payments.items()
+        }
+
+    def test_sessions_move_pending_payments_once(self):
+        states = {
+            'captured': PaymentSessionStateChoices.PAYMENT_SUCCESSFUL,
+            'aborted': PaymentSessionStateChoices.PAYMENT_TERMINATED,
+            'pending': PaymentSessionStateChoices.PAYMENT_INITIATED,
+        }
+        polled, delay = self.sweep(states)
+        self.assertEqual(polled, ['aborted', 'captured', 'pending'])
+        delay.assert_called_once_with(self.payments['captured'].order_payment_id)
+        self.assertEqual(self.get_statuses(), {
+            'captured': (PaymentStatusChoices.COMPLETED, PaymentSessionStateChoices.PAYMENT_SUCCESSFUL),
+            'aborted': (PaymentStatusChoices.CANCELLED, PaymentSessionStateChoices.PAYMENT_TERMINATED),
+            'pending': (PaymentStatusChoices.PENDING, PaymentSessionStateChoices.PAYMENT_INITIATED),
+        })
+
+        # finished sessions are left out of the next sweep, the pending one is polled again
+        states['pending'] = PaymentSessionStateChoices.PAYMENT_TERMINATED
+        polled, delay = self.sweep(states)
+        self.assertEqual(polled, ['pending'])
+        delay.assert_not_called()
+        self.assertEqual(self.get_statuses()['pending'][0], PaymentStatusChoices.CANCELLED)
+
+        # a finished session that is polled again does not move the payment a second time
+        OnlinePayment.objects.filter(id__in=[payment.id for payment in self.payments.values()]).update(
+            session_state=PaymentSessionStateChoices.PAYMENT_INITIATED
+        )
+        states['pending'] = states['aborted'] = PaymentSessionStateChoices.PAYMENT_SUCCESSFUL
+        polled, delay = self.sweep(states)
+        self.assertEqual(polled, ['aborted', 'captured', 'pending'])
+        delay.assert_not_called()
+        self.assertEqual({name: status for name, (status, _) in self.get_statuses().items()}, {
+            'captured': PaymentStatusChoices.COMPLETED,
+            'aborted': PaymentStatusChoices.CANCELLED,
+            'pending': PaymentStatusChoices.CANCELLED,
+        })
+
+    def test_unreadable_session_keeps_payment_pending(self):
+        with mock.patch("apps.sales.tasks.fetch_payment_session", return_value=None):
+            reconcile_online_payments()
+        self.assertEqual(
+            set(self.get_statuses().values()),
+            {(PaymentStatusChoices.PENDING, PaymentSessionStateChoices.SESSION_CREATED)}
+        )
+        self.assertEqual(OnlinePayment.objects.filter(checked_on__isnull=True).count(), 0)
@@ -0,0 +1,281 @@
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import FileSystemStorage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, F, Q, Sum
+
+from apps.users.choices import RoleTypeChoices
+
+from .choices import InvoiceStatusChoices
+from .filters import OrderFilters, OrderPaymentFilters, SellCartFilters
+from .models import (
+    ArchivedOrder,
+    ArchivedSellCart,
+    Order,
+    OrderPayment,
+    SellCart,
+    UserCart,
+)
+
+
+def get_user_orders(user):
+    """
+        live and archived orders visible to the user
+    """
+    qs = Order.objects.filter(is_deleted=False)
+    archived_qs = ArchivedOrder.objects.filter(is_deleted=False)
+    if user.is_admin:
+        qs = qs
+    else:
+        qs = qs.filter(company=user.company)
+        archived_qs = archived_qs.filter(company=user.company)
+        if user.role == RoleTypeChoices.COMPANY_EMPLOYEE:
+            qs = qs.filter(
+                id__in=user.cart_items.filter(cart__order__isnull=False).values_list('cart__order_id', flat=True)
+            )
+            # employee carts of archived orders are only kept in the order graph
+            archived_qs = archived_qs.none()
+    return qs, archived_qs
+
+
+def get_archived_order_graph(order_id):
+    """
+        statuses, billing address, payments and carts (with their user carts) of an archived order
+    """
+    graph = ArchivedOrder.objects.filter(id=order_id).values_list('graph', flat=True).first()
+    if graph is None:
+        return None
+    carts = {cart['id']: cart for cart in ArchivedSellCart.objects.filter(order_id=order_id).values()}
+    graph['carts'] = [{**carts.get(cart['id'], {}), **cart} for cart in graph['carts']]
+    # decimals and dates of the cart rows as json values
+    return json.loads(json.dumps(graph, cls=DjangoJSONEncoder))
+
+
+def get_user_order_payments(user):
+    """
+        order payments visible to the user
+    """
+    qs = OrderPayment.objects.order_by('-created_on')
+    if user.is_admin:
+        qs = qs
+    elif user.role in [RoleTypeChoices.COMPANY_OWNER, RoleTypeChoices.COMPANY_MANAGER]:
+        qs = qs.filter(Q(company=user.company) | Q(payment_for=user))
+    else:
+        qs = qs.filter(payment_for=user)
+    return qs
+
+
+def get_user_sales_histories(user):
+    """
+        live and archived sold carts visible to the user
+    """
+    qs = SellCart.objects.filter(item__vendor__isnull=False, order__isnull=False, order__is_deleted=False)
+    archived_qs = ArchivedSellCart.objects.filter(
+        is_deleted=False, item__vendor__isnull=False, order__is_deleted=False
+    )
+    if user.is_admin:
+        pass
+    elif user.is_vendor:
+        qs = qs.filter(item__vendor=user.vendor)
+        archived_qs = archived_qs.filter(item__vendor=user.vendor)
+    else:
+        qs = qs.filter(id=None)
+        archived_qs = archived_qs.none()
+    return qs, archived_qs
+
+
+# exportable listings with their scoped queryset, filter-set and (header, lookup) columns
+EXPORTS = {
+    'orders': (
+        lambda user: get_user_orders(user)[0],
+        OrderFilters,
+        [
+            ('Order', 'id'),
+            ('Created on', 'created_on'),
+            ('Delivery date', 'delivery_date'),
+            ('Company', 'company__name'),
+            ('Payment type', 'payment_type'),
+            ('Status', 'status'),
+            ('Actual price', 'actual_price'),
+            ('Discount', 'discount_amount'),
+            ('Shipping charge', 'shipping_charge'),
+            ('Final price', 'final_price'),
+            ('Paid amount', 'paid_amount'),
+            ('Full paid', 'is_full_paid'),
+        ],
+    ),
+    'order-payments': (
+        get_user_order_payments,
+        OrderPaymentFilters,
+        [
+            ('Payment', 'id'),
+            ('Created on', 'created_on'),
+            ('Company', 'company__name'),
+            ('Payment for', 'payment_for__email'),
+            ('Payment type', 'payment_type'),
+            ('Status', 'status'),
+            ('Paid amount', 'paid_amount'),
+            ('Note', 'note'),
+        ],
+    ),
+    'sales-histories': (
+        lambda user: get_user_sales_histories(user)[0],
+        SellCartFilters,
+        [
+            ('Cart', 'id'),
+            ('Date', 'date'),
+            ('Order', 'order_id'),
+            ('Order status', 'order__status'),
+            ('Product', 'item__name'),
+            ('Vendor', 'item__vendor__name'),
+            ('Quantity', 'quantity'),
+            ('Cancelled', 'cancelled'),
+            ('Price', 'price'),
+            ('Price with tax', 'price_with_tax'),
+            ('Total price', 'total_price'),
+            ('Total price with tax', 'total_price_with_tax'),
+        ],
+    ),
+}
+
+
+def get_export_queryset(name, user, data, request=None):
+    """
+        filter the scoped queryset of an export the same way as the graphql listing.
+        returns the queryset and the filter errors.
+    """
+    get_queryset, filterset_class, _ = EXPORTS[name]
+    filterset = filterset_class(data=data, queryset=get_queryset(user), request=request)
+    if not filterset.is_valid():
+        return None, filterset.errors
+    return filterset.qs, None
+
+
+def get_export_rows(name, qs):
+    """
+        yield the header and the rows of an export, fetched in chunks through a server side cursor
+    """
+    columns = EXPORTS[name][2]
+    yield [header for header, _ in columns]
+    rows = qs.values_list(*[lookup for _, lookup in columns])
+    yield from rows.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+class Echo:
+    """
+        file like object which returns what is written, used to stream csv rows
+    """
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+async def astream_csv(rows):
+    """
+        async csv stream for asgi, which would read a sync iterator fully before sending it.
+        the rows are fetched chunk by chunk in the sync thread which keeps the server side cursor open.
+    """
+    writer = csv.writer(Echo())
+    rows = iter(rows)
+    get_chunk = sync_to_async(lambda: list(islice(rows, settings.EXPORT_CHUNK_SIZE)))
+    while chunk := await get_chunk():
+        yield "".join(writer.writerow(row) for row in chunk)
+
+
+def get_export_storage():
+    """
+        exports written by the background task, kept out of the public media and served through signed links
+    """
+    return FileSystemStorage(location=settings.EXPORT_ROOT)
+
+
+EXPORT_SALT = "sales.export-download"
+
+
+def get_export_token(name, path):
+    return signing.dumps({'name': name, 'path': path}, salt=EXPORT_SALT)
+
+
+def get_export_file(token):
+    """
+        name and path of the export of a download token, none when the token is invalid or expired
+    """
+    try:
+        data = signing.loads(token, salt=EXPORT_SALT, max_age=settings.EXPORT_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    if not get_export_storage().exists(data['path']):
+        return None
+    return data['name'], data['path']
+
+
+def get_manifest_carts(date, vendor=None):
+    """
+        ordered (not cancelled) carts which must be delivered on the given date
+    """
+    qs = SellCart.objects.filter(
+        date=date, order__isnull=False, order__is_deleted=False
+    ).exclude(order__status=InvoiceStatusChoices.CANCELLED)
+    if vendor:
+        qs = qs.filter(item__vendor=vendor)
+    return qs
+
+
+def get_production_manifest(date, vendor=None):
+    """
+        what must be cooked for the given date, grouped per vendor and product
+        with the allergy exclusions of every employee
+    """
+    carts = get_manifest_carts(date, vendor)
+    items = carts.values(
+        'item_id', 'item__name', 'item__vendor_id', 'item__vendor__name'
+    ).annotate(
+        qty=Sum(F('quantity') - F('cancelled')),
+        order_count=Count('order', distinct=True),
+    ).filter(qty__gt=0).order_by('item__vendor__name', 'item__name')
+
+    # ingredients removed from an employee's meal are the cart ingredients matching user allergies
+    exclusions = {}
+    rows = UserCart.objects.filter(
+        cart__in=carts, added_for__allergies=F('cart__ingredients')
+    ).values_list(
+        'cart__item_id', 'added_for_id', 'added_for__first_name', 'added_for__last_name',
+        'added_for__company__name', 'added_for__allergies__name'
+    ).order_by('cart__item_id', 'added_for_id', 'added_for__allergies__name')
+    for item_id, user_id, first_name, last_name, company, ingredient in rows:
+        employees = exclusions.setdefault(item_id, {})
+        employee = employees.setdefault(user_id, {
+            'employeeId': user_id,
+            'employee': " ".join(filter(None, [first_name, last_name])),
+            'company': company,
+            'ingredients': [],
+        })
+        employee['ingredients'].append(ingredient)
+
+    manifest = []
+    for item in items:
+        manifest.append({
+            'vendorId': item['item__vendor_id'],
+            'vendor': item['item__vendor__name'],
+            'productId': item['item_id'],
+            'product': item['item__name'],
+            'quantity': item['qty'],
+            'orders': item['order_count'],
+            'exclusions': list(exclusions.get(item['item_id'], {}).values()),
+        })
+    return {
+        'date': str(date),
+        'totalQuantity': sum(item['quantity'] for item in manifest),
+        'items': manifest,
+    }
@@ -1,3 +1,95 @@
-# from django.shortcuts import render
+import csv
 
-# Create your views here.
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import require_GET
+
+from backend.authentication import Authentication
+
+from .utils import (
+    EXPORTS,
+    astream_csv,
+    get_export_file,
+    get_export_queryset,
+    get_export_rows,
+    get_export_storage,
+    get_production_manifest,
+    stream_csv,
+)
+
+
+@require_GET
+def production_manifest_export(request, date):
+    """
+        download the production manifest of a delivery date as csv
+    """
+    user = Authentication(request).authenticate()
+    if not user or not (user.is_admin or user.is_vendor):
+        return HttpResponseForbidden("You are not authorized user.")
+    try:
+        delivery_date = parse_date(date)
+    except ValueError:
+        delivery_date = None
+    if not delivery_date:
+        return HttpResponseBadRequest("Invalid date.")
+    vendor = request.GET.get('vendor') if user.is_admin else user.vendor_id
+    if user.is_admin and vendor and not vendor.isdigit():
+        return HttpResponseBadRequest("Invalid vendor.")
+    manifest = get_production_manifest(delivery_date, vendor)
+
+    response = HttpResponse(content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="manifest-{delivery_date}.csv"'
+    writer = csv.writer(response)
+    writer.writerow(['Vendor', 'Product', 'Quantity', 'Orders', 'Exclusions'])
+    for item in manifest['items']:
+        exclusions = "; ".join(
+            f"{employee['employee']} ({employee['company']}): {', '.join(employee['ingredients'])}"
+            for employee in item['exclusions']
+        )
+        writer.writerow([item['vendor'], item['product'], item['quantity'], item['orders'], exclusions])
+    return response
+
+
+@require_GET
+def export_csv(request, name):
+    """
+        stream a filtered listing as csv, query params are the filters of the graphql listing
+    """
+    if name not in EXPORTS:
+        raise Http404
+    user = Authentication(request).authenticate()
+    if not user:
+        return HttpResponseForbidden("You are not authorized user.")
+    qs, errors = get_export_queryset(name, user, request.GET, request)
+    if errors:
+        return JsonResponse(errors, status=400)
+    rows = get_export_rows(name, qs)
+    # each server reads the iterator of its own kind as it is produced
+    content = astream_csv(rows) if isinstance(request, ASGIRequest) else stream_csv(rows)
+    response = StreamingHttpResponse(content, content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{name}-{timezone.now().date()}.csv"'
+    return response
+
+
+@require_GET
+def download_export(request, token):
+    """
+        download an export written by the background task, the signed token is the permission
+    """
+    export = get_export_file(token)
+    if not export:
+        raise Http404
+    name, path = export
+    return FileResponse(
+        get_export_storage().open(path, 'rb'), as_attachment=True, filename=f"{name}-{timezone.now().date()}.csv"
+    )
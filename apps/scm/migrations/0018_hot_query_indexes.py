@@ -0,0 +1,26 @@
+# Generated by Django 5.0.3 on 2026-10-19 13:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scm', '0017_weeklyvariant_product_weekly_variants'),
+        ('users', '0016_clientdetails_email'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['order', '-created_on'], name='category_live_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['order', '-created_on'], name='product_live_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['vendor', 'order'], name='product_vendor_live_idx'),
+        ),
+    ]
@@ -61,6 +61,11 @@ class Category(BaseWithoutID, SoftDeletion):
         db_table = f"{settings.DB_PREFIX}_categories"  # define table name for database
         verbose_name_plural = 'Categories'
         ordering = ['order', '-created_on']  # define default order as id in descending
+        indexes = [
+            models.Index(
+                fields=['order', '-created_on'], condition=models.Q(is_deleted=False), name='category_live_order_idx'
+            ),
+        ]
         unique_together = ('name', 'parent')
 
     @classmethod
@@ -131,6 +136,14 @@ class Product(BaseWithoutID, BasePriceModel, SoftDeletion):
         ordering = ['order', '-created_on']  # define default order as id in descending
         verbose_name = 'Product'
         verbose_name_plural = 'Products'
+        indexes = [
+            models.Index(
+                fields=['order', '-created_on'], condition=models.Q(is_deleted=False), name='product_live_order_idx'
+            ),
+            models.Index(
+                fields=['vendor', 'order'], condition=models.Q(is_deleted=False), name='product_vendor_live_idx'
+            ),
+        ]
         # unique_together = ('title', 'category')
 
     def __str__(self):
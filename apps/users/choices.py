@@ -66,3 +66,13 @@ class WithdrawRequestChoices(models.TextChoices):
     ACCEPTED = 'accepted'
     CANCELLED = 'cancelled'
     COMPLETED = 'completed'
+
+
+class ImportStatusChoices(models.TextChoices):
+    """
+        define selection choices for import job status
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
@@ -50,6 +50,28 @@ class UserCreationForm(forms.ModelForm):
         ]
 
 
+class UserImportForm(forms.ModelForm):
+    """
+        row of a bulk staff import, uniqueness and allergies are checked for all rows at once
+    """
+
+    class Meta:
+        model = User
+        fields = [
+            'first_name',
+            'last_name',
+            'username',
+            'phone',
+            'email',
+            'gender',
+            'date_of_birth',
+            'role',
+        ]
+
+    def validate_unique(self):
+        pass
+
+
 class UserCreateForm(forms.ModelForm):
     # password = forms.CharField(required=False)
     id = forms.CharField(required=False)
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.3 on 2026-10-19 13:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0016_clientdetails_email'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['company', 'role'], name='user_company_role_idx'),
+        ),
+    ]
@@ -7,6 +7,7 @@ from django.contrib.auth.models import PermissionsMixin
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MaxValueValidator, RegexValidator
 from django.db import models
 from django.utils import timezone
@@ -27,6 +28,7 @@ from apps.users.choices import (
     CompanyStatusChoices,
     DeviceTypeChoices,
     GenderChoices,
+    ImportStatusChoices,
     RoleTypeChoices,
     SocialAccountTypeChoices,
     WithdrawRequestChoices,
@@ -358,6 +360,11 @@ class User(BaseWithoutID, AbstractBaseUser, SoftDeletion, PermissionsMixin):
     class Meta:
         db_table = f"{settings.DB_PREFIX}_users"  # define table name for database
         ordering = ['-created_on']  # define default filter as created in descending
+        indexes = [
+            models.Index(
+                fields=['company', 'role'], condition=models.Q(is_deleted=False), name='user_company_role_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"{self.pk}. {self.email}"
@@ -377,6 +384,13 @@ class User(BaseWithoutID, AbstractBaseUser, SoftDeletion, PermissionsMixin):
         self.is_verified = True
         self.is_email_verified = True
         self.save()
+        template, context, subject = self.get_verified_mail(password)
+        send_email_on_delay.delay(template, context, subject, self.email)  # will add later for sending verification
+
+    def get_verified_mail(self, password):
+        """
+            template, context and subject of the mail which sends the login password
+        """
         context = {
             'username': self.username,
             'user_name': self.full_name,
@@ -399,7 +413,7 @@ class User(BaseWithoutID, AbstractBaseUser, SoftDeletion, PermissionsMixin):
         else:
             template = 'emails/verification1.html'
         subject = 'Email Verification'
-        send_email_on_delay.delay(template, context, subject, self.email)  # will add later for sending verification
+        return template, context, subject
 
     def send_email_verification(self):
         token = create_token()
@@ -817,3 +831,27 @@ class WithdrawRequest(BaseWithoutID, SoftDeletion):
 
     class Meta:
         db_table = f"{settings.DB_PREFIX}_withdraw_requests"
+
+
+class UserImportJob(BaseWithoutID):
+    """
+        bulk staff import of a company, rows are validated before the job is queued
+        and removed when the import is completed.
+    """
+    company = models.ForeignKey(
+        to=Company, on_delete=models.CASCADE, related_name='import_jobs'
+    )
+    created_by = models.ForeignKey(
+        to=User, on_delete=models.SET_NULL, related_name='import_jobs', null=True
+    )
+    rows = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    status = models.CharField(
+        max_length=16, choices=ImportStatusChoices.choices, default=ImportStatusChoices.PENDING
+    )
+    error = models.TextField(blank=True, null=True)
+
+    class Meta:
+        db_table = f"{settings.DB_PREFIX}_user_import_jobs"
+        ordering = ['-id']  # define default order as id in descending
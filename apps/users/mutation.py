@@ -1,5 +1,9 @@
 # at backend/users/schema.py
 
+import io
+from collections import Counter
+from csv import DictReader
+
 import graphene
 from django.conf import settings
 from django.contrib.auth import get_user_model
@@ -7,6 +11,7 @@ from django.contrib.auth.password_validation import validate_password
 from django.db import transaction
 from django.db.models import F, Sum
 from django.utils import timezone
+from graphene.types.generic import GenericScalar
 from graphene_django.forms.mutation import DjangoFormMutation, DjangoModelFormMutation
 from graphql import GraphQLError
 
@@ -44,6 +49,7 @@ from .forms import (
     UserAccountForm,
     UserCreationForm,
     UserForm,
+    UserImportForm,
     UserRegisterForm,
     UserRegistrationForm,
     ValidCompanyForm,
@@ -62,6 +68,7 @@ from .models import (
     ResetPassword,
     UnitOfHistory,
     UserDeviceToken,
+    UserImportJob,
     Vendor,
     WithdrawRequest,
 )
@@ -72,10 +79,11 @@ from .object_types import (
     CompanyBillingAddressType,
     CompanyType,
     CouponType,
+    UserImportJobType,
     UserType,
     VendorType,
 )
-from .tasks import send_email_on_delay
+from .tasks import import_company_users, send_email_on_delay
 
 User = get_user_model()  # variable taken for User model
 
@@ -673,6 +681,86 @@ class UserCreationMutation(DjangoModelFormMutation):
         )
 
 
+class BulkUserImportMutation(graphene.Mutation):
+    """
+        import company staffs from a csv (header row with field names, allergies separated by `;`)
+        or a list of rows. every row is validated before the import job is queued.
+    """
+    job = graphene.Field(UserImportJobType)
+    success = graphene.Boolean()
+    message = graphene.String()
+
+    class Arguments:
+        rows = GenericScalar()
+        csv = graphene.String()
+
+    @is_company_user
+    def mutate(self, info, rows=None, csv=None, **kwargs):
+        user = info.context.user
+        if csv:
+            rows = list(DictReader(io.StringIO(csv)))
+        if not rows or not isinstance(rows, list):
+            raise_graphql_error("No staff added.", field_name="rows")
+        if len(rows) > settings.USER_IMPORT_MAX_ROWS:
+            raise_graphql_error(
+                f"At most {settings.USER_IMPORT_MAX_ROWS} staffs can be imported at once.", field_name="rows"
+            )
+        if user.role == RoleTypeChoices.COMPANY_MANAGER:
+            roles = [RoleTypeChoices.COMPANY_EMPLOYEE]
+        else:
+            roles = [RoleTypeChoices.COMPANY_EMPLOYEE, RoleTypeChoices.COMPANY_MANAGER]
+
+        error_data = {}
+        cleaned_rows = []
+        for index, row in enumerate(rows):
+            row = dict(row)
+            allergies = row.pop('allergies', None) or []
+            if isinstance(allergies, str):
+                allergies = allergies.split(';')
+            row['role'] = row.get('role') or RoleTypeChoices.COMPANY_EMPLOYEE
+            if row['role'] not in roles:
+                error_data[f"{index}.role"] = 'Selected role is not valid.'
+            form = UserImportForm(data=row)
+            if not form.is_valid():
+                for error in form.errors:
+                    error_data[f"{index}.{camel_case_format(error)}"] = form.errors[error][0]
+                continue
+            allergies = [str(allergy).strip() for allergy in allergies if str(allergy).strip()]
+            # the input index is kept so later errors point to the right row
+            cleaned_rows.append((index, {**form.cleaned_data, 'allergies': allergies}))
+
+        # uniqueness and allergies are checked with one query each instead of per row
+        emails = Counter(row['email'] for _, row in cleaned_rows)
+        usernames = Counter(row['username'] for _, row in cleaned_rows if row['username'])
+        existing_emails = set(User._base_manager.filter(email__in=emails).values_list('email', flat=True))
+        existing_usernames = set(
+            User._base_manager.filter(username__in=usernames).values_list('username', flat=True)
+        )
+        allergy_ids = {allergy for _, row in cleaned_rows for allergy in row['allergies'] if allergy.isdigit()}
+        ingredients = set(
+            str(ingredient) for ingredient in Ingredient.objects.filter(id__in=allergy_ids).values_list('id', flat=True)
+        )
+        for index, row in cleaned_rows:
+            if emails[row['email']] > 1 or row['email'] in existing_emails:
+                error_data[f"{index}.email"] = 'User with this Email already exists.'
+            if row['username'] and (usernames[row['username']] > 1 or row['username'] in existing_usernames):
+                error_data[f"{index}.username"] = 'User with this Username already exists.'
+            if any(allergy not in ingredients for allergy in row['allergies']):
+                error_data[f"{index}.allergies"] = 'Select a valid choice.'
+            row['allergies'] = [int(allergy) for allergy in row['allergies'] if allergy in ingredients]
+        if error_data:
+            raise_graphql_error_with_fields("Invalid input request.", error_data)
+
+        cleaned_rows = [row for _, row in cleaned_rows]
+        job = UserImportJob.objects.create(
+            company=user.company, created_by=user, rows=cleaned_rows, total=len(cleaned_rows)
+        )
+        import_company_users.delay(job.id)
+        return BulkUserImportMutation(
+            success=True, message="Import started.", job=job
+        )
+
+
 class AddressMutation(DjangoModelFormMutation):
     """
     """
@@ -1925,6 +2013,7 @@ class Mutation(graphene.ObjectType):
     company_status_change = ChangeCompanyStatus.Field()
     register_company_owner = CompanyOwnerRegistration.Field()
     create_company_staff = UserCreationMutation.Field()
+    import_company_staffs = BulkUserImportMutation.Field()
     address_mutation = AddressMutation.Field()
     address_delete = AddressDelete.Field()
     company_billing_address_mutation = CompanyBillingAddressMutation.Field()
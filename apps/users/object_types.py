@@ -34,6 +34,7 @@ from .models import (
     UnitOfHistory,
     UserCoupon,
     UserDeviceToken,
+    UserImportJob,
     Vendor,
     WithdrawRequest,
 )
@@ -41,6 +42,18 @@ from .models import (
 User = get_user_model()  # variable taken for User model
 
 
+class UserImportJobType(DjangoObjectType):
+    """
+        Define django object type for bulk staff import job with its progress
+    """
+    id = graphene.ID(required=True)
+
+    class Meta:
+        model = UserImportJob
+        exclude = ['rows']
+        convert_choices_to_enum = False
+
+
 class ClientDetailsType(DjangoObjectType):
     """
         Define django object type for Client-details model with filter-set and relay node information
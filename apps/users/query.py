@@ -5,7 +5,7 @@ from graphene_django.filter import DjangoFilterConnectionField
 
 # local imports
 from apps.bases.utils import raise_graphql_error
-from backend.permissions import is_admin_user, is_authenticated
+from backend.permissions import is_admin_user, is_authenticated, is_company_user
 
 from .choices import AgreementChoices, GenderChoices, RoleTypeChoices
 from .models import (
@@ -16,6 +16,7 @@ from .models import (
     Coupon,
     TrackUserLogin,
     UnitOfHistory,
+    UserImportJob,
     Vendor,
     WithdrawRequest,
 )
@@ -27,6 +28,7 @@ from .object_types import (
     CouponType,
     LogType,
     TrackUserLoginType,
+    UserImportJobType,
     UserType,
     VendorType,
     WithdrawRequestType,
@@ -61,6 +63,11 @@ class Query(graphene.ObjectType):
     withdraw_request = graphene.Field(WithdrawRequestType, type_of=graphene.String())
     all_gender_choices = graphene.JSONString()
     addresses = DjangoFilterConnectionField(AddressType)
+    user_import_job = graphene.Field(UserImportJobType, id=graphene.ID(required=True))
+
+    @is_company_user
+    def resolve_user_import_job(self, info, id, **kwargs):
+        return UserImportJob.objects.filter(id=id, company=info.context.user.company).last()
 
     @is_authenticated
     def resolve_me(self, info) -> object:
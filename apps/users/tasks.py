@@ -1,6 +1,15 @@
 
+from concurrent.futures import ThreadPoolExecutor
+
 from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import F
 
+from apps.bases.constant import HistoryActions
+from apps.bases.utils import create_password
+from apps.users.choices import ImportStatusChoices
 from backend.celery import app
 from backend.mail import (
     send_direct_mail_by_default_bcc,
@@ -58,3 +67,69 @@ def send_account_activation_mail(email, username):
     </html>
     """
     send_direct_mail_by_default_bcc(SUBJECT, body, email)
+
+
+@app.task
+def send_bulk_email_on_delay(mails):
+    """
+        write a batch of template mails to the outbox, every item is (template, context, subject, email)
+    """
+    for template, context, subject, email in mails:
+        send_mail_from_template(template, context, subject, email)
+
+
+def hash_passwords(passwords):
+    """
+        hashing dominates a bulk import, it is spread over threads as the hashers release the gil
+        (a prefork celery worker is a daemon process and can not start processes of its own)
+    """
+    with ThreadPoolExecutor(max_workers=settings.USER_IMPORT_HASH_WORKERS) as executor:
+        return list(executor.map(make_password, passwords))
+
+
+@app.task
+def import_company_users(job_id):
+    """
+        create the validated rows of an import job in batches and send all verification mails in one job
+    """
+    # imported here as the models module imports these tasks
+    from apps.users.models import UnitOfHistory, User, UserImportJob
+
+    job = UserImportJob.objects.select_related('company', 'created_by').get(id=job_id)
+    jobs = UserImportJob.objects.filter(id=job_id)
+    jobs.update(status=ImportStatusChoices.RUNNING)
+    content_type = ContentType.objects.get_for_model(User)
+    mails = []
+    try:
+        for start in range(job.processed, len(job.rows), settings.USER_IMPORT_BATCH_SIZE):
+            rows = job.rows[start:start + settings.USER_IMPORT_BATCH_SIZE]
+            passwords = [create_password() for _ in rows]
+            hashes = hash_passwords(passwords)
+            with transaction.atomic():
+                users = User.objects.bulk_create([
+                    User(
+                        **{key: value for key, value in row.items() if key != 'allergies'},
+                        company=job.company, password=password_hash, is_verified=True, is_email_verified=True
+                    ) for row, password_hash in zip(rows, hashes)
+                ])
+                User.allergies.through.objects.bulk_create([
+                    User.allergies.through(user_id=user.id, ingredient_id=ingredient_id)
+                    for user, row in zip(users, rows) for ingredient_id in row['allergies']
+                ])
+                UnitOfHistory.objects.bulk_create([
+                    UnitOfHistory(
+                        action=HistoryActions.USER_CREATE, user=job.created_by, perform_for=user,
+                        content_type=content_type, object_id=job.created_by_id
+                    ) for user in users
+                ])
+                jobs.update(processed=F('processed') + len(users))
+            mails.extend(
+                [*user.get_verified_mail(password), user.email] for user, password in zip(users, passwords)
+            )
+    except Exception as e:
+        jobs.update(status=ImportStatusChoices.FAILED, error=str(e))
+        raise
+    finally:
+        if mails:
+            send_bulk_email_on_delay.delay(mails)
+    jobs.update(status=ImportStatusChoices.COMPLETED, rows=[])
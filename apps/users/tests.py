@@ -1,3 +1,71 @@
-# from django.test import TestCase
+from multiprocessing import current_process
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import check_password
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from apps.scm.models import Ingredient
+
+from .choices import RoleTypeChoices
+from .models import AccessToken, Company, User, UserImportJob
+from .tasks import hash_passwords
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class HashPasswordsTest(SimpleTestCase):
+
+    def test_hashing_in_daemon_process(self):
+        # prefork celery workers are daemon processes, which are not allowed to start child processes
+        with mock.patch.dict(current_process()._config, daemon=True):
+            hashes = hash_passwords(["first", "second"])
+        self.assertTrue(check_password("first", hashes[0]))
+        self.assertTrue(check_password("second", hashes[1]))
+
+
+class BulkUserImportTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        company = Company.objects.create(name="Import", working_email="import@example.com")
+        owner = User.objects.create_user(
+            email="owner@import.com", password="x", company=company, role=RoleTypeChoices.COMPANY_OWNER
+        )
+        AccessToken.objects.create(user=owner, token="import-token")
+        cls.ingredient = Ingredient.objects.create(name="Nuts")
+
+    def run_import(self, rows):
+        rows = [{"username": f"staff{i}", "phone": f"+4790000{i:03}", **row} for i, row in enumerate(rows)]
+        response = self.client.post(
+            "/graphql/", {
+                "query": "mutation($rows: GenericScalar) { importCompanyStaffs(rows: $rows) { success job { id } } }",
+                "variables": {"rows": rows},
+            }, content_type="application/json", HTTP_AUTHORIZATION="JWT import-token"
+        )
+        return response.json()
+
+    def get_errors(self, rows):
+        content = self.run_import(rows)
+        self.assertIn("errors", content)
+        return content["errors"][0]["extensions"]["errors"]
+
+    def test_errors_point_to_input_rows(self):
+        errors = self.get_errors([
+            {"email": "not-an-email"},
+            {"email": "owner@import.com"},
+            {"email": "twice@import.com"},
+            {"email": "twice@import.com"},
+            {"email": "allergic@import.com", "allergies": f"{self.ingredient.id};999999"},
+            {"email": "fine@import.com", "allergies": [self.ingredient.id]},
+        ])
+        self.assertEqual(set(errors), {"0.email", "1.email", "2.email", "3.email", "4.allergies"})
+        self.assertEqual(errors["1.email"], "User with this Email already exists.")
+        self.assertEqual(errors["4.allergies"], "Select a valid choice.")
+
+    def test_import_is_queued(self):
+        with mock.patch("apps.users.mutation.import_company_users.delay") as delay:
+            content = self.run_import([{"email": "new@import.com", "allergies": str(self.ingredient.id)}])
+        self.assertNotIn("errors", content)
+        job = UserImportJob.objects.get()
+        delay.assert_called_once_with(job.id)
+        self.assertEqual(job.rows[0]["email"], "new@import.com")
+        self.assertEqual(job.rows[0]["allergies"], [self.ingredient.id])
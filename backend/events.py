@@ -0,0 +1,163 @@
+# third party imports
+import asyncio
+import json
+import secrets
+from logging import getLogger
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+ADMINS_CHANNEL = "admins"
+# sent to the streams after the subscription was lost, clients refetch as events may be missed
+RESYNC_EVENT = json.dumps({"event": "resync", "data": {}})
+
+
+def get_channel(name):
+    return f"events:{name}"
+
+
+def get_user_channel(user_id):
+    return f"user:{user_id}"
+
+
+def get_company_channel(company_id):
+    return f"company:{company_id}"
+
+
+_redis = None
+
+
+def get_redis():
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(settings.EVENTS_REDIS_URL)
+    return _redis
+
+
+def publish_event(channels, event, data=None):
+    """
+        publish an event to the connected streams of the channels once the current transaction is committed
+    """
+    channels = list(channels)
+    if not channels:
+        return
+    payload = json.dumps({"event": event, "data": data or {}}, default=str)
+
+    def publish():
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for channel in channels:
+                pipe.publish(get_channel(channel), payload)
+            pipe.execute()
+        except redis.RedisError as e:
+            getLogger().error(f"Publishing event failed: {e}")
+
+    transaction.on_commit(publish)
+
+
+def create_stream_ticket(channels):
+    """
+        short lived, single use ticket to open a stream of the channels, so no access token ends up in an url
+    """
+    ticket = secrets.token_urlsafe(32)
+    cache.set(f"event-ticket:{ticket}", list(channels), settings.EVENTS_TICKET_TTL)
+    return ticket
+
+
+def redeem_stream_ticket(ticket):
+    """
+        channels of a ticket, none when it is unknown, expired or already used
+    """
+    key = f"event-ticket:{ticket}"
+    channels = cache.get(key)
+    # only the caller which deletes the ticket may use it
+    if channels is None or not cache.delete(key):
+        return None
+    return channels
+
+
+class EventHub:
+    """
+        one redis subscription per process, fanning the events out to the streams connected to the process.
+        the subscription runs while streams are connected and is reconnected when it breaks.
+    """
+
+    def __init__(self):
+        self.queues = {}
+        self.task = None
+
+    def subscribe(self, channels):
+        queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+        for channel in channels:
+            self.queues.setdefault(get_channel(channel), set()).add(queue)
+        loop = asyncio.get_running_loop()
+        if self.task is None or self.task.done() or self.task.get_loop() is not loop:
+            self.task = loop.create_task(self.listen())
+        return queue
+
+    def unsubscribe(self, channels, queue):
+        for channel in channels:
+            queues = self.queues.get(get_channel(channel), set())
+            queues.discard(queue)
+            if not queues:
+                self.queues.pop(get_channel(channel), None)
+        if not self.queues and self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def dispatch(self, channel, data):
+        for queue in list(self.queues.get(channel, ())):
+            self.put(queue, data)
+
+    def broadcast(self, data):
+        for queue in set().union(*self.queues.values()):
+            self.put(queue, data)
+
+    def put(self, queue, data):
+        try:
+            queue.put_nowait(data)
+        except asyncio.QueueFull:
+            # a stalled stream loses events, clients refetch on the next one
+            pass
+
+    async def listen(self):
+        failures = 0
+        while True:
+            client = aioredis.Redis.from_url(settings.EVENTS_REDIS_URL)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.psubscribe(get_channel("*"))
+                    if failures:
+                        self.broadcast(RESYNC_EVENT)
+                        failures = 0
+                    await self.forward(pubsub)
+            except Exception as e:
+                getLogger().error(f"Event subscription failed: {e}")
+                failures += 1
+                await asyncio.sleep(min(2 ** (failures - 1), settings.EVENTS_RECONNECT_MAX_DELAY))
+            finally:
+                await client.aclose()
+
+    async def forward(self, pubsub):
+        """
+            dispatch the messages of the subscription. an idle connection is pinged,
+            one which stays silent is considered broken (a half open connection never fails a read).
+        """
+        loop = asyncio.get_running_loop()
+        last_seen = loop.time()
+        while True:
+            message = await pubsub.get_message(timeout=settings.EVENTS_HEARTBEAT)
+            if message is not None:
+                last_seen = loop.time()
+                if message["type"] == "pmessage":
+                    self.dispatch(message["channel"].decode(), message["data"].decode())
+            elif loop.time() - last_seen > 2 * settings.EVENTS_HEARTBEAT:
+                raise ConnectionError("Event subscription timed out.")
+            else:
+                await pubsub.ping()
+
+
+hub = EventHub()
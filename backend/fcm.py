@@ -1,23 +1,90 @@
-
 # third party imports
-import firebase_admin
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+
+import requests
 from django.conf import settings
-from firebase_admin import credentials
-from pyfcm import FCMNotification as PYFCMNotification
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# errors of tokens which will never be delivered again
+UNREGISTERED_ERRORS = {"NotRegistered", "InvalidRegistration"}
+
+
+class FCMSender:
+    """
+        long lived fcm client of a worker process.
+        sends multicast batches over one pooled http session with a bounded number of concurrent requests.
+    """
+
+    def __init__(self, url, key, batch_size=500, concurrency=10, timeout=10):
+        self.url = url
+        self.batch_size = batch_size
+        self.timeout = timeout
+        retries = Retry(total=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504],
+                        allowed_methods=frozenset(['POST']))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency, max_retries=retries)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({"Content-Type": "application/json", "Authorization": f"key={key}"})
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="fcm")
 
-cred = credentials.Certificate(settings.FIREBASE_CONFIG_PATH)
-firebase_admin.initialize_app(cred)
+    def send_batch(self, payload, tokens):
+        """
+            send one multicast request, returns the tokens reported as unregistered
+        """
+        response = self.session.post(self.url, json={**payload, "registration_ids": tokens}, timeout=self.timeout)
+        response.raise_for_status()
+        results = response.json().get("results", [])
+        return [token for token, result in zip(tokens, results) if result.get("error") in UNREGISTERED_ERRORS]
+
+    def send(self, payload, tokens):
+        """
+            send the payload to all tokens in batches, returns the tokens reported as unregistered
+        """
+        futures = [
+            self.executor.submit(self.send_batch, payload, tokens[i: i + self.batch_size])
+            for i in range(0, len(tokens), self.batch_size)
+        ]
+        unregistered = []
+        for future in futures:
+            try:
+                unregistered += future.result()
+            except (requests.RequestException, ValueError) as e:
+                getLogger().error(f"FCM batch failed: {e}")
+        return unregistered
+
+
+_sender = None
+_sender_pid = None
+_sender_lock = threading.Lock()
+
+
+def get_fcm_sender():
+    """
+        sender of the current process, created again in forked worker processes
+    """
+    global _sender, _sender_pid
+    with _sender_lock:
+        if _sender is None or _sender_pid != os.getpid():
+            _sender = FCMSender(
+                settings.FCM_URL, settings.FCM_KEY, settings.FCM_BATCH_SIZE, settings.FCM_CONCURRENCY,
+                settings.FCM_TIMEOUT
+            )
+            _sender_pid = os.getpid()
+        return _sender
 
 
 class ExFCMNotification:
 
     def __init__(self, title, message, token, notification_type="", image=""):
-        self.push_service = PYFCMNotification(api_key=settings.FCM_KEY)
         self.title = title
         self.message = message
         self.token = token
         self.notification_type = notification_type
-        self.fcm_key = settings.FCM_KEY
         self.image = image
 
     def get_payload(self):
@@ -39,21 +106,16 @@ class ExFCMNotification:
             "lights": True,
             "icon": "ic_notif",
         }
-        return data
+        return {
+            "notification": {"title": self.title, "body": self.message, "sound": "default"},
+            "data": data,
+        }
 
     def send_notification(self):
-        data = self.get_payload()
-        result = self.push_service.notify_single_device(registration_id=self.token, message_title=self.title,
-                                                        message_body=self.message, data_message=data, sound='default')
-        if not result.get('success'):
-            print("Error", result)
+        return self.send_bulk_notification([self.token])
 
     def send_bulk_notification(self, tokens):
-        tokens = self.push_service.clean_registration_ids(tokens)
-        if tokens:
-            data = self.get_payload()
-            result = self.push_service.notify_multiple_devices(registration_ids=tokens, message_title=self.title,
-                                                               message_body=self.message, data_message=data,
-                                                               sound='default')
-            if not result.get('success'):
-                print("Error", result)
+        """
+            returns the tokens reported as unregistered
+        """
+        return get_fcm_sender().send(self.get_payload(), tokens)
@@ -1,22 +1,32 @@
+import base64
+import datetime
+import hashlib
+import json
+import re
+import time
+from logging import getLogger
 
 from django.conf import settings
-from django.core.mail import EmailMessage
-from django.forms.fields import EmailField
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
 from django.template.loader import get_template
+from django.utils import timezone
 
 SENDER = settings.DEFAULT_FROM_EMAIL
 CHARSET = "UTF-8"
+EMAIL_REGEX = re.compile(
+    r"^[\w.!#$%&'*+/=?^`{|}~-]+@[A-Za-z0-9](?:[A-Za-z0-9-]*[A-Za-z0-9])?(?:\.[A-Za-z0-9](?:[A-Za-z0-9-]*[A-Za-z0-9])?)+$"
+)
 
 
 def get_cleaned_emails(emails):
     cleaned_emails = []
-    e = EmailField()
     for email in emails:
-        try:
-            e.clean(email)
+        if email and EMAIL_REGEX.match(email):
             cleaned_emails.append(email)
-        except Exception as ex:
-            print("Invalid Email", ex, email)
+        else:
+            getLogger().warning(f"Invalid Email {email}")
     return cleaned_emails
 
 
@@ -25,40 +35,137 @@ def divide_chunks(recipient, n):
         yield recipient[i: i + n]
 
 
-def send_mail(
+def kick_outbox():
+    """
+        start an outbox worker, at most once per MAIL_OUTBOX_KICK_DEBOUNCE as a running worker drains new mails too
+    """
+    from apps.notifications.tasks import send_outbox_mails
+
+    if cache.add("mail-outbox:kick", 1, settings.MAIL_OUTBOX_KICK_DEBOUNCE):
+        send_outbox_mails.delay()
+
+
+def queue_mail(
     subject,
     body,
     recipient,
     attachments=[],
     attachments_files={},
-    bcc=False
+    bcc=False,
+    default_bcc=False
 ) -> None:
-    recipient = recipient if type(recipient) == list else [recipient]
-    recipient = get_cleaned_emails(recipient)
-    print("got recipient")
-    for chunk in divide_chunks(recipient, 50):
-        print("sending mail to chunk", chunk, bcc)
-        to_args = {}
-        if bcc:
-            to_args["bcc"] = chunk
-        else:
-            to_args["to"] = chunk
-        msg = EmailMessage(
-            subject, body, from_email=SENDER, **to_args
-        )
-
-        for attachment in attachments:
-            msg.attach_file(attachment, mimetype="application/octet-stream")
+    """
+        write the mail to the outbox, one row per recipient domain and 50 recipients.
+        a mail equal to a still pending one is dropped.
+    """
+    from apps.notifications.models import MailOutbox
 
-        for name, attachment in attachments_files.items():
-            msg.attach(name, attachment, mimetype="application/octet-stream")
-
-        msg.content_subtype = "html"
+    recipient = recipient if type(recipient) == list else [recipient]
+    domains = {}
+    for email in get_cleaned_emails(recipient):
+        domains.setdefault(email.rsplit("@", 1)[1].lower(), []).append(email)
+    files = {
+        name: base64.b64encode(content.encode() if isinstance(content, str) else content).decode()
+        for name, content in attachments_files.items()
+    }
+    mails = []
+    for domain, emails in domains.items():
+        for chunk in divide_chunks(emails, 50):
+            content = json.dumps([subject, body, chunk, bcc, default_bcc, list(attachments), files])
+            mails.append(MailOutbox(
+                subject=subject, body=body, domain=domain, recipients=chunk, bcc=bcc, default_bcc=default_bcc,
+                attachments=list(attachments), attachment_files=files,
+                dedupe_key=hashlib.sha256(content.encode()).hexdigest()
+            ))
+    if mails:
+        MailOutbox.objects.bulk_create(mails, ignore_conflicts=True)
+        transaction.on_commit(kick_outbox)
+
+
+def get_outbox_message(mail):
+    to_args = {}
+    if mail.bcc:
+        to_args["bcc"] = mail.recipients
+    else:
+        to_args["to"] = mail.recipients
+    if mail.default_bcc and settings.DEFAULT_BCC_EMAIL:
+        to_args["bcc"] = [settings.DEFAULT_BCC_EMAIL]
+    msg = EmailMessage(
+        mail.subject, mail.body, from_email=SENDER, **to_args
+    )
+
+    for attachment in mail.attachments:
+        msg.attach_file(attachment, mimetype="application/octet-stream")
+
+    for name, attachment in mail.attachment_files.items():
+        msg.attach(name, base64.b64decode(attachment), mimetype="application/octet-stream")
+
+    msg.content_subtype = "html"
+    return msg
+
+
+def is_domain_throttled(domain):
+    """
+        count a mail to the domain in the current minute, true when it is over MAIL_DOMAIN_RATE_LIMIT
+    """
+    key = f"mail-domain:{domain}:{int(time.time() // 60)}"
+    cache.add(key, 0, 120)
+    try:
+        return cache.incr(key) > settings.MAIL_DOMAIN_RATE_LIMIT
+    except ValueError:
+        return False
+
+
+def deliver_outbox_mails(mails):
+    """
+        send claimed outbox mails over one smtp session and set their new state (not saved).
+        mails of throttled domains are postponed to the next minute, failed ones retried with backoff.
+    """
+    from apps.notifications.choices import MailStatusChoices
+
+    connection = get_connection()
+    for mail in mails:
+        now = timezone.now()
+        if is_domain_throttled(mail.domain):
+            mail.next_attempt_on = now.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+            continue
         try:
-            msg.send()
-            print("Successful")
+            connection.open()
+            connection.send_messages([get_outbox_message(mail)])
+            mail.status = MailStatusChoices.SENT
+            mail.sent_on = timezone.now()
+            mail.last_error = ""
         except Exception as e:
-            print(e, flush=True)
+            getLogger().error(f"Sending mail {mail.id} failed: {e}")
+            mail.attempts += 1
+            mail.last_error = str(e)
+            if mail.attempts >= settings.MAIL_OUTBOX_MAX_ATTEMPTS:
+                mail.status = MailStatusChoices.FAILED
+            else:
+                mail.next_attempt_on = now + datetime.timedelta(
+                    seconds=settings.MAIL_OUTBOX_RETRY_BACKOFF * 2 ** (mail.attempts - 1)
+                )
+            # a broken session is opened again for the next mail
+            close_connection(connection)
+    close_connection(connection)
+
+
+def close_connection(connection):
+    try:
+        connection.close()
+    except Exception:
+        connection.connection = None
+
+
+def send_mail(
+    subject,
+    body,
+    recipient,
+    attachments=[],
+    attachments_files={},
+    bcc=False
+) -> None:
+    queue_mail(subject, body, recipient, attachments, attachments_files, bcc=bcc)
 
 
 def send_direct_mail_by_default_bcc(
@@ -68,29 +175,7 @@ def send_direct_mail_by_default_bcc(
     attachments=[],
     attachments_files={}
 ) -> None:
-    recipient = recipient if type(recipient) == list else [recipient]
-    recipient = get_cleaned_emails(recipient)
-    print("got recipient")
-    for chunk in divide_chunks(recipient, 50):
-        print("sending mail to chunk by default bcc", chunk)
-        to_args = {"to": chunk}
-        if settings.DEFAULT_BCC_EMAIL:
-            to_args["bcc"] = [settings.DEFAULT_BCC_EMAIL]
-        msg = EmailMessage(
-            subject, body, from_email=SENDER, **to_args
-        )
-        for attachment in attachments:
-            msg.attach_file(attachment, mimetype="application/octet-stream")
-
-        for name, attachment in attachments_files.items():
-            msg.attach(name, attachment, mimetype="application/octet-stream")
-
-        msg.content_subtype = "html"
-        try:
-            msg.send()
-            print("Successful")
-        except Exception as e:
-            print(e, flush=True)
+    queue_mail(subject, body, recipient, attachments, attachments_files, default_bcc=True)
 
 
 def send_mail_from_template(
@@ -101,8 +186,5 @@ def send_mail_from_template(
     attachments=[],
     bcc=False
 ) -> None:
-    template = get_template(template)
-    context = context_data
-    body = template.render(context)
-    print("got template")
+    body = get_template(template).render(context_data)
     send_mail(subject, body, recipient_list, attachments, bcc=bcc)
@@ -51,6 +51,7 @@ INSTALLED_APPS = [
     'apps.scm',
     'apps.notifications',
     'apps.sales',
+    'apps.analytics',
 ]
 
 MIDDLEWARE = [
@@ -100,6 +101,13 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', 'django.core.cache.backends.redis.RedisCache'),
+        'LOCATION': config('CACHE_URL', 'redis://localhost:6379/1'),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -207,6 +215,59 @@ VIPPS_CLIENT_ID = config("VIPPS_CLIENT_ID", "")
 VIPPS_CLIENT_SECRET = config("VIPPS_CLIENT_SECRET", "")
 VIPPS_SUBSCRIPTION_KEY = config("VIPPS_SUBSCRIPTION_KEY", "")
 VIPPS_MERCHANT_SERIAL_NUMBER = config("VIPPS_MERCHANT_SERIAL_NUMBER", "")
+VIPPS_REQUEST_TIMEOUT = config("VIPPS_REQUEST_TIMEOUT", default=10, cast=int)  # seconds
+
+# online payment reconciliation
+PAYMENT_RECONCILE_INTERVAL = config("PAYMENT_RECONCILE_INTERVAL", default=60, cast=int)  # seconds
+PAYMENT_RECONCILE_BATCH_SIZE = config("PAYMENT_RECONCILE_BATCH_SIZE", default=200, cast=int)
+PAYMENT_RECONCILE_CONCURRENCY = config("PAYMENT_RECONCILE_CONCURRENCY", default=8, cast=int)
+PAYMENT_RECONCILE_HORIZON_HOURS = config("PAYMENT_RECONCILE_HORIZON_HOURS", default=24, cast=int)
+PAYMENT_STATUS_REFRESH_SECONDS = config("PAYMENT_STATUS_REFRESH_SECONDS", default=15, cast=int)
+
+# archival of delivered and fully paid orders
+ORDER_ARCHIVE_AFTER_DAYS = config("ORDER_ARCHIVE_AFTER_DAYS", default=180, cast=int)
+ORDER_ARCHIVE_BATCH_SIZE = config("ORDER_ARCHIVE_BATCH_SIZE", default=500, cast=int)
+ORDER_ARCHIVE_INTERVAL = config("ORDER_ARCHIVE_INTERVAL", default=24 * 60 * 60, cast=int)  # seconds
+
+# bulk staff import
+USER_IMPORT_MAX_ROWS = config("USER_IMPORT_MAX_ROWS", default=5000, cast=int)
+USER_IMPORT_BATCH_SIZE = config("USER_IMPORT_BATCH_SIZE", default=200, cast=int)
+USER_IMPORT_HASH_WORKERS = config("USER_IMPORT_HASH_WORKERS", default=4, cast=int)
+
+# csv exports
+EXPORT_CHUNK_SIZE = config("EXPORT_CHUNK_SIZE", default=2000, cast=int)  # rows fetched per cursor round trip
+EXPORT_ROOT = config("EXPORT_ROOT", default=join(os.path.dirname(BASE_DIR), 'exports'))  # not served publicly
+EXPORT_MAX_AGE = config("EXPORT_MAX_AGE", default=24 * 60 * 60, cast=int)  # seconds a download link is valid
+EXPORT_CLEANUP_INTERVAL = config("EXPORT_CLEANUP_INTERVAL", default=60 * 60, cast=int)  # seconds
+
+# events
+EVENTS_REDIS_URL = config("EVENTS_REDIS_URL", "redis://localhost:6379/2")
+EVENTS_HEARTBEAT = config("EVENTS_HEARTBEAT", default=25, cast=int)  # seconds between keep-alive comments
+EVENTS_RETRY = config("EVENTS_RETRY", default=5, cast=int)  # seconds clients wait before reconnecting
+EVENTS_QUEUE_SIZE = config("EVENTS_QUEUE_SIZE", default=100, cast=int)  # buffered events per stream
+EVENTS_TICKET_TTL = config("EVENTS_TICKET_TTL", default=30, cast=int)  # seconds a stream ticket is valid
+EVENTS_RECONNECT_MAX_DELAY = config("EVENTS_RECONNECT_MAX_DELAY", default=30, cast=int)  # seconds
+
+# dashboards
+DASHBOARD_CACHE_TTL = config("DASHBOARD_CACHE_TTL", default=60, cast=int)  # seconds
+DASHBOARD_TOP_PRODUCTS = config("DASHBOARD_TOP_PRODUCTS", default=5, cast=int)
+SALES_HISTORY_MAX_BUCKETS = config("SALES_HISTORY_MAX_BUCKETS", default=400, cast=int)
+VENDOR_DASHBOARD_CACHE_TTL = config("VENDOR_DASHBOARD_CACHE_TTL", default=24 * 60 * 60, cast=int)  # seconds
+CACHE_LOCK_TIMEOUT = config("CACHE_LOCK_TIMEOUT", default=30, cast=int)  # seconds a refresh may hold its lock
+
+# notifications
+NOTIFICATION_SEEN_DEBOUNCE = config("NOTIFICATION_SEEN_DEBOUNCE", default=30, cast=int)  # seconds
+NOTIFICATION_SCHEDULE_INTERVAL = config("NOTIFICATION_SCHEDULE_INTERVAL", default=60, cast=int)  # seconds
+NOTIFICATION_SCHEDULE_BATCH_SIZE = config("NOTIFICATION_SCHEDULE_BATCH_SIZE", default=100, cast=int)
+# older due notifications are only marked sent, a late push about a past event is noise
+NOTIFICATION_MAX_LATENESS = config("NOTIFICATION_MAX_LATENESS", default=60 * 60, cast=int)  # seconds
+NOTIFICATION_DIGEST_WINDOW = config("NOTIFICATION_DIGEST_WINDOW", default=60, cast=int)  # seconds
+NOTIFICATION_DIGEST_INTERVAL = config("NOTIFICATION_DIGEST_INTERVAL", default=30, cast=int)  # seconds
+NOTIFICATION_DIGEST_BATCH_SIZE = config("NOTIFICATION_DIGEST_BATCH_SIZE", default=200, cast=int)  # users
+NOTIFICATION_DELIVERY_CHUNK_SIZE = config("NOTIFICATION_DELIVERY_CHUNK_SIZE", default=500, cast=int)  # users
+NOTIFICATION_COUNTER_RECONCILE_INTERVAL = config(
+    "NOTIFICATION_COUNTER_RECONCILE_INTERVAL", default=60 * 60, cast=int
+)  # seconds
 
 # Email config
 EMAIL_HOST = config('EMAIL_HOST', 'smtp.gmail.com')
@@ -218,11 +279,24 @@ EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', cast=int, default=60)
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 SERVER_EMAIL = config('SERVER_EMAIL', EMAIL_HOST_USER)
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', 'Lunsjavtale <lunsjavtale@gmail.com>')
+MAIL_OUTBOX_QUEUE = config('MAIL_OUTBOX_QUEUE', 'celery')  # set to a dedicated queue to keep mail bursts apart
+MAIL_OUTBOX_INTERVAL = config('MAIL_OUTBOX_INTERVAL', default=30, cast=int)  # seconds
+MAIL_OUTBOX_KICK_DEBOUNCE = config('MAIL_OUTBOX_KICK_DEBOUNCE', default=5, cast=int)  # seconds
+MAIL_OUTBOX_BATCH_SIZE = config('MAIL_OUTBOX_BATCH_SIZE', default=50, cast=int)
+MAIL_OUTBOX_MAX_ATTEMPTS = config('MAIL_OUTBOX_MAX_ATTEMPTS', default=6, cast=int)
+MAIL_OUTBOX_RETRY_BACKOFF = config('MAIL_OUTBOX_RETRY_BACKOFF', default=60, cast=int)  # seconds, doubled per attempt
+MAIL_OUTBOX_LEASE = config('MAIL_OUTBOX_LEASE', default=15 * 60, cast=int)  # seconds a claimed batch may take
+MAIL_OUTBOX_RETENTION = config('MAIL_OUTBOX_RETENTION', default=14, cast=int)  # days sent and failed mails are kept
+MAIL_OUTBOX_CLEANUP_INTERVAL = config('MAIL_OUTBOX_CLEANUP_INTERVAL', default=24 * 60 * 60, cast=int)  # seconds
+MAIL_DOMAIN_RATE_LIMIT = config('MAIL_DOMAIN_RATE_LIMIT', default=100, cast=int)  # mails per domain and minute
 
 # firebase config
 FIREBASE_CONFIG_PATH = config("FIREBASE_CONFIG_PATH", "firebase-admin.json")
-FCM_URL = "https://fcm.googleapis.com/fcm/send"
+FCM_URL = config("FCM_URL", "https://fcm.googleapis.com/fcm/send")  # point to the fake_fcm_server for benchmarks
 FCM_KEY = config("FCM_KEY", "")
+FCM_BATCH_SIZE = config("FCM_BATCH_SIZE", default=500, cast=int)  # tokens per multicast request
+FCM_CONCURRENCY = config("FCM_CONCURRENCY", default=10, cast=int)  # concurrent requests per worker process
+FCM_TIMEOUT = config("FCM_TIMEOUT", default=10, cast=int)  # seconds
 
 # CELERY STUFF
 # Celery Config
@@ -234,6 +308,43 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
+CELERY_ROUTES = {
+    'apps.notifications.tasks.send_outbox_mails': {'queue': MAIL_OUTBOX_QUEUE},
+}
+CELERYBEAT_SCHEDULE = {
+    'reconcile-online-payments': {
+        'task': 'apps.sales.tasks.reconcile_online_payments',
+        'schedule': PAYMENT_RECONCILE_INTERVAL,
+    },
+    'archive-orders': {
+        'task': 'apps.sales.tasks.archive_orders',
+        'schedule': ORDER_ARCHIVE_INTERVAL,
+    },
+    'send-scheduled-notifications': {
+        'task': 'apps.notifications.tasks.send_scheduled_notifications',
+        'schedule': NOTIFICATION_SCHEDULE_INTERVAL,
+    },
+    'send-notification-digests': {
+        'task': 'apps.notifications.tasks.send_notification_digests',
+        'schedule': NOTIFICATION_DIGEST_INTERVAL,
+    },
+    'send-outbox-mails': {
+        'task': 'apps.notifications.tasks.send_outbox_mails',
+        'schedule': MAIL_OUTBOX_INTERVAL,
+    },
+    'delete-expired-exports': {
+        'task': 'apps.sales.tasks.delete_expired_exports',
+        'schedule': EXPORT_CLEANUP_INTERVAL,
+    },
+    'delete-old-outbox-mails': {
+        'task': 'apps.notifications.tasks.delete_old_outbox_mails',
+        'schedule': MAIL_OUTBOX_CLEANUP_INTERVAL,
+    },
+    'reconcile-unread-notification-counts': {
+        'task': 'apps.notifications.tasks.reconcile_unread_notification_counts',
+        'schedule': NOTIFICATION_COUNTER_RECONCILE_INTERVAL,
+    },
+}
 
 # LOGGING = {
 #     'version': 1,
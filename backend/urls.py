@@ -19,7 +19,14 @@ from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
 from graphene_django.views import GraphQLView
 
+from apps.notifications.views import events
+from apps.sales.views import download_export, export_csv, production_manifest_export
+
 urlpatterns = [
     path('dadmin/', admin.site.urls),
     path('graphql/', csrf_exempt(GraphQLView.as_view(graphiql=True)), name='graphql'),
+    path('manifest/<str:date>/csv/', production_manifest_export, name='production-manifest-export'),
+    path('export/<str:name>/csv/', export_csv, name='export-csv'),
+    path('export/download/<str:token>/', download_export, name='export-download'),
+    path('events/', events, name='events'),
 ]